@@ -1,10 +1,39 @@
+import startup
+# Time the heavy imports once per process, the imports below then come from sys.modules
+for module_name in ('streamlit', 'ee', 'folium', 'streamlit_folium', 'pandas', 'numpy'):
+    startup.timed_import(module_name)
+
 import streamlit as st
 import ee
-import geemap
 import folium
 from streamlit_folium import folium_static
 from datetime import datetime, timedelta
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+import logging
+import pandas as pd
+import ee_session
+from map_cache import map_id_cache
+from result_cache import shared_results
+from geometry import map_view, METERS_PER_DEGREE
+from classification import class_area_statistics, transition_statistics, transition_matrix, NDVI_CLASSES
+from pipeline import date_input_proc, load_aoi, staged_ndvi_products, staged_change_products, files_fingerprint, composite_expression_report
+from timeseries import ndvi_time_series, SERIES_COLUMNS
+from stages import StageGraph
+from partition import PARTITION_AREA_THRESHOLD, partitioned_class_area_statistics, partitioned_transition_statistics
+import tile_proxy
+import threading
+import export
+import os
+import tempfile
+import tracing
+
+# Stage reuse and the startup report are logged at INFO level
+logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+logging.getLogger('stages').setLevel(logging.INFO)
+logging.getLogger('startup').setLevel(logging.INFO)
+
+# Every Earth Engine round trip is timed and counted per rerun (tracing.py)
+tracing.instrument_ee(ee)
 
 st.set_page_config(
     page_title="NDVI Viewer",
@@ -25,97 +54,200 @@ st.markdown(
 </style>
 """, unsafe_allow_html=True)
 
+# Earth Engine project used by the app
+EE_PROJECT = 'ee-marceloclaro'
+
 # Função de autenticação e inicialização do Earth Engine
 def ee_authenticate():
-    try:
-        # Tentar autenticar e inicializar o Earth Engine
-        ee.Initialize(project='ee-marceloclaro')
-    except ee.EEException:
-        # Se falhar, usar geemap para autenticação e inicialização
-        geemap.ee_initialize()
+    # Inicializado uma vez por processo e compartilhado entre as sessões (geemap só é importado se falhar)
+    ee_session.initialize(EE_PROJECT)
+    # Verificação de saúde periódica, a sessão é reinicializada se falhar
+    if not ee_session.health_check():
+        ee_session.initialize(EE_PROJECT)
+    startup.log_report()
 
 # Earth Engine drawing method setup
-def add_ee_layer(self, ee_image_object, vis_params, name):
-    map_id_dict = ee.Image(ee_image_object).getMapId(vis_params)
-    layer = folium.raster_layers.TileLayer(
-        tiles=map_id_dict['tile_fetcher'].url_format,
+# Tile URL of a layer: Earth Engine directly, or the local caching tile proxy when NDVI_TILE_PROXY is set
+def ee_tile_url(map_id):
+    proxy = tile_proxy.proxy_from_environment()
+    if proxy is None:
+        return map_id['url_format']
+    proxy.register(tile_proxy.layer_key(map_id), map_id['url_format'])
+    return proxy.url_template(tile_proxy.layer_key(map_id))
+
+def ee_tile_layer(map_id, name):
+    return folium.raster_layers.TileLayer(
+        tiles=ee_tile_url(map_id),
         attr='Map Data &copy; <a href="https://earthengine.google.com/">Google Earth Engine</a>',
         name=name,
         overlay=True,
         control=True
     )
+
+def add_ee_layer(self, ee_image_object, vis_params, name):
+    # Unchanged layers are served from the map ID cache instead of a new getMapId round trip
+    map_id = map_id_cache.get_map_id(ee.Image(ee_image_object), vis_params)
+    layer = ee_tile_layer(map_id, name)
     layer.add_to(self)
     return layer
 
 # Configuring Earth Engine display rendering method in Folium
 folium.Map.add_ee_layer = add_ee_layer
 
-# Defining a function to create and filter a GEE image collection for results
-def satCollection(cloudRate, initialDate, updatedDate, aoi):
-    collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
-        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloudRate)) \
-        .filterDate(initialDate, updatedDate) \
-        .filterBounds(aoi)
-    
-    # Defining a function to clip the collection to the area of interest
-    def clipCollection(image):
-        return image.clip(aoi).divide(10000)
-    # clipping the collection
-    collection = collection.map(clipCollection)
-    return collection
+# NDVI change layer stretch: -range (loss) to +range (gain)
+DELTA_NDVI_RANGE = 0.5
+
+# Maximum number of getMapId requests in flight at once
+LAYER_WORKERS = 6
+# Seconds to wait for all layers before giving up on the slow ones
+LAYER_TIMEOUT = 60
+# Raster exports and their resumable chunk downloads are kept here between reruns
+EXPORT_DIR = os.environ.get('NDVI_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'ndvi_exports'))
+# Tile pre-warming above this many tiles (all layers) asks for a confirmation
+PREWARM_CONFIRM_TILES = 2000
+# Largest raster export offered, the finished file is read into memory for the download button
+EXPORT_MAX_BYTES = int(os.environ.get('NDVI_EXPORT_MAX_MB', 512)) * 1024 * 1024
+
+# Resolve many Earth Engine layers at once and add each one to the map as soon as it is ready
+def add_ee_layers(self, layers, on_layer_added=None, max_workers=LAYER_WORKERS, timeout=LAYER_TIMEOUT, resolve_map_id=None):
+    # layers: list of (ee_image_object, vis_params, name) in the order they should appear on the map
+    # resolve_map_id(ee_image_object, vis_params, name) replaces the default map ID cache lookup
+    # returns a list of (name, error) for every layer that failed or timed out
+    failures = []
+    if not layers:
+        return failures
+
+    resolved = {}
+    next_index = 0
+
+    # Add every contiguous resolved layer so the layer control keeps the declared order
+    def flush(skip_missing=False):
+        nonlocal next_index
+        added = False
+        while next_index < len(layers) and (next_index in resolved or skip_missing):
+            map_id = resolved.get(next_index)
+            if map_id is not None:
+                ee_tile_layer(map_id, layers[next_index][2]).add_to(self)
+                added = True
+            next_index += 1
+        if added and on_layer_added is not None:
+            on_layer_added(self)
+
+    if resolve_map_id is None:
+        resolve_map_id = lambda image, vis_params, name: map_id_cache.get_map_id(ee.Image(image), vis_params)
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(layers)))
+    futures = {
+        executor.submit(tracing.bind(resolve_map_id), image, vis_params, name): index
+        for index, (image, vis_params, name) in enumerate(layers)
+    }
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            index = futures[future]
+            try:
+                resolved[index] = future.result()
+            except Exception as error:
+                resolved[index] = None
+                failures.append((layers[index][2], error))
+            flush()
+    except FutureTimeoutError:
+        for future, index in futures.items():
+            if index not in resolved:
+                future.cancel()
+                failures.append((layers[index][2], TimeoutError(f"no response after {timeout} seconds")))
+        flush(skip_missing=True)
+    finally:
+        # Do not wait on timed out requests, their results are simply dropped
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return failures
+
+folium.Map.add_ee_layers = add_ee_layers
 
 # Upload function
-# Define a global variable to store the centroid of the last uploaded geometry
-last_uploaded_centroid = None
-def upload_files_proc(upload_files):
+# Define a global variable to store the map center and zoom of the last uploaded geometries
+last_uploaded_view = None
+def upload_files_proc(upload_files, tolerance=0, stages=None, merge=True):
     # A global variable to track the latest geojson uploaded
-    global last_uploaded_centroid
-    # Setting up a variable that takes all polygons/geometries within the same/different geojson
-    geometry_aoi_list = []
-
-    for upload_file in upload_files:
-        bytes_data = upload_file.read()
-        geojson_data = json.loads(bytes_data)
-
-        if 'features' in geojson_data and isinstance(geojson_data['features'], list):
-            # Handle GeoJSON files with a 'features' list
-            features = geojson_data['features']
-        elif 'geometries' in geojson_data and isinstance(geojson_data['geometries'], list):
-            # Handle GeoJSON files with a 'geometries' list
-            features = [{'geometry': geo} for geo in geojson_data['geometries']]
-        else:
-            # handling cases of unexpected file format or missing 'features' or 'geometries'
-            continue
-
-        for feature in features:
-            if 'geometry' in feature and 'coordinates' in feature['geometry']:
-                coordinates = feature['geometry']['coordinates']
-                geometry = ee.Geometry.Polygon(coordinates) if feature['geometry']['type'] == 'Polygon' else ee.Geometry.MultiPolygon(coordinates)
-                geometry_aoi_list.append(geometry)
-
-                # Update the last uploaded centroid
-                last_uploaded_centroid = geometry.centroid(maxError=1).getInfo()['coordinates']
-
-    if geometry_aoi_list:
-        geometry_aoi = ee.Geometry.MultiPolygon(geometry_aoi_list)
+    global last_uploaded_view
+    if stages is None:
+        geometry_aoi, summary, report = load_aoi(upload_files, tolerance, merge)
     else:
-        geometry_aoi = ee.Geometry.Point([27.98, 36.13])
+        # Files are only parsed again when the upload, the tolerance or the merge setting changed
+        geometry_aoi, summary, report = stages.run(
+            'aoi', [files_fingerprint(upload_files), tolerance, merge], lambda: load_aoi(upload_files, tolerance, merge)
+        ).value
+
+    for file_name, error in report['read_errors']:
+        st.warning(f"Could not read '{file_name}': {error}")
+    if tolerance > 0 and report['vertices_before']:
+        st.caption(
+            f"Simplified {report['vertices_before']:,} → {report['vertices_after']:,} vertices "
+            f"({1 - report['vertices_after'] / report['vertices_before']:.0%} fewer), "
+            f"payload {report['bytes_before'] / 1024:,.0f} KB → {report['bytes_after'] / 1024:,.0f} KB"
+        )
+    merge_report = report.get('merge')
+    if merge_report and (merge_report['duplicates'] or merge_report['nested'] or merge_report['merged']):
+        st.caption(
+            f"Merged {merge_report['polygons_before']:,} → {merge_report['polygons_after']:,} polygons "
+            f"({merge_report['duplicates']} duplicate, {merge_report['nested']} nested, {merge_report['merged']} overlapping): "
+            f"{merge_report['vertices_removed']:,} vertices and {merge_report['redundant_area'] / 10000:,.1f} ha of overlap removed"
+        )
+    for index, problem in summary['problems']:
+        st.warning(f"Skipping uploaded geometry #{index + 1}: {problem}")
+
+    if summary['valid'].any():
+        # Update the map view to fit every uploaded geometry
+        last_uploaded_view = map_view(summary['bbox'])
 
     return geometry_aoi
 
-# Time input processing function
-def date_input_proc(input_date, time_range):
-    end_date = input_date
-    start_date = input_date - timedelta(days=time_range)
-    
-    str_start_date = start_date.strftime('%Y-%m-%d')
-    str_end_date = end_date.strftime('%Y-%m-%d')
-    return str_start_date, str_end_date
+# Statistics live in the process-wide result cache (result_cache.py): every session asking for the same AOI
+# content and inputs gets the same result, concurrent identical requests wait for a single reduction
+
+# Per-class areas are only reduced again when the classified image or the AOI change
+# AOIs larger than PARTITION_AREA_THRESHOLD are reduced cell by cell to stay under the Earth Engine limits
+def cached_class_area_statistics(result_key, classified_image, aoi, aoi_summary):
+    def compute():
+        if aoi_summary['total_area'] > PARTITION_AREA_THRESHOLD:
+            class_rows, _ = partitioned_class_area_statistics(classified_image, aoi_summary['geometries'], aoi_summary['bbox'])
+            return class_rows
+        return class_area_statistics(classified_image, aoi)
+    with tracing.span('class_areas'):
+        return shared_results.resolve(result_key, compute, persist=True)[0]
+
+# Class transitions between the two dates, reduced again only when either classified image or the AOI change
+def cached_transition_statistics(result_key, delta_ndvi, transitions, aoi, aoi_summary):
+    def compute():
+        if aoi_summary['total_area'] > PARTITION_AREA_THRESHOLD:
+            transition_rows, _ = partitioned_transition_statistics(delta_ndvi, transitions, aoi_summary['geometries'], aoi_summary['bbox'])
+            return transition_rows
+        return transition_statistics(delta_ndvi, transitions, aoi)
+    with tracing.span('transitions'):
+        return shared_results.resolve(result_key, compute, persist=True)[0]
+
+# The seasonal profile is only rebuilt when the AOI or the series inputs change
+def cached_ndvi_time_series(aoi_hash, aoi, start_date, end_date, window_days, cloud_rate):
+    key = shared_results.key('time_series', aoi=aoi_hash, window=[start_date, end_date], days=window_days, cloud=cloud_rate)
+    with tracing.span('time_series'):
+        return shared_results.resolve(key, lambda: ndvi_time_series(aoi, start_date, end_date, window_days, cloud_rate), persist=True)[0]
 
 # Main function to run the Streamlit app
 def main():
+    # Spans and Earth Engine calls of this rerun, shown in the sidebar debug panel when it is enabled.
+    # Request payload sizes cost one more serialization, they are only measured when someone looks at them.
+    debug_panel = st.session_state.get('debug_panel', False)
+    trace = tracing.start_trace(measure_payload=debug_panel or tracing.outputs_enabled())
+
     # Inicia o Google Earth Engine
-    ee_authenticate()
+    with tracing.span('ee_authenticate'):
+        ee_authenticate()
+
+    # Pipeline stages memoized per session: AOI -> collection -> composite -> NDVI -> classified -> layer
+    if 'stage_graph' not in st.session_state:
+        st.session_state['stage_graph'] = StageGraph()
+    stages = st.session_state['stage_graph']
+    stages.start_rerun()
 
     # sidebar
     with st.sidebar:
@@ -126,6 +258,8 @@ def main():
             """
                 - [NDVI Map](#ndvi-viewer)
                 - [Map Legend](#map-legend)
+                - [NDVI Change](#ndvi-change)
+                - [NDVI Time Series](#ndvi-time-series)
                 - [Process workflow](#process-workflow-aoi-date-range-and-classification)
                 - [Interpreting the Results](#interpreting-the-results)
                 - [Environmental Index](#using-an-environmental-index-ndvi)
@@ -140,6 +274,10 @@ def main():
 
         st.caption("ʕ •ᴥ•ʔ Star⭐the [project on GitHub](https://github.com/IndigoWizard/NDVI-Viewer/)!")
 
+        # Filled at the end of the rerun with its spans and Earth Engine calls
+        st.checkbox("Debug panel", key='debug_panel')
+        debug_placeholder = st.empty()
+
     with st.container():
         st.title("NDVI Viewer")
         st.markdown("**Monitor Vegetation Health by Viewing & Comparing NDVI Values Through Time and Location with Sentinel-2 Satellite Images on The Fly!**")
@@ -154,13 +292,20 @@ def main():
             ## Cloud coverage input
                 st.info("Cloud Coverage 🌥️")
                 cloud_pixel_percentage = st.slider(label="cloud pixel rate", min_value=5, max_value=100, step=5, value=85 , label_visibility="collapsed")
+                # Mask clouds and shadows pixel by pixel with the Sentinel-2 scene classification band
+                scl_cloud_mask = st.checkbox("Per-pixel cloud masking (SCL)", value=False)
 
             ## File upload
                 # User input GeoJSON file
                 st.info("Upload Area Of Interest file:")
                 upload_files = st.file_uploader("Create a GeoJSON file at: [geojson.io](https://geojson.io/)", accept_multiple_files=True)
+                # Simplifying polygon outlines keeps large boundary exports under the Earth Engine payload limits
+                simplify_tolerance = st.slider(label="Outline simplification (meters, 0 = off)", min_value=0, max_value=100, step=5, value=0)
+                # Merging duplicate and overlapping polygons locally can be turned off for large parcel uploads
+                merge_polygons = st.checkbox("Merge duplicate and overlapping polygons", value=True)
                 # calling upload files function
-                geometry_aoi = upload_files_proc(upload_files)
+                with tracing.span('upload_files_proc'):
+                    geometry_aoi = upload_files_proc(upload_files, simplify_tolerance, stages, merge_polygons)
             
             ## Accessibility: Color palette input
                 st.info("Custom Color Palettes")
@@ -187,6 +332,16 @@ def main():
                     ndvi_palette = ["#407de0", "#2763da", "#394388", "#272c66", "#16194f", "#010034"]
                     reclassified_ndvi_palette = ["#004f3d", "#338796", "#66a4f5", "#3683ff", "#3d50ca", "#421c7f", "#290058"]
 
+                # Diverging NDVI change palette: loss (brown) - no change (white) - gain (green),
+                # purple/orange for the colorblind-friendly options
+                delta_ndvi_palette = ["#8c510a", "#d8b365", "#f6e8c3", "#f5f5f5", "#c7eae5", "#5ab4ac", "#01665e"]
+                if accessibility != "Normal":
+                    delta_ndvi_palette = ["#b35806", "#f1a340", "#fee0b6", "#f7f7f7", "#d8daeb", "#998ec3", "#542788"]
+
+            ## Change detection input
+                st.info("Change Detection")
+                change_detection = st.checkbox("NDVI change and class transitions between the two dates", value=True)
+
         with st.container():
             ## Time range input
             with c1:
@@ -214,13 +369,10 @@ def main():
     #### User input section - END
 
             #### Map section - START
-            global last_uploaded_centroid
-
             # Create the initial map
-            if last_uploaded_centroid is not None:
-                latitude = last_uploaded_centroid[1]
-                longitude = last_uploaded_centroid[0]
-                m = folium.Map(location=[latitude, longitude], tiles=None, zoom_start=12, control_scale=True)
+            if last_uploaded_view is not None:
+                map_center, map_zoom = last_uploaded_view
+                m = folium.Map(location=map_center, tiles=None, zoom_start=map_zoom, control_scale=True)
             else:
                 # Default location if no file is uploaded
                 m = folium.Map(location=[36.45, 10.85], tiles=None, zoom_start=4, control_scale=True)
@@ -228,27 +380,49 @@ def main():
             ### BASEMAPS - START
             ## Primary basemaps
             # OSM
-            b0 = folium.TileLayer('Open Street Map', name="Open Street Map")
+            b0 = folium.TileLayer('OpenStreetMap', name="Open Street Map")
             b0.add_to(m)
             # CartoDB Dark Matter basemap
             b1 = folium.TileLayer('cartodbdark_matter', name='Dark Basemap')
             b1.add_to(m)
 
             #### Satellite imagery Processing Section - START
-            ## Defining and clipping image collections for both dates:
-            # initial Image collection
-            initial_collection = satCollection(cloud_pixel_percentage, str_initial_start_date, str_initial_end_date, geometry_aoi)
-            # updated Image collection
-            updated_collection = satCollection(cloud_pixel_percentage, str_updated_start_date, str_updated_end_date, geometry_aoi)
-
-            # setting a sat_imagery variable that could be used for various processes later on (tci, ndvi... etc)
-            initial_sat_imagery = initial_collection.median()
-            updated_sat_imagery = updated_collection.median()
+            ## Median composite, masked NDVI and NDVI classes for both dates (see pipeline.py)
+            # Results shared across sessions are keyed by the AOI content, the date windows, the cloud threshold and mask
+            aoi_summary = stages.value('aoi')[1]
+            aoi_hash = aoi_summary['aoi_hash']
+            # Bounding box [min_lon, min_lat, max_lon, max_lat] of this session's AOI, for tile pre-warming and exports
+            aoi_bbox = [float(value) for value in aoi_summary['bbox']] if aoi_summary['valid'].any() else None
+            product_windows = {
+                'initial': [str_initial_start_date, str_initial_end_date],
+                'updated': [str_updated_start_date, str_updated_end_date],
+            }
+            def product_key(kind, source, **inputs):
+                # 'ndvi:updated' depends on one date window, 'change' on both
+                tags = [source.split(':')[1]] if ':' in source else list(product_windows)
+                return shared_results.key(
+                    kind, product=source.split(':')[0], aoi=aoi_hash, windows=[product_windows[tag] for tag in tags],
+                    cloud=cloud_pixel_percentage, scl=scl_cloud_mask, **inputs
+                )
+
+            initial_products = staged_ndvi_products(stages, 'initial', cloud_pixel_percentage, str_initial_start_date, str_initial_end_date, geometry_aoi, scl_cloud_mask)
+            updated_products = staged_ndvi_products(stages, 'updated', cloud_pixel_percentage, str_updated_start_date, str_updated_end_date, geometry_aoi, scl_cloud_mask)
+
+            # Size of the composite expression sent to Earth Engine, per-image clip/scale vs. optimized builder.
+            # Serializing both expressions (each embeds the AOI) costs seconds on large AOIs, so it is only
+            # measured for the debug panel.
+            expression_sizes = None
+            if debug_panel:
+                expression_sizes = stages.run(
+                    'expression_report', None,
+                    lambda: composite_expression_report(cloud_pixel_percentage, str_updated_start_date, str_updated_end_date, geometry_aoi, scl_cloud_mask),
+                    after=('collection:updated',),
+                ).value
 
             ## TCI (True Color Imagery)
-            # Clipping the image to the area of interest "aoi"
-            initial_tci_image = initial_sat_imagery
-            updated_tci_image = updated_sat_imagery
+            # The composites are already clipped to the area of interest "aoi"
+            initial_tci_image = initial_products['composite']
+            updated_tci_image = updated_products['composite']
 
             # TCI image visual parameters
             tci_params = {
@@ -258,14 +432,9 @@ def main():
             'gamma': 1
             }
 
-            ## Other imagery processing operations go here 
-            # NDVI
-            def getNDVI(collection):
-                return collection.normalizedDifference(['B8', 'B4'])
-
-            # clipping to AOI
-            initial_ndvi = getNDVI(initial_sat_imagery)
-            updated_ndvi = getNDVI(updated_sat_imagery)
+            # NDVI masked over the water to show only land
+            initial_ndvi = initial_products['ndvi']
+            updated_ndvi = updated_products['ndvi']
 
             # NDVI visual parameters:
             ndvi_params = {
@@ -274,31 +443,10 @@ def main():
             'palette': ndvi_palette
             }
 
-            # Masking NDVI over the water & show only land
-            def satImageMask(sat_image):
-                masked_image = sat_image.updateMask(sat_image.gte(0))
-                return masked_image
-            
-            # Mask NDVI images
-            initial_ndvi = satImageMask(initial_ndvi)
-            updated_ndvi = satImageMask(updated_ndvi)
-
             # ##### NDVI classification: 7 classes
-            def classify_ndvi(masked_image): # better use a masked image to avoid water bodies obstracting the result as possible
-                ndvi_classified = ee.Image(masked_image) \
-                .where(masked_image.gte(0).And(masked_image.lt(0.15)), 1) \
-                .where(masked_image.gte(0.15).And(masked_image.lt(0.25)), 2) \
-                .where(masked_image.gte(0.25).And(masked_image.lt(0.35)), 3) \
-                .where(masked_image.gte(0.35).And(masked_image.lt(0.45)), 4) \
-                .where(masked_image.gte(0.45).And(masked_image.lt(0.65)), 5) \
-                .where(masked_image.gte(0.65).And(masked_image.lt(0.75)), 6) \
-                .where(masked_image.gte(0.75), 7) \
-                
-                return ndvi_classified
-
-            # Classify masked NDVI
-            initial_ndvi_classified = classify_ndvi(initial_ndvi)
-            updated_ndvi_classified = classify_ndvi(updated_ndvi)
+            # classify_ndvi maps the masked NDVI through the NDVI_CLASSES breakpoint table in a single operation
+            initial_ndvi_classified = initial_products['classified']
+            updated_ndvi_classified = updated_products['classified']
 
             # Classified NDVI visual parameters
             ndvi_classified_params = {
@@ -308,29 +456,60 @@ def main():
             # each color corresponds to an NDVI class.
             }
 
+            # NDVI change visual parameters, centered on no change
+            delta_ndvi_params = {
+            'min': -DELTA_NDVI_RANGE,
+            'max': DELTA_NDVI_RANGE,
+            'palette': delta_ndvi_palette
+            }
+
             #### Satellite imagery Processing Section - END
 
             #### Layers section - START
             # Check if the initial and updated dates are the same
+            # Each layer is listed with the stage that produced its image
             if initial_date == updated_date:
                 # Only display the layers based on the updated date without dates in their names
-                m.add_ee_layer(updated_tci_image, tci_params, 'Satellite Imagery')
-                m.add_ee_layer(updated_ndvi, ndvi_params, 'Raw NDVI')
-                m.add_ee_layer(updated_ndvi_classified, ndvi_classified_params, 'Reclassified NDVI')
+                staged_layers = [
+                    (updated_tci_image, tci_params, 'Satellite Imagery', 'composite:updated'),
+                    (updated_ndvi, ndvi_params, 'Raw NDVI', 'ndvi:updated'),
+                    (updated_ndvi_classified, ndvi_classified_params, 'Reclassified NDVI', 'classified:updated'),
+                ]
             else:
                 # Show both dates in the appropriate layers
-                # Satellite image
-                m.add_ee_layer(initial_tci_image, tci_params, f'Initial Satellite Imagery: {initial_date}')
-                m.add_ee_layer(updated_tci_image, tci_params, f'Updated Satellite Imagery: {updated_date}')
-
-                # NDVI
-                m.add_ee_layer(initial_ndvi, ndvi_params, f'Initial Raw NDVI: {initial_date}')
-                m.add_ee_layer(updated_ndvi, ndvi_params, f'Updated Raw NDVI: {updated_date}')
-
-                # Add layers to the second map (m.m2)
-                # Classified NDVI
-                m.add_ee_layer(initial_ndvi_classified, ndvi_classified_params, f'Initial Reclassified NDVI: {initial_date}')
-                m.add_ee_layer(updated_ndvi_classified, ndvi_classified_params, f'Updated Reclassified NDVI: {updated_date}')
+                staged_layers = [
+                    # Satellite image
+                    (initial_tci_image, tci_params, f'Initial Satellite Imagery: {initial_date}', 'composite:initial'),
+                    (updated_tci_image, tci_params, f'Updated Satellite Imagery: {updated_date}', 'composite:updated'),
+                    # NDVI
+                    (initial_ndvi, ndvi_params, f'Initial Raw NDVI: {initial_date}', 'ndvi:initial'),
+                    (updated_ndvi, ndvi_params, f'Updated Raw NDVI: {updated_date}', 'ndvi:updated'),
+                    # Classified NDVI
+                    (initial_ndvi_classified, ndvi_classified_params, f'Initial Reclassified NDVI: {initial_date}', 'classified:initial'),
+                    (updated_ndvi_classified, ndvi_classified_params, f'Updated Reclassified NDVI: {updated_date}', 'classified:updated'),
+                ]
+
+            # Change detection: NDVI difference and class transition codes of the two dates (see pipeline.py)
+            change_products = None
+            if initial_date != updated_date and change_detection:
+                change_products = staged_change_products(stages, initial_products, updated_products)
+                staged_layers.append(
+                    (change_products['delta_ndvi'], delta_ndvi_params, f'NDVI Change: {initial_date} → {updated_date}', 'change')
+                )
+            ee_layers = [(image, vis_params, name) for image, vis_params, name, _ in staged_layers]
+            layer_sources = {name: source for _, _, name, source in staged_layers}
+
+            # Layer stage: keyed on the image stage and the vis params, so a palette change only re-styles layers.
+            # Map IDs stay in map_id_cache, which also expires them with the Earth Engine tokens.
+            resolved_map_ids = []
+            def resolve_staged_layer(image, vis_params, name):
+                stages.register(f'layer:{name}', vis_params, after=(layer_sources[name],))
+                # Shared by every session showing the same product, identical concurrent requests make one getMapId call
+                key = product_key('map_id', layer_sources[name], vis=vis_params)
+                map_id, reused = map_id_cache.resolve(key, lambda: ee.Image(image).getMapId(vis_params))
+                stages.record(f'layer:{name}', reused)
+                resolved_map_ids.append(map_id)
+                return map_id
 
             #### Layers section - END
 
@@ -338,13 +517,105 @@ def main():
             # Folium Map Layer Control: we can see and interact with map layers
             folium.LayerControl(collapsed=True).add_to(m)
 
-        submitted = st.form_submit_button("Generate map")
-        if submitted:
+            # Render the basemap right away, then re-render every time new Earth Engine layers resolve
             with c1:
-                folium_static(m)
-        else:
+                map_placeholder = st.empty()
+
+            def render_map(current_map):
+                with map_placeholder:
+                    with tracing.span('folium_static'):
+                        folium_static(current_map)
+
+            render_map(m)
+            with tracing.span('layers'):
+                layer_failures = m.add_ee_layers(ee_layers, on_layer_added=render_map, resolve_map_id=resolve_staged_layer)
+
             with c1:
-                folium_static(m)
+                for layer_name, error in layer_failures:
+                    st.warning(f"Layer '{layer_name}' could not be loaded: {error}")
+
+        # Layers are rendered above, the button only triggers a rerun with the new form values
+        st.form_submit_button("Generate map")
+
+    ## Tile cache pre-warming: fetch every tile of the current layers over the AOI ahead of a demo or report
+    proxy = tile_proxy.proxy_from_environment()
+    if proxy is not None and aoi_bbox is not None:
+        with st.expander("Tile cache"):
+            cache_stats = proxy.cache.stats()
+            st.caption(f"{cache_stats['tiles']:,} cached tiles, {cache_stats['bytes'] / 1024 ** 2:,.1f} of {cache_stats['max_bytes'] / 1024 ** 2:,.0f} MB")
+            prewarm_zooms = st.slider("Zoom levels to pre-warm", min_value=2, max_value=18, value=(10, 14))
+            warm_layers = [tile_proxy.layer_key(map_id) for map_id in resolved_map_ids]
+            # Tiles are counted before anything is fetched: every zoom level quadruples the count
+            layer_tiles = tile_proxy.count_tiles(aoi_bbox, range(prewarm_zooms[0], prewarm_zooms[1] + 1))
+            warm_tiles = layer_tiles * len(warm_layers)
+            st.caption(f"{warm_tiles:,} tiles ({layer_tiles:,} per layer, {len(warm_layers)} layers)")
+            if layer_tiles > tile_proxy.MAX_PREWARM_TILES:
+                st.warning(f"Pre-warming is limited to {tile_proxy.MAX_PREWARM_TILES:,} tiles per layer, lower the maximum zoom level.")
+            prewarm_confirmed = warm_tiles <= PREWARM_CONFIRM_TILES or st.checkbox(f"Fetch {warm_tiles:,} tiles from Earth Engine")
+            if st.button("Pre-warm AOI tiles", disabled=layer_tiles > tile_proxy.MAX_PREWARM_TILES or not prewarm_confirmed):
+                warm_bbox = list(aoi_bbox)
+                def prewarm_layers():
+                    for layer_key in warm_layers:
+                        tile_proxy.prewarm(proxy, layer_key, warm_bbox, range(prewarm_zooms[0], prewarm_zooms[1] + 1))
+                # Runs in the background, the page stays responsive while the tiles are fetched
+                threading.Thread(target=prewarm_layers, name='tile-prewarm', daemon=True).start()
+                st.success(f"Pre-warming {len(warm_layers)} layers for zoom {prewarm_zooms[0]}-{prewarm_zooms[1]} in the background.")
+
+    ## Shared result cache: memory bounds, hit rates and evictions of the caches shared by every session
+    with st.expander("Shared result cache"):
+        st.dataframe(
+            pd.DataFrame({'Results': shared_results.stats(), 'Map IDs': map_id_cache.stats()}),
+            column_config={'_index': 'Statistic'},
+        )
+
+    ## Raster export: the products over the AOI bbox as GeoTIFF/NPZ files for GIS work (see export.py)
+    if upload_files and aoi_bbox is not None:
+        with st.expander("Export rasters"):
+            export_products = {
+                f'Initial Raw NDVI: {initial_date}': (initial_ndvi, 'ndvi', 'ndvi:initial'),
+                f'Updated Raw NDVI: {updated_date}': (updated_ndvi, 'ndvi', 'ndvi:updated'),
+                f'Initial Reclassified NDVI: {initial_date}': (initial_ndvi_classified, 'classified', 'classified:initial'),
+                f'Updated Reclassified NDVI: {updated_date}': (updated_ndvi_classified, 'classified', 'classified:updated'),
+            }
+            if change_products is not None:
+                export_products[f'NDVI Change: {initial_date} → {updated_date}'] = (change_products['delta_ndvi'], 'ndvi', 'change')
+            e1, e2, e3 = st.columns([2, 1, 1])
+            export_name = e1.selectbox("Product", list(export_products))
+            export_format = e2.radio("Format", ["GeoTIFF", "NPZ"], horizontal=True)
+            export_resolution = e3.number_input("Pixel size (meters)", min_value=10, max_value=1000, value=10, step=10)
+            # Size known before anything is downloaded: the file is written to disk then sent to the browser
+            export_height, export_width = export.raster_shape(aoi_bbox, export_resolution / METERS_PER_DEGREE)
+            export_bytes = export.estimate_export_bytes(aoi_bbox, export_resolution / METERS_PER_DEGREE, export_products[export_name][1])
+            st.caption(f"{export_width:,} × {export_height:,} pixels, about {export_bytes / 1024 ** 2:,.0f} MB")
+            if export_bytes > EXPORT_MAX_BYTES:
+                st.warning(f"The export is limited to {EXPORT_MAX_BYTES / 1024 ** 2:,.0f} MB, choose a larger pixel size.")
+            if st.button("Export", disabled=export_bytes > EXPORT_MAX_BYTES):
+                export_image, export_type, export_stage = export_products[export_name]
+                extension = 'tif' if export_format == "GeoTIFF" else 'npz'
+                # Named after the product key and resolution, so an interrupted export of the same product resumes
+                export_path = os.path.join(EXPORT_DIR, f"{export_type}_{product_key('export', export_stage)[:16]}_{export_resolution}m.{extension}")
+                export_progress = st.progress(0.0, text="Downloading chunks...")
+                try:
+                    with tracing.span('export'):
+                        export.export_product(
+                            export_image, aoi_bbox, export_path, export_type,
+                            pixel_size=export_resolution / METERS_PER_DEGREE, max_bytes=EXPORT_MAX_BYTES,
+                            progress=lambda done, total: export_progress.progress(done / total, text=f"Downloaded {done}/{total} chunks"),
+                        )
+                    with open(export_path, 'rb') as export_file:
+                        export_data = export_file.read()
+                    # The download is served from memory, finished files do not pile up in EXPORT_DIR
+                    os.remove(export_path)
+                    st.download_button(
+                        f"Download {export_format}",
+                        data=export_data,
+                        file_name=f"{export_stage.replace(':', '_')}_{export_resolution}m.{extension}",
+                    )
+                except (ee.EEException, OSError) as error:
+                    # Earth Engine errors and network failures once the retries are exhausted
+                    st.warning(f"The export stopped, finished chunks are kept and the next export resumes from them: {error}")
+                except ValueError as error:
+                    st.warning(f"The export was not started: {error}")
 
     #### Map result display - END
 
@@ -391,8 +662,136 @@ def main():
             # Display the Reclassified NDVI legend using st.markdown
             st.markdown(reclassified_ndvi_legend_html, unsafe_allow_html=True)
 
+        with col5:
+            # Area covered by each NDVI class in the uploaded AOI, one grouped reduction on the server
+            st.markdown("<h5>Class Areas</h5>", unsafe_allow_html=True)
+            if upload_files:
+                try:
+                    class_rows = cached_class_area_statistics(
+                        product_key('class_areas', 'classified:updated'), updated_ndvi_classified, geometry_aoi, stages.value('aoi')[1]
+                    )
+                    class_areas = pd.DataFrame(class_rows)[['class', 'pixels', 'hectares', 'share']]
+                    class_areas['share'] *= 100
+                    st.dataframe(
+                        class_areas,
+                        hide_index=True,
+                        column_config={
+                            'class': 'Class',
+                            'pixels': 'Pixels',
+                            'hectares': st.column_config.NumberColumn('Hectares', format="%.2f"),
+                            'share': st.column_config.NumberColumn('Share', format="%.1f %%"),
+                        },
+                    )
+                except ee.EEException as error:
+                    st.warning(f"Class areas could not be computed: {error}")
+            else:
+                st.caption("Upload an AOI file to see the area of each class.")
+
     #### Legend - END
 
+    #### Change detection - START
+    if change_products is not None:
+        with st.container():
+            st.subheader("NDVI Change")
+            col6, col7 = st.columns([1, 3])
+
+            with col6:
+                # Diverging legend of the NDVI change layer
+                delta_ndvi_legend_html = """
+                    <div class="deltandvilegend">
+                        <h5>NDVI Change</h5>
+                        <div style="display: flex; flex-direction: row; align-items: flex-start; gap: 1rem; width: 100%;">
+                            <div style="width: 30px; height: 200px; background: linear-gradient({0},{1},{2},{3},{4},{5},{6});"></div>
+                            <div style="display: flex; flex-direction: column; justify-content: space-between; height: 200px;">
+                                <span>+{7} (gain)</span>
+                                <span>0</span>
+                                <span>-{7} (loss)</span>
+                            </div>
+                        </div>
+                    </div>
+                """.format(*reversed(delta_ndvi_palette), DELTA_NDVI_RANGE)
+                st.markdown(delta_ndvi_legend_html, unsafe_allow_html=True)
+
+            with col7:
+                # Area of every class pair (initial class -> updated class), one grouped reduction on the server
+                st.markdown("<h5>Class Transitions (hectares)</h5>", unsafe_allow_html=True)
+                if upload_files:
+                    try:
+                        transition_rows = cached_transition_statistics(
+                            product_key('transitions', 'change'), change_products['delta_ndvi'], change_products['transitions'], geometry_aoi, stages.value('aoi')[1]
+                        )
+                        class_names = [f"{value}. {label.split('.')[0]}" for value, _, label in NDVI_CLASSES]
+                        transitions = pd.DataFrame(
+                            transition_matrix(transition_rows),
+                            index=pd.Index(class_names, name=f"{initial_date} → {updated_date}"),
+                            columns=class_names,
+                        )
+                        st.dataframe(transitions.style.format("{:,.2f}"))
+
+                        changed_rows = [row for row in transition_rows if row['from_class'] != row['to_class']]
+                        total_pixels = sum(row['pixels'] for row in transition_rows)
+                        if total_pixels:
+                            mean_delta = sum((row['mean_delta'] or 0.0) * row['pixels'] for row in transition_rows) / total_pixels
+                            changed_share = sum(row['share'] for row in changed_rows)
+                            st.caption(f"Mean NDVI change {mean_delta:+.3f}, {changed_share:.1%} of the classified area changed class.")
+                    except ee.EEException as error:
+                        st.warning(f"Class transitions could not be computed: {error}")
+                else:
+                    st.caption("Upload an AOI file to see the class transitions.")
+    #### Change detection - END
+
+    #### Time series - START
+    with st.container():
+        st.subheader("NDVI Time Series")
+        st.markdown("Seasonal NDVI profile of the uploaded AOI: the date span is split into windows, each window becomes a median composite and all of them are reduced on the server in a single request.")
+
+        with st.form("time_series_form"):
+            ts1, ts2, ts3 = st.columns(3)
+            series_start = ts1.date_input("Series start", value=delay - timedelta(days=180))
+            series_end = ts2.date_input("Series end", value=delay)
+            window_days = ts3.number_input("Window size (days)", min_value=1, max_value=90, value=10, step=1)
+            build_series = st.form_submit_button("Build time series")
+
+        if build_series:
+            if not upload_files:
+                st.info("Upload an Area Of Interest file to build its NDVI time series.")
+            elif series_start >= series_end:
+                st.warning("The series start date must be before its end date.")
+            else:
+                try:
+                    with st.spinner("Reducing NDVI over every window..."):
+                        series_rows = cached_ndvi_time_series(
+                            aoi_hash, geometry_aoi, series_start, series_end, int(window_days), cloud_pixel_percentage
+                        )
+                    series = pd.DataFrame(series_rows, columns=SERIES_COLUMNS)
+                    st.line_chart(series.set_index('end')[['mean', 'median', 'p10', 'p90']])
+                    st.dataframe(series, hide_index=True)
+                    st.download_button(
+                        "Download CSV",
+                        data=series.to_csv(index=False),
+                        file_name=f"ndvi_time_series_{series_start}_{series_end}.csv",
+                        mime="text/csv",
+                    )
+                except ee.EEException as error:
+                    st.warning(f"The time series could not be computed: {error}")
+    #### Time series - END
+
+    # Which pipeline stages this rerun reused or rebuilt
+    stages.log_rerun()
+
+    # Where the time of this rerun went
+    tracing.finish_trace(trace)
+    if debug_panel:
+        with debug_placeholder.container():
+            st.caption(f"Rerun: {trace.seconds:.2f} s, {sum(calls['count'] for calls in trace.ee_calls.values())} Earth Engine calls")
+            if expression_sizes is not None:
+                st.caption(f"Composite expression: {expression_sizes['before']:,} → {expression_sizes['after']:,} characters")
+            span_rows = [{'span': name, 'count': total['count'], 'seconds': total['seconds']} for name, total in trace.span_totals().items()]
+            st.dataframe(pd.DataFrame(span_rows), hide_index=True)
+            if trace.ee_calls:
+                call_rows = [{'call': call, **counters} for call, counters in trace.ee_calls.items()]
+                st.dataframe(pd.DataFrame(call_rows), hide_index=True)
+
     #### Miscs Infos - START
     st.subheader("Information")
 
@@ -0,0 +1,192 @@
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+
+import ee
+
+from classification import class_area_statistics
+from partition import PARTITION_AREA_THRESHOLD, partitioned_class_area_statistics
+from pipeline import DEFAULT_TIME_RANGE, call_with_retry, date_input_proc, load_aoi, ndvi_products
+
+# Headless runner: NDVI class areas for many AOI files x dates without the Streamlit UI
+#
+#   python batch.py manifest.json --output results/ --workers 4 --max-ee-requests 8
+#
+# The manifest is either a JSON object {"aois": [...], "dates": [...]} (every AOI for every date),
+# a JSON object {"jobs": [{"aoi": ..., "date": ...}, ...]} or a CSV file with aoi,date columns.
+# Optional per-job keys: id, cloud_rate, time_range, tolerance. The default id is the AOI path relative to the
+# manifest (without extension, directories joined with '_') and the date; ids must be unique.
+
+DEFAULT_CLOUD_RATE = 85
+CHECKPOINT_FILE = 'checkpoint.jsonl'
+
+# Process-wide semaphore limiting concurrent Earth Engine requests, shared with the workers
+ee_request_slots = None
+
+
+def read_manifest(path):
+    if path.endswith('.csv'):
+        with open(path, newline='') as manifest_file:
+            jobs = list(csv.DictReader(manifest_file))
+        defaults = {}
+    else:
+        with open(path) as manifest_file:
+            manifest = json.load(manifest_file)
+        defaults = {key: manifest[key] for key in ('cloud_rate', 'time_range', 'tolerance') if key in manifest}
+        if 'jobs' in manifest:
+            jobs = manifest['jobs']
+        else:
+            jobs = [{'aoi': aoi, 'date': job_date} for aoi in manifest.get('aois', []) for job_date in manifest.get('dates', [])]
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    normalized = []
+    for job in jobs:
+        job = {**defaults, **{key: value for key, value in job.items() if value not in (None, '')}}
+        job['aoi'] = os.path.join(base_dir, job['aoi'])
+        job['date'] = str(job['date'])
+        job['cloud_rate'] = float(job.get('cloud_rate', DEFAULT_CLOUD_RATE))
+        job['time_range'] = int(job.get('time_range', DEFAULT_TIME_RANGE))
+        job['tolerance'] = float(job.get('tolerance', 0))
+        if 'id' not in job:
+            aoi_name = os.path.splitext(os.path.relpath(job['aoi'], base_dir))[0]
+            job['id'] = f"{aoi_name.replace(os.sep, '_').replace('/', '_')}_{job['date']}"
+        normalized.append(job)
+
+    # Results and checkpoint records are keyed by id, a repeated id would skip or overwrite another job
+    seen = {}
+    for job in normalized:
+        if job['id'] in seen:
+            raise ValueError(f"job id '{job['id']}' is used by both {seen[job['id']]} and {job['aoi']}, set distinct ids")
+        seen[job['id']] = job['aoi']
+    return normalized
+
+
+# Completed job records by id, so an interrupted run resumes where it stopped
+def read_checkpoint(output_dir):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    completed = {}
+    if os.path.exists(path):
+        with open(path) as checkpoint:
+            for line in checkpoint:
+                try:
+                    record = json.loads(line)
+                    completed[record['id']] = record
+                except (ValueError, KeyError):
+                    # A line cut short by an interruption, the job simply runs again
+                    continue
+    return completed
+
+
+# Rewrite the checkpoint without the lines left incomplete by an interrupted run
+def compact_checkpoint(output_dir, completed):
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as checkpoint:
+        for record in completed.values():
+            checkpoint.write(json.dumps(record) + '\n')
+    os.replace(path + '.tmp', path)
+
+
+def write_checkpoint(output_dir, job_id, elapsed):
+    with open(os.path.join(output_dir, CHECKPOINT_FILE), 'a') as checkpoint:
+        checkpoint.write(json.dumps({'id': job_id, 'elapsed': round(elapsed, 3)}) + '\n')
+        checkpoint.flush()
+        os.fsync(checkpoint.fileno())
+
+
+def init_worker(project, request_slots):
+    global ee_request_slots
+    ee_request_slots = request_slots
+    ee.Initialize(project=project)
+
+
+def run_job(job, output_dir, retries):
+    started = time.monotonic()
+    with open(job['aoi'], 'rb') as aoi_file:
+        geometry_aoi, summary, report = load_aoi([aoi_file], job['tolerance'])
+    if not summary['valid'].any():
+        raise ValueError(f"no valid polygon in {job['aoi']}")
+
+    start_date, end_date = date_input_proc(date.fromisoformat(job['date']), job['time_range'])
+    products = ndvi_products(job['cloud_rate'], start_date, end_date, geometry_aoi)
+    if summary['total_area'] > PARTITION_AREA_THRESHOLD:
+        # Very large AOIs are reduced cell by cell, each cell with its own retries; the cell threads of every
+        # worker share the --max-ee-requests slots
+        class_rows, _ = partitioned_class_area_statistics(products['classified'], summary['geometries'], summary['bbox'],
+                                                          retries=retries, slots=ee_request_slots)
+    else:
+        class_rows = call_with_retry(lambda: class_area_statistics(products['classified'], geometry_aoi), retries, slots=ee_request_slots)
+
+    result = {
+        'id': job['id'],
+        'aoi': job['aoi'],
+        'date': job['date'],
+        'start_date': start_date,
+        'end_date': end_date,
+        'cloud_rate': job['cloud_rate'],
+        'aoi_area_hectares': summary['total_area'] / 10000,
+        'classes': class_rows,
+    }
+    # Write then rename so a partial result file never looks complete
+    result_path = os.path.join(output_dir, f"{job['id']}.json")
+    with open(result_path + '.tmp', 'w') as result_file:
+        json.dump(result, result_file, indent=2)
+    os.replace(result_path + '.tmp', result_path)
+    return job['id'], time.monotonic() - started
+
+
+def run_manifest(manifest_path, output_dir, project, workers=4, max_ee_requests=8, retries=4):
+    jobs = read_manifest(manifest_path)
+    os.makedirs(output_dir, exist_ok=True)
+    completed = read_checkpoint(output_dir)
+    compact_checkpoint(output_dir, completed)
+    pending = [job for job in jobs if job['id'] not in completed]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+
+    failures = []
+    request_slots = multiprocessing.BoundedSemaphore(max_ee_requests)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(project, request_slots)) as executor:
+        futures = {executor.submit(run_job, job, output_dir, retries): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                job_id, elapsed = future.result()
+            except Exception as error:
+                failures.append((job['id'], error))
+                print(f"FAILED {job['id']}: {error}", file=sys.stderr)
+                continue
+            write_checkpoint(output_dir, job_id, elapsed)
+            print(f"done {job_id} ({elapsed:.1f}s)")
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run NDVI class statistics for a manifest of AOI files and dates")
+    parser.add_argument('manifest', help="JSON or CSV job manifest")
+    parser.add_argument('--output', required=True, help="directory for per-job results and the checkpoint")
+    parser.add_argument('--project', default=os.environ.get('EE_PROJECT', 'ee-marceloclaro'), help="Earth Engine cloud project")
+    parser.add_argument('--workers', type=int, default=4, help="worker processes")
+    parser.add_argument('--max-ee-requests', type=int, default=8, help="concurrent Earth Engine requests across all workers")
+    parser.add_argument('--retries', type=int, default=4, help="retries per Earth Engine request")
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(asctime)s %(name)s %(levelname)s: %(message)s')
+
+    try:
+        failures = run_manifest(args.manifest, args.output, args.project, args.workers, args.max_ee_requests, args.retries)
+    except ValueError as error:
+        parser.error(str(error))
+    if failures:
+        print(f"{len(failures)} job(s) failed, rerun the same command to retry them", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+# Local stand-in for the part of the earthengine-api surface the app uses (ImageCollection, Geometry, Image,
+# Filter, Reducer, getMapId, getInfo...). Every call builds a node of an expression graph, like the real
+# client library; only getInfo, getMapId and computePixels are "round trips", which sleep for the configured
+# latency and are counted with the size of the serialized expression they would send.
+
+
+class EEException(Exception):
+    pass
+
+
+# Calls, round trips, payload bytes and expression depth seen by one FakeEarthEngine
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.round_trips = {}
+            self.payload_bytes = 0
+            self.max_depth = 0
+            self.nodes = 0
+
+    def call(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.nodes += 1
+
+    def round_trip(self, name, payload_bytes, depth):
+        with self._lock:
+            self.round_trips[name] = self.round_trips.get(name, 0) + 1
+            self.payload_bytes += payload_bytes
+            self.max_depth = max(self.max_depth, depth)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'round_trips': sum(self.round_trips.values()),
+                'round_trips_by_call': dict(self.round_trips),
+                'calls': sum(self.calls.values()),
+                'payload_bytes': self.payload_bytes,
+                'max_depth': self.max_depth,
+            }
+
+
+# One node of the expression graph: the operation name and its arguments
+class Node:
+    def __init__(self, backend, name, args=(), kwargs=None, parent=None):
+        self._backend = backend
+        self._name = name
+        self._parent = parent
+        # Client-side type: the constructor the chain started from, or the last cast (ee.Image(...))
+        self._kind = parent._kind if parent is not None else name.split('.')[0]
+        self._args = [backend.capture(arg) for arg in args]
+        self._kwargs = {key: backend.capture(value) for key, value in (kwargs or {}).items()}
+        self._depth = 1 + max(value_depth(value) for value in [parent, *self._args, *self._kwargs.values()])
+        # A node never changes once built: its encoded form and JSON payload are computed once, so the
+        # benchmarks time the app rather than the fake's own serialization
+        self._encoded = None
+        self._serialized = None
+        backend.recorder.call(name)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: Node(self._backend, name, args, kwargs, parent=self)
+
+    def encode(self):
+        if self._encoded is None:
+            self._encoded = {
+                'fn': self._name,
+                'on': self._parent.encode() if self._parent is not None else None,
+                'args': [encode_value(arg) for arg in self._args],
+                'kwargs': {key: encode_value(value) for key, value in self._kwargs.items()},
+            }
+        return self._encoded
+
+    def serialize(self):
+        if self._serialized is None:
+            self._serialized = json.dumps(self.encode(), separators=(',', ':'), default=str)
+        return self._serialized
+
+    def __str__(self):
+        return self.serialize()
+
+    def payload_bytes(self):
+        return len(self.serialize().encode('utf-8'))
+
+    # Like the client library, round trips go through ee.data so wrappers installed there see them
+    def getInfo(self):
+        return self._backend.data.computeValue(self)
+
+    def getMapId(self, vis_params=None):
+        response = self._backend.data.getMapId({'image': self, 'vis_params': vis_params})
+        response['image'] = self
+        return response
+
+
+# Depth of the deepest expression inside a value (nodes can sit in lists, e.g. MultiPolygon parts)
+def value_depth(value):
+    if isinstance(value, Node):
+        return value._depth
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        # Numbers (most of a coordinate list) are skipped without a call
+        return max((value_depth(item) for item in value if isinstance(item, (Node, list, tuple, dict))), default=0)
+    return 0
+
+
+def encode_value(value):
+    if isinstance(value, Node):
+        return value.encode()
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_value(item) for key, item in value.items()}
+    return value
+
+
+# ee.Image, ee.Geometry...: calling it builds a node, its attributes are static constructors (ee.Image.constant)
+class Constructor:
+    def __init__(self, backend, name):
+        self._backend = backend
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        # ee.Image(image) of an existing expression is a cast, the expression itself is unchanged
+        if len(args) == 1 and not kwargs and isinstance(args[0], Node):
+            cast = object.__new__(Node)
+            cast.__dict__.update(args[0].__dict__, _kind=self._name)
+            return cast
+        return Node(self._backend, self._name, args, kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        if name[:1].isupper():
+            return Constructor(self._backend, f'{self._name}.{name}')
+        return lambda *args, **kwargs: Node(self._backend, f'{self._name}.{name}', args, kwargs)
+
+
+# The fake module: install() puts it in sys.modules['ee'] before the app modules are imported
+class FakeEarthEngine(types.ModuleType):
+    CONSTRUCTORS = (
+        'Image', 'ImageCollection', 'Geometry', 'Filter', 'Reducer', 'List', 'Dictionary', 'Number',
+        'String', 'Date', 'DateRange', 'Feature', 'FeatureCollection', 'Algorithms', 'Kernel', 'Terrain',
+    )
+
+    def __init__(self, latency=0.05, responses=None):
+        super().__init__('ee')
+        self.latency = latency
+        # Optional getInfo answers by operation name: {'reduceRegion': lambda node: {...}}
+        self.responses = dict(responses or {})
+        self.recorder = Recorder()
+        self.EEException = EEException
+        for name in self.CONSTRUCTORS:
+            setattr(self, name, Constructor(self, name))
+        self.data = types.SimpleNamespace(
+            computeValue=self.compute_value,
+            getMapId=self.get_map_id,
+            computePixels=self.compute_pixels,
+        )
+        self.__version__ = 'fake'
+
+    def Initialize(self, *args, **kwargs):
+        self.round_trip('Initialize', None, lambda: None)
+
+    def Authenticate(self, *args, **kwargs):
+        return True
+
+    # Functions passed to map/iterate are called once with a placeholder, as the client library does
+    def capture(self, value):
+        if callable(value) and not isinstance(value, (Node, Constructor)):
+            return value(Node(self, 'variable'))
+        return value
+
+    def round_trip(self, name, node, response):
+        payload_bytes = node.payload_bytes() if node is not None else 0
+        self.recorder.round_trip(name, payload_bytes, node._depth if node is not None else 0)
+        if self.latency:
+            time.sleep(self.latency)
+        return response()
+
+    def info(self, node):
+        if node._name in self.responses:
+            return self.responses[node._name](node)
+        if node._name == 'reduceRegion':
+            return {'groups': []}
+        if node._name in ('Number', 'Number.parse'):
+            return node._args[0] if node._args else 0
+        if node._kind == 'FeatureCollection':
+            return {'type': 'FeatureCollection', 'features': []}
+        return None
+
+    def compute_value(self, node):
+        return self.round_trip('getInfo', node, lambda: self.info(node))
+
+    def get_map_id(self, request):
+        image = request['image']
+
+        def response():
+            mapid = 'fake-' + hashlib.sha1(image.serialize().encode('utf-8')).hexdigest()[:16]
+            return {
+                'mapid': mapid,
+                'token': '',
+                'tile_fetcher': types.SimpleNamespace(url_format=f'https://fake-ee.invalid/map/{mapid}/{{z}}/{{x}}/{{y}}'),
+            }
+        return self.round_trip('getMapId', image, response)
+
+    def compute_pixels(self, request):
+        dimensions = request['grid']['dimensions']
+        expression = request['expression']
+        return self.round_trip(
+            'computePixels', expression,
+            lambda: np.zeros((dimensions['height'], dimensions['width']), dtype=np.float32),
+        )
+
+    def install(self):
+        sys.modules['ee'] = self
+        return self
@@ -0,0 +1,239 @@
+import argparse
+import io
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Benchmarks of the app against the fake Earth Engine (fake_ee.py), for AOIs of increasing size:
+# Earth Engine round trips, payload bytes, expression depth, wall time and peak memory per case.
+# Results are compared with baseline.json and the run fails on a regression; --save-baseline rewrites it.
+# Only the metrics that depend on the code alone are gated by default; wall time and memory depend on the
+# machine and are gated with --gate-timing, each wall time relative to a calibration run just before it.
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [REPO_DIR, BENCHMARKS_DIR]
+
+from fake_ee import FakeEarthEngine  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+# Simulated latency of one Earth Engine round trip, in seconds
+DEFAULT_LATENCY = 0.05
+# AOIs as (number of polygons, vertices per polygon)
+AOI_SIZES = [(1, 64), (16, 256), (64, 512)]
+# Allowed growth over the baseline before a metric counts as a regression: (relative, absolute)
+TOLERANCES = {
+    'round_trips': (0.0, 0),
+    'payload_bytes': (0.10, 0),
+    'max_depth': (0.0, 0),
+}
+# Machine-dependent metrics, only gated with --gate-timing
+TIMING_TOLERANCES = {
+    'wall_seconds': (0.50, 0.25),
+    'peak_memory_mb': (0.25, 2.0),
+}
+APP_TIMEOUT = 300
+
+
+# GeoJSON upload of `features` circles with `vertices` points each, spread over a few degrees
+def make_upload(features, vertices, center=(10.85, 36.45)):
+    columns = math.ceil(math.sqrt(features))
+    polygons = []
+    for index in range(features):
+        cx = center[0] + (index % columns) * 0.05
+        cy = center[1] + (index // columns) * 0.05
+        angles = [2 * math.pi * step / vertices for step in range(vertices)]
+        ring = [[cx + 0.02 * math.cos(angle), cy + 0.02 * math.sin(angle)] for angle in angles]
+        polygons.append({
+            'type': 'Feature',
+            'properties': {'index': index},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring + ring[:1]]},
+        })
+    data = json.dumps({'type': 'FeatureCollection', 'features': polygons}).encode('utf-8')
+    upload = io.BytesIO(data)
+    # The attributes of a Streamlit UploadedFile the app reads
+    upload.name = f'aoi_{features}x{vertices}.geojson'
+    upload.size = len(data)
+    upload.file_id = f'benchmark-{features}x{vertices}'
+    return upload
+
+
+# Seconds of a fixed pure-Python, JSON and NumPy workload (best of a few runs). It is timed right before
+# every case, so wall times can be compared between machines, or on a host whose speed drifts, as multiples of it.
+def calibrate(repeats=3):
+    import numpy as np
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        sum(math.sqrt(value) for value in range(200000))
+        json.dumps([[value * 0.5, value * 0.25] for value in range(100000)])
+        np.sort(np.random.default_rng(0).random(1000000))
+        timings.append(time.perf_counter() - started)
+    return round(min(timings), 4)
+
+
+# Run function once and collect the fake Earth Engine counters, wall time and peak traced memory
+def measure(fake_ee, function):
+    calibration = calibrate()
+    fake_ee.recorder.reset()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        function()
+    finally:
+        wall_seconds = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    result = fake_ee.recorder.snapshot()
+    result.update({
+        'wall_seconds': round(wall_seconds, 4),
+        'calibration_seconds': calibration,
+        'peak_memory_mb': round(peak / 1024 ** 2, 3),
+    })
+    return result
+
+
+def clear_shared_caches():
+    from map_cache import map_id_cache
+    from result_cache import shared_results
+    map_id_cache.clear()
+    shared_results.clear()
+
+
+def benchmark_upload(fake_ee, features, vertices):
+    import app
+    from stages import StageGraph
+    upload = make_upload(features, vertices)
+    return measure(fake_ee, lambda: app.upload_files_proc([upload], 0, StageGraph()))
+
+
+def benchmark_sat_collection(fake_ee, features, vertices):
+    from pipeline import load_aoi, satCollection
+    aoi, _, _ = load_aoi([make_upload(features, vertices)])
+    vis_params = {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 1}
+    return measure(fake_ee, lambda: satCollection(85, '2024-06-01', '2024-06-08', aoi).median().getMapId(vis_params))
+
+
+def benchmark_composite(fake_ee, features, vertices):
+    from pipeline import filtered_collection, load_aoi, sat_composite
+    aoi, _, _ = load_aoi([make_upload(features, vertices)])
+    vis_params = {'bands': ['B4', 'B3', 'B2'], 'min': 0, 'max': 1}
+    return measure(fake_ee, lambda: sat_composite(filtered_collection(85, '2024-06-01', '2024-06-08', aoi), aoi).getMapId(vis_params))
+
+
+# Full reruns of app.py with streamlit's AppTest: the first run, an identical rerun, then a rerun comparing two dates
+def benchmark_app(fake_ee, features, vertices):
+    from streamlit.testing.v1 import AppTest
+
+    upload = make_upload(features, vertices)
+    clear_shared_caches()
+    results = {}
+    # AppTest cannot drive a file uploader, the benchmark AOI is returned in its place
+    with mock.patch('streamlit.file_uploader', lambda *args, **kwargs: [upload]):
+        app_test = AppTest.from_file(os.path.join(REPO_DIR, 'app.py'), default_timeout=APP_TIMEOUT)
+
+        def run(step):
+            upload.seek(0)
+            step()
+            if app_test.exception:
+                raise RuntimeError(f"app.py failed: {app_test.exception[0].message}")
+
+        results['main_first_run'] = measure(fake_ee, lambda: run(app_test.run))
+        results['main_rerun'] = measure(fake_ee, lambda: run(app_test.run))
+
+        def change_initial_date():
+            app_test.date_input[0].set_value((datetime.today() - timedelta(days=32)).date())
+            next(button for button in app_test.button if button.label == "Generate map").click()
+            app_test.run()
+        results['main_two_dates'] = measure(fake_ee, lambda: run(change_initial_date))
+    return results
+
+
+def run_benchmarks(latency, sizes, include_app=True):
+    fake_ee = FakeEarthEngine(latency=latency).install()
+    results = {}
+    for features, vertices in sizes:
+        size = f'{features}x{vertices}'
+        results[f'upload_files_proc[{size}]'] = benchmark_upload(fake_ee, features, vertices)
+        results[f'satCollection[{size}]'] = benchmark_sat_collection(fake_ee, features, vertices)
+        results[f'sat_composite[{size}]'] = benchmark_composite(fake_ee, features, vertices)
+        if include_app:
+            for name, result in benchmark_app(fake_ee, features, vertices).items():
+                results[f'{name}[{size}]'] = result
+    return results
+
+
+# Metrics above the baseline by more than their tolerance, as (case, metric, baseline, value). Baseline wall
+# times are first scaled by the ratio of the case's calibration to the baseline's.
+def regressions(results, baseline, tolerances=TOLERANCES):
+    found = []
+    for case, result in results.items():
+        reference = baseline.get(case)
+        if reference is None:
+            continue
+        for metric, (relative, absolute) in tolerances.items():
+            if metric not in reference:
+                continue
+            expected = reference[metric]
+            if metric == 'wall_seconds' and reference.get('calibration_seconds'):
+                expected *= result['calibration_seconds'] / reference['calibration_seconds']
+            if result[metric] > expected * (1 + relative) + absolute:
+                found.append((case, metric, round(expected, 4), result[metric]))
+    return found
+
+
+def print_results(results):
+    print(f"{'case':<36} {'round trips':>11} {'payload KB':>11} {'depth':>6} {'wall s':>8} {'calib s':>8} {'peak MB':>8}")
+    for case, result in results.items():
+        print(
+            f"{case:<36} {result['round_trips']:>11} {result['payload_bytes'] / 1024:>11.1f} {result['max_depth']:>6} "
+            f"{result['wall_seconds']:>8.3f} {result['calibration_seconds']:>8.3f} {result['peak_memory_mb']:>8.2f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the app against a fake Earth Engine and compare with a baseline")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="seconds per simulated round trip")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--skip-app', action='store_true', help="skip the full app.py reruns")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    parser.add_argument('--gate-timing', action='store_true',
+                        help="also fail on wall time (relative to the calibration runs) and peak memory regressions")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.latency, AOI_SIZES, include_app=not args.skip_app)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({'latency': args.latency, 'cases': results}, baseline_file, indent=2, sort_keys=True)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("no baseline to compare with, run with --save-baseline first")
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline.get('latency') != args.latency:
+        print(f"warning: baseline recorded with latency {baseline.get('latency')}s, this run uses {args.latency}s")
+
+    found = regressions(results, baseline['cases'])
+    if args.gate_timing:
+        found += regressions(results, baseline['cases'], TIMING_TOLERANCES)
+    for case, metric, reference, value in found:
+        print(f"REGRESSION {case} {metric}: {reference} -> {value}")
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import ee
+import numpy as np
+
+# NDVI classes breakpoint table: (class value, lower NDVI bound, legend label)
+# A pixel belongs to the last class whose lower bound it reaches, masked pixels (water) have no class.
+NDVI_CLASSES = (
+    (1, 0.0, "Absent Vegetation. (Water/Clouds/Built-up/Rocks/Sand Surfaces..)"),
+    (2, 0.15, "Bare Soil."),
+    (3, 0.25, "Low Vegetation."),
+    (4, 0.35, "Light Vegetation."),
+    (5, 0.45, "Moderate Vegetation."),
+    (6, 0.65, "Strong Vegetation."),
+    (7, 0.75, "Dense Vegetation."),
+)
+NDVI_CLASS_BREAKS = tuple(lower for _, lower, _ in NDVI_CLASSES)
+# Class value of masked pixels in local arrays
+NODATA_CLASS = 0
+
+# Sentinel-2 B4/B8 pixel size in meters, used for the area reduction
+CLASS_SCALE = 10
+SQUARE_METERS_PER_HECTARE = 10000
+
+
+# Server side: one digitize-style operation, the number of lower bounds each pixel reaches is its class
+def classify_ndvi(masked_image, breaks=NDVI_CLASS_BREAKS):
+    masked_image = ee.Image(masked_image)
+    return masked_image.gte(ee.Image.constant(list(breaks))) \
+        .reduce(ee.Reducer.sum()) \
+        .updateMask(masked_image.mask()) \
+        .toByte() \
+        .rename('ndvi_class')
+
+
+# Local side: the same classification with np.digitize, NODATA_CLASS where the NDVI is masked (NaN)
+def classify_ndvi_array(masked_ndvi, breaks=NDVI_CLASS_BREAKS):
+    classified = np.digitize(masked_ndvi, breaks).astype(np.uint8)
+    classified[np.isnan(masked_ndvi)] = NODATA_CLASS
+    return classified
+
+
+# Class table rows (class, label, pixels, hectares, share) from per-class pixel counts and areas
+def class_table(pixel_counts, areas):
+    total_area = sum(areas.get(value, 0.0) for value, _, _ in NDVI_CLASSES)
+    rows = []
+    for value, _, label in NDVI_CLASSES:
+        area = areas.get(value, 0.0)
+        rows.append({
+            'class': value,
+            'label': label,
+            'pixels': int(pixel_counts.get(value, 0)),
+            'hectares': area / SQUARE_METERS_PER_HECTARE,
+            'share': area / total_area if total_area else 0.0,
+        })
+    return rows
+
+
+# Per-class pixel count and area of a classified image over the AOI in a single grouped reduction
+def class_area_statistics(classified_image, aoi, scale=CLASS_SCALE):
+    reducer = ee.Reducer.sum() \
+        .combine(reducer2=ee.Reducer.count(), sharedInputs=True) \
+        .group(groupField=1, groupName='class')
+    result = ee.Image.pixelArea().addBands(classified_image).reduceRegion(
+        reducer=reducer,
+        geometry=aoi,
+        scale=scale,
+        maxPixels=1e13,
+        tileScale=4,
+    ).getInfo()
+
+    groups = result.get('groups', [])
+    pixel_counts = {int(group['class']): group['count'] for group in groups}
+    areas = {int(group['class']): group['sum'] for group in groups}
+    return class_table(pixel_counts, areas)
+
+
+# Local per-class pixel counts with np.bincount, indexed by class value (NODATA_CLASS first)
+def class_pixel_counts(classified):
+    return np.bincount(np.asarray(classified).ravel(), minlength=len(NDVI_CLASSES) + 1)
+
+
+# Local counterpart of class_area_statistics from per-class pixel counts (class_pixel_counts, possibly summed
+# over tiles), pixel_area in square meters
+def class_area_statistics_array(class_counts, pixel_area=CLASS_SCALE * CLASS_SCALE):
+    pixel_counts = {value: int(class_counts[value]) for value, _, _ in NDVI_CLASSES}
+    areas = {value: count * pixel_area for value, count in pixel_counts.items()}
+    return class_table(pixel_counts, areas)
+
+
+# Merge class tables computed over disjoint parts of an AOI (e.g. partition cells) into one table
+def merge_class_tables(tables):
+    pixel_counts = {}
+    areas = {}
+    for table in tables:
+        for row in table:
+            pixel_counts[row['class']] = pixel_counts.get(row['class'], 0) + row['pixels']
+            areas[row['class']] = areas.get(row['class'], 0.0) + row['hectares'] * SQUARE_METERS_PER_HECTARE
+    return class_table(pixel_counts, areas)
+
+
+# Change detection: a pixel's transition code is initial class * TRANSITION_BASE + updated class (e.g. 35 = class 3 -> 5)
+TRANSITION_BASE = 10
+
+
+def transition_image(initial_classified, updated_classified):
+    return ee.Image(initial_classified).multiply(TRANSITION_BASE) \
+        .add(ee.Image(updated_classified)) \
+        .toByte() \
+        .rename('transition')
+
+
+# Transition table rows (from/to class and label, pixels, hectares, share, mean NDVI change) for every class pair
+def transition_table(pixel_counts, areas, delta_sums):
+    total_area = sum(areas.values())
+    rows = []
+    for from_value, _, from_label in NDVI_CLASSES:
+        for to_value, _, to_label in NDVI_CLASSES:
+            code = from_value * TRANSITION_BASE + to_value
+            pixels = int(pixel_counts.get(code, 0))
+            area = areas.get(code, 0.0)
+            rows.append({
+                'from_class': from_value,
+                'from_label': from_label,
+                'to_class': to_value,
+                'to_label': to_label,
+                'pixels': pixels,
+                'hectares': area / SQUARE_METERS_PER_HECTARE,
+                'share': area / total_area if total_area else 0.0,
+                'mean_delta': delta_sums.get(code, 0.0) / pixels if pixels else None,
+            })
+    return rows
+
+
+# Pixel count, area and mean NDVI change of every class transition between two dates in a single grouped
+# reduction: pixel area -> sum and count, delta NDVI -> mean, grouped by the transition code
+def transition_statistics(delta_ndvi, transitions, aoi, scale=CLASS_SCALE):
+    reducer = ee.Reducer.sum() \
+        .combine(reducer2=ee.Reducer.count(), sharedInputs=True) \
+        .combine(reducer2=ee.Reducer.mean(), outputPrefix='delta_', sharedInputs=False) \
+        .group(groupField=2, groupName='transition')
+    result = ee.Image.pixelArea().addBands(delta_ndvi).addBands(transitions).reduceRegion(
+        reducer=reducer,
+        geometry=aoi,
+        scale=scale,
+        maxPixels=1e13,
+        tileScale=4,
+    ).getInfo()
+
+    groups = result.get('groups', [])
+    pixel_counts = {int(group['transition']): group['count'] for group in groups}
+    areas = {int(group['transition']): group['sum'] for group in groups}
+    delta_sums = {int(group['transition']): group['delta_mean'] * group['count'] for group in groups}
+    return transition_table(pixel_counts, areas, delta_sums)
+
+
+# Merge transition tables computed over disjoint parts of an AOI into one table
+def merge_transition_tables(tables):
+    pixel_counts = {}
+    areas = {}
+    delta_sums = {}
+    for table in tables:
+        for row in table:
+            code = row['from_class'] * TRANSITION_BASE + row['to_class']
+            pixel_counts[code] = pixel_counts.get(code, 0) + row['pixels']
+            areas[code] = areas.get(code, 0.0) + row['hectares'] * SQUARE_METERS_PER_HECTARE
+            delta_sums[code] = delta_sums.get(code, 0.0) + (row['mean_delta'] or 0.0) * row['pixels']
+    return transition_table(pixel_counts, areas, delta_sums)
+
+# 7x7 matrix (rows: initial class, columns: updated class) of one transition table field
+def transition_matrix(rows, field='hectares'):
+    matrix = np.zeros((len(NDVI_CLASSES), len(NDVI_CLASSES)))
+    for row in rows:
+        matrix[row['from_class'] - 1, row['to_class'] - 1] = row[field] or 0.0
+    return matrix
@@ -0,0 +1,69 @@
+import logging
+import threading
+import time
+
+import ee
+
+import startup
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two health checks of the shared Earth Engine session
+HEALTH_CHECK_INTERVAL = 10 * 60
+
+# One Earth Engine session per process, shared by every Streamlit session and rerun
+session = {
+    'initialized': False,
+    'project': None,
+    'initialized_at': None,
+    'checked_at': None,
+    'healthy': None,
+    'error': None,
+}
+_lock = threading.Lock()
+
+
+def initialize(project):
+    with _lock:
+        if session['initialized']:
+            return session
+        with startup.measure('ee.Initialize'):
+            try:
+                ee.Initialize(project=project)
+            except ee.EEException:
+                # Interactive authentication through geemap, only imported when it is needed
+                geemap = startup.timed_import('geemap')
+                geemap.ee_initialize()
+        session.update({
+            'initialized': True,
+            'project': project,
+            'initialized_at': time.time(),
+            'checked_at': time.monotonic(),
+            'healthy': True,
+            'error': None,
+        })
+        logger.info("Earth Engine initialized for project %s", project)
+    return session
+
+
+# Cheap server round trip at most once per interval, a failing session is initialized again on the next call
+def health_check(interval=HEALTH_CHECK_INTERVAL):
+    with _lock:
+        checked_at = session['checked_at']
+        if session['initialized'] and checked_at is not None and time.monotonic() - checked_at < interval:
+            return session['healthy']
+
+    try:
+        ee.Number(1).getInfo()
+        healthy, error = True, None
+    except Exception as exception:
+        healthy, error = False, str(exception)
+        logger.warning("Earth Engine health check failed: %s", exception)
+
+    with _lock:
+        session['checked_at'] = time.monotonic()
+        session['healthy'] = healthy
+        session['error'] = error
+        if not healthy:
+            session['initialized'] = False
+    return healthy
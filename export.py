@@ -0,0 +1,266 @@
+import json
+import math
+import os
+import shutil
+import struct
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import ee
+import numpy as np
+
+from geometry import METERS_PER_DEGREE
+from partition import fetch_cell_pixels
+from pipeline import call_with_retry
+from raster import tile_windows
+import tracing
+
+# Chunked export of NDVI products: the AOI bbox is downloaded in fixed-size pixel chunks on a thread pool,
+# each chunk is written straight into a memory-mapped array, and the result is saved as a tiled GeoTIFF or
+# an NPZ with its geotransform. Finished chunks are recorded so an interrupted export resumes.
+
+# Sentinel-2 B4/B8 pixel size, in degrees for the EPSG:4326 export grid
+DEFAULT_PIXEL_SIZE = 10 / METERS_PER_DEGREE
+DEFAULT_CHUNK_SIZE = 1024
+# computePixels refuses requests above 48 MB, stay well below it
+MAX_CHUNK_BYTES = 32 * 1024 * 1024
+EXPORT_WORKERS = 6
+EXPORT_RETRIES = 4
+GEOTIFF_TILE_SIZE = 256
+# Largest raster an export writes, checked before any chunk is downloaded. Classic TIFF offsets are 32-bit,
+# so GeoTIFFs must also stay under 4 GiB including the edge tile padding.
+MAX_EXPORT_BYTES = 2 * 1024 ** 3
+MAX_GEOTIFF_BYTES = 2 ** 32 - 1
+
+# Products the app can export: (dtype, nodata value)
+PRODUCT_TYPES = {
+    'ndvi': (np.float32, -9999.0),
+    'classified': (np.uint8, 0),
+}
+
+
+# (height, width) in pixels of the export grid over bbox
+def raster_shape(bbox, pixel_size):
+    return int(math.ceil((bbox[3] - bbox[1]) / pixel_size)), int(math.ceil((bbox[2] - bbox[0]) / pixel_size))
+
+
+# Bytes of the raster an export of product over bbox writes (the memmap, and the GeoTIFF pixel data)
+def estimate_export_bytes(bbox, pixel_size, product='ndvi'):
+    height, width = raster_shape(bbox, pixel_size)
+    return height * width * np.dtype(PRODUCT_TYPES[product][0]).itemsize
+
+
+# Refuse rasters whose GeoTIFF (padded tiles, their offset and byte count entries, under 1 KB of tags)
+# would not fit the 32-bit offsets
+def check_geotiff_size(height, width, itemsize, tile_size=GEOTIFF_TILE_SIZE):
+    tile_count = math.ceil(width / tile_size) * math.ceil(height / tile_size)
+    if tile_count * (tile_size * tile_size * itemsize + 8) + 1024 > MAX_GEOTIFF_BYTES:
+        raise ValueError("raster too large for a classic TIFF (4 GiB), export it as NPZ or with a larger pixel size")
+
+
+def chunk_box(bbox, pixel_size, window):
+    row_start, row_end, col_start, col_end = window
+    return [
+        bbox[0] + col_start * pixel_size,
+        bbox[3] - row_end * pixel_size,
+        bbox[0] + col_end * pixel_size,
+        bbox[3] - row_start * pixel_size,
+    ]
+
+
+def read_done_chunks(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path) as chunks_file:
+            for line in chunks_file:
+                try:
+                    done.add(tuple(json.loads(line)))
+                except ValueError:
+                    # Line cut short by an interruption, that chunk is downloaded again
+                    continue
+    return done
+
+
+# Download image pixels over bbox into a memmap, resuming from parts_dir; returns the memmap
+def download_chunks(image, bbox, pixel_size, parts_dir, dtype=np.float32, nodata=-9999.0,
+                    chunk_size=DEFAULT_CHUNK_SIZE, workers=EXPORT_WORKERS, retries=EXPORT_RETRIES, progress=None):
+    height, width = raster_shape(bbox, pixel_size)
+    # Keep every request inside the download size limit
+    chunk_size = min(chunk_size, int(math.sqrt(MAX_CHUNK_BYTES / np.dtype(dtype).itemsize)))
+
+    os.makedirs(parts_dir, exist_ok=True)
+    raster_path = os.path.join(parts_dir, 'raster.npy')
+    chunks_path = os.path.join(parts_dir, 'chunks.jsonl')
+    settings_path = os.path.join(parts_dir, 'settings.json')
+    settings = {'bbox': list(bbox), 'pixel_size': pixel_size, 'dtype': np.dtype(dtype).str, 'chunk_size': chunk_size}
+
+    # Resume only when the previous run used the same grid
+    resumable = os.path.exists(raster_path) and os.path.exists(settings_path)
+    if resumable:
+        with open(settings_path) as settings_file:
+            resumable = json.load(settings_file) == settings
+    if resumable:
+        raster = np.load(raster_path, mmap_mode='r+')
+        done = read_done_chunks(chunks_path)
+    else:
+        raster = np.lib.format.open_memmap(raster_path, mode='w+', dtype=dtype, shape=(height, width))
+        raster[:] = nodata
+        raster.flush()
+        with open(settings_path, 'w') as settings_file:
+            json.dump(settings, settings_file)
+        if os.path.exists(chunks_path):
+            os.remove(chunks_path)
+        done = set()
+
+    windows = tile_windows(height, width, chunk_size)
+    pending = [window for window in windows if tuple(window) not in done]
+    masked_image = ee.Image(image).unmask(nodata, False)
+
+    def fetch(window):
+        box = chunk_box(bbox, pixel_size, window)
+        return call_with_retry(lambda: fetch_cell_pixels(masked_image, box, pixel_size), retries)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor, open(chunks_path, 'a') as chunks_file:
+        futures = {executor.submit(tracing.bind(fetch), window): window for window in pending}
+        for completed, future in enumerate(as_completed(futures), start=len(windows) - len(pending) + 1):
+            window = futures[future]
+            row_start, row_end, col_start, col_end = window
+            try:
+                pixels = future.result()
+            except BaseException:
+                # Stop queued downloads, the finished chunks are kept for the next run
+                for pending_future in futures:
+                    pending_future.cancel()
+                raise
+            raster[row_start:row_end, col_start:col_end] = pixels[:row_end - row_start, :col_end - col_start]
+            raster.flush()
+            # Recorded only once the chunk is on disk
+            chunks_file.write(json.dumps(list(window)) + '\n')
+            chunks_file.flush()
+            if progress is not None:
+                progress(completed, len(windows))
+
+    return raster
+
+
+# GDAL-style geotransform of the export grid: (origin x, pixel width, 0, origin y, 0, -pixel height)
+def geotransform(bbox, pixel_size):
+    return (bbox[0], pixel_size, 0.0, bbox[3], 0.0, -pixel_size)
+
+
+def save_npz(path, raster, bbox, pixel_size, nodata):
+    np.savez(
+        path,
+        data=raster,
+        geotransform=np.array(geotransform(bbox, pixel_size)),
+        crs='EPSG:4326',
+        nodata=nodata,
+    )
+
+
+# Minimal tiled, uncompressed single-band GeoTIFF in EPSG:4326, written tile by tile from the array
+def save_geotiff(path, raster, bbox, pixel_size, nodata, tile_size=GEOTIFF_TILE_SIZE):
+    height, width = raster.shape
+    dtype = raster.dtype
+    sample_format = 3 if np.issubdtype(dtype, np.floating) else (2 if np.issubdtype(dtype, np.signedinteger) else 1)
+    tiles_across = math.ceil(width / tile_size)
+    tiles_down = math.ceil(height / tile_size)
+    tile_bytes = tile_size * tile_size * dtype.itemsize
+    tile_count = tiles_across * tiles_down
+    check_geotiff_size(height, width, dtype.itemsize, tile_size)
+
+    nodata_text = (str(nodata) + '\0').encode('ascii')
+    geo_keys = [
+        1, 1, 0, 3,
+        1024, 0, 1, 2,      # GTModelTypeGeoKey: geographic
+        1025, 0, 1, 1,      # GTRasterTypeGeoKey: pixel is area
+        2048, 0, 1, 4326,   # GeographicTypeGeoKey: WGS 84
+    ]
+    # (tag, type, values): types 3 SHORT, 4 LONG, 12 DOUBLE, 2 ASCII
+    tags = [
+        (256, 4, [width]),
+        (257, 4, [height]),
+        (258, 3, [dtype.itemsize * 8]),
+        (259, 3, [1]),
+        (262, 3, [1]),
+        (277, 3, [1]),
+        (284, 3, [1]),
+        (322, 3, [tile_size]),
+        (323, 3, [tile_size]),
+        (324, 4, None),
+        (325, 4, [tile_bytes] * tile_count),
+        (339, 3, [sample_format]),
+        (33550, 12, [pixel_size, pixel_size, 0.0]),
+        (33922, 12, [0.0, 0.0, 0.0, bbox[0], bbox[3], 0.0]),
+        (34735, 3, geo_keys),
+        (42113, 2, nodata_text),
+    ]
+    type_formats = {2: 'c', 3: 'H', 4: 'I', 12: 'd'}
+    type_sizes = {2: 1, 3: 2, 4: 4, 12: 8}
+
+    # Layout: header, IFD, out-of-line tag values, then the tiles
+    ifd_offset = 8
+    ifd_size = 2 + 12 * len(tags) + 4
+    extra_offset = ifd_offset + ifd_size
+    extra_sizes = {}
+    for tag, field_type, values in tags:
+        count = tile_count if values is None else len(values)
+        size = count * type_sizes[field_type]
+        if size > 4:
+            extra_sizes[tag] = size
+    data_offset = extra_offset + sum(size + size % 2 for size in extra_sizes.values())
+    tile_offsets = [data_offset + index * tile_bytes for index in range(tile_count)]
+
+    with open(path, 'wb') as tiff:
+        tiff.write(b'II*\0' + struct.pack('<I', ifd_offset))
+        tiff.write(struct.pack('<H', len(tags)))
+        extra = b''
+        for tag, field_type, values in tags:
+            if values is None:
+                values = tile_offsets
+            count = len(values)
+            if field_type == 2:
+                packed = bytes(values)
+            else:
+                packed = struct.pack(f'<{count}{type_formats[field_type]}', *values)
+            if len(packed) <= 4:
+                tiff.write(struct.pack('<HHI', tag, field_type, count) + packed.ljust(4, b'\0'))
+            else:
+                tiff.write(struct.pack('<HHII', tag, field_type, count, extra_offset + len(extra)))
+                extra += packed + (b'\0' if len(packed) % 2 else b'')
+        tiff.write(struct.pack('<I', 0))
+        tiff.write(extra)
+
+        # Edge tiles are padded with nodata to the full tile size
+        for tile_row in range(tiles_down):
+            for tile_col in range(tiles_across):
+                tile = np.full((tile_size, tile_size), nodata, dtype=dtype.newbyteorder('<'))
+                block = raster[tile_row * tile_size:(tile_row + 1) * tile_size, tile_col * tile_size:(tile_col + 1) * tile_size]
+                tile[:block.shape[0], :block.shape[1]] = block
+                tiff.write(tile.tobytes())
+
+
+# Export one product over the AOI bbox to output_path (.tif or .npz), resumable through output_path + '.parts'.
+# Rasters above max_bytes, or GeoTIFFs above the classic TIFF limit, are refused before downloading anything.
+def export_product(image, bbox, output_path, product='ndvi', pixel_size=DEFAULT_PIXEL_SIZE,
+                   chunk_size=DEFAULT_CHUNK_SIZE, workers=EXPORT_WORKERS, retries=EXPORT_RETRIES, progress=None,
+                   max_bytes=MAX_EXPORT_BYTES):
+    dtype, nodata = PRODUCT_TYPES[product]
+    height, width = raster_shape(bbox, pixel_size)
+    raster_bytes = estimate_export_bytes(bbox, pixel_size, product)
+    if raster_bytes > max_bytes:
+        raise ValueError(
+            f"{width}x{height} pixel raster ({raster_bytes / 1024 ** 2:,.0f} MB) is above the "
+            f"{max_bytes / 1024 ** 2:,.0f} MB export limit, use a larger pixel size"
+        )
+    if not output_path.endswith('.npz'):
+        check_geotiff_size(height, width, np.dtype(dtype).itemsize)
+    parts_dir = output_path + '.parts'
+    raster = download_chunks(image, bbox, pixel_size, parts_dir, dtype, nodata, chunk_size, workers, retries, progress)
+
+    if output_path.endswith('.npz'):
+        save_npz(output_path, raster, bbox, pixel_size, nodata)
+    else:
+        save_geotiff(output_path, raster, bbox, pixel_size, nodata)
+    del raster
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    return output_path
@@ -0,0 +1,165 @@
+import codecs
+import json
+import re
+
+# Number of bytes read from the uploaded file at a time
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\r\n'
+STRUCTURE_RE = re.compile(r'["{}\[\]]')
+STRING_RE = re.compile(r'["\\]')
+SCALAR_END_RE = re.compile(r'[,\]}\s]')
+
+
+# Incremental reader over a binary stream: only the JSON value being scanned is held in memory
+class JSONScanner:
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    # Drop the consumed part of the buffer and append the next chunk
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        if not chunk:
+            self.eof = True
+            text = self.decoder.decode(b'', final=True)
+        else:
+            self.bytes_read += len(chunk)
+            text = self.decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    # Returns the next non-whitespace character without consuming it, '' at the end of the stream
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at byte {self.bytes_read}")
+        self.pos += 1
+
+    # Scans one complete JSON value and returns its text, or None when keep is False (value skipped)
+    def scan_value(self, keep=True):
+        first = self.peek()
+        if first == '':
+            raise ValueError("unexpected end of GeoJSON file")
+        # Anchor the value at the start of the buffer so indices survive refills
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+
+        index = 0
+        depth = 0
+        in_string = False
+        scalar = first not in '{["'
+        while True:
+            if index >= len(self.buffer):
+                if self.eof and scalar:
+                    break
+                # When skipping, the scanned part of the value can be released
+                drop = 0 if keep else min(index, len(self.buffer))
+                self.pos = drop
+                if not self.fill():
+                    raise ValueError("unexpected end of GeoJSON file")
+                index -= drop
+                continue
+
+            if scalar:
+                match = SCALAR_END_RE.search(self.buffer, index)
+                if match is None:
+                    index = len(self.buffer)
+                    continue
+                index = match.start()
+                break
+
+            if in_string:
+                match = STRING_RE.search(self.buffer, index)
+                if match is None:
+                    index = len(self.buffer)
+                    continue
+                index = match.end()
+                if match.group() == '\\':
+                    # Skip the escaped character
+                    index += 1
+                    continue
+                in_string = False
+                if depth == 0:
+                    break
+                continue
+
+            match = STRUCTURE_RE.search(self.buffer, index)
+            if match is None:
+                index = len(self.buffer)
+                continue
+            index = match.end()
+            char = match.group()
+            if char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    break
+
+        text = self.buffer[:index] if keep else None
+        self.pos = index
+        return text
+
+    def read_value(self):
+        return json.loads(self.scan_value())
+
+
+# Yields the geometries of a GeoJSON FeatureCollection/GeometryCollection one feature at a time
+def iter_geometries(stream, chunk_size=CHUNK_SIZE):
+    scanner = JSONScanner(stream, chunk_size)
+    if scanner.peek() != '{':
+        # Unexpected file format, nothing to read
+        return
+    scanner.pos += 1
+
+    streamed_list = False
+    while True:
+        char = scanner.peek()
+        if char in ('}', ''):
+            return
+        if char == ',':
+            scanner.pos += 1
+            continue
+
+        key = scanner.read_value()
+        scanner.expect(':')
+
+        # Only the first 'features' or 'geometries' list is used, the same as a whole-file read
+        if key in ('features', 'geometries') and not streamed_list and scanner.peek() == '[':
+            streamed_list = True
+            scanner.pos += 1
+            while True:
+                char = scanner.peek()
+                if char == ']':
+                    scanner.pos += 1
+                    break
+                if char == ',':
+                    scanner.pos += 1
+                    continue
+                element = scanner.read_value()
+                geometry = element if key == 'geometries' else (element.get('geometry') if isinstance(element, dict) else None)
+                if isinstance(geometry, dict) and 'coordinates' in geometry:
+                    yield geometry
+        else:
+            scanner.scan_value(keep=False)
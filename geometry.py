@@ -0,0 +1,267 @@
+import math
+
+import numpy as np
+
+# Mean Earth radius in meters, used for the equal-area (sinusoidal) projection of the rings
+EARTH_RADIUS = 6371008.8
+
+# Pixel size of the Folium map, used to pick a zoom level that fits the AOI
+MAP_WIDTH = 900
+MAP_HEIGHT = 500
+MIN_ZOOM = 2
+MAX_ZOOM = 17
+
+
+# Returns the polygons of a GeoJSON geometry as a list of rings lists
+def polygon_rings(geometry):
+    if geometry.get('type') == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry.get('type') == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"unsupported geometry type {geometry.get('type')!r}")
+
+
+# Flattening every ring of every geometry into one vertex array so the math below runs in a single pass
+def pack_geometries(geometries):
+    rings = []
+    ring_feature = []
+    ring_hole = []
+    problems = []
+
+    for index, geometry in enumerate(geometries):
+        try:
+            polygons = polygon_rings(geometry)
+            feature_rings = []
+            for polygon in polygons:
+                for ring_index, ring in enumerate(polygon):
+                    ring = np.asarray(ring, dtype=float)
+                    if ring.ndim != 2 or ring.shape[1] < 2:
+                        raise ValueError("ring is not a list of positions")
+                    ring = ring[:, :2]
+                    # GeoJSON rings are closed, close the ones that are not
+                    if len(ring) and not np.array_equal(ring[0], ring[-1]):
+                        ring = np.vstack([ring, ring[:1]])
+                    if len(ring) < 4:
+                        raise ValueError("ring has fewer than 3 distinct positions")
+                    feature_rings.append((ring, ring_index > 0))
+            if not feature_rings:
+                raise ValueError("geometry has no rings")
+        except (ValueError, TypeError, KeyError) as error:
+            problems.append((index, str(error)))
+            continue
+
+        for ring, is_hole in feature_rings:
+            rings.append(ring)
+            ring_feature.append(index)
+            ring_hole.append(is_hole)
+
+    sizes = np.array([len(ring) for ring in rings], dtype=np.int64)
+    offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    xy = np.vstack(rings) if rings else np.empty((0, 2))
+
+    return {
+        'xy': xy,
+        'offsets': offsets,
+        'ring_feature': np.array(ring_feature, dtype=np.int64),
+        'ring_hole': np.array(ring_hole, dtype=bool),
+        'problems': problems,
+    }
+
+
+# Shoelace sums per ring: twice the signed area and the first moments
+def ring_moments(x, y, offsets):
+    x_next = np.empty_like(x)
+    y_next = np.empty_like(y)
+    x_next[:-1], x_next[-1:] = x[1:], x[:1]
+    y_next[:-1], y_next[-1:] = y[1:], y[:1]
+    cross = x * y_next - x_next * y
+    # The last vertex of a ring must not be paired with the first vertex of the next ring
+    cross[offsets[1:] - 1] = 0.0
+
+    starts = offsets[:-1]
+    double_area = np.add.reduceat(cross, starts)
+    moment_x = np.add.reduceat((x + x_next) * cross, starts)
+    moment_y = np.add.reduceat((y + y_next) * cross, starts)
+    return double_area, moment_x, moment_y
+
+
+# Centroids, bounding boxes and areas of Polygon/MultiPolygon geometries computed locally, no Earth Engine call
+def summarize_geometries(geometries):
+    packed = pack_geometries(geometries)
+    problems = list(packed['problems'])
+    xy, offsets = packed['xy'], packed['offsets']
+    ring_feature, ring_hole = packed['ring_feature'], packed['ring_hole']
+    feature_count = len(geometries)
+
+    summary = {
+        'valid': np.zeros(feature_count, dtype=bool),
+        'centroids': np.full((feature_count, 2), np.nan),
+        'bboxes': np.full((feature_count, 4), np.nan),
+        'areas': np.zeros(feature_count),
+        'vertices': int(len(xy)),
+        'bbox': None,
+        'total_area': 0.0,
+        'problems': problems,
+    }
+    if not len(xy):
+        return summary
+
+    x, y = xy[:, 0], xy[:, 1]
+
+    # Per-ring validation: finite coordinates inside the lon/lat domain and a non-degenerate ring
+    starts = offsets[:-1]
+    in_range = np.isfinite(x) & np.isfinite(y) & (np.abs(x) <= 180) & (np.abs(y) <= 90)
+    ring_in_range = np.logical_and.reduceat(in_range, starts)
+    double_area, moment_x, moment_y = ring_moments(np.where(in_range, x, 0.0), np.where(in_range, y, 0.0), offsets)
+    ring_ok = ring_in_range & (double_area != 0)
+
+    bad_features = np.unique(ring_feature[~ring_ok])
+    for index in bad_features:
+        problems.append((int(index), "ring has out of range coordinates or zero area"))
+    problems.sort()
+
+    valid = np.zeros(feature_count, dtype=bool)
+    valid[np.unique(ring_feature)] = True
+    valid[bad_features] = False
+    summary['valid'] = valid
+    if not valid.any():
+        return summary
+
+    # Outer rings add area, holes remove it, whatever their winding order
+    sign = np.sign(double_area) * np.where(ring_hole, -1.0, 1.0)
+    keep = valid[ring_feature]
+    weight = np.where(keep, sign, 0.0)
+    feature_area = np.bincount(ring_feature, weights=weight * double_area / 2, minlength=feature_count)
+    feature_mx = np.bincount(ring_feature, weights=weight * moment_x / 6, minlength=feature_count)
+    feature_my = np.bincount(ring_feature, weights=weight * moment_y / 6, minlength=feature_count)
+
+    # Bounding boxes: the vertices of each feature are contiguous in the packed array
+    vertex_feature = np.repeat(ring_feature, np.diff(offsets))
+    first_ring = np.flatnonzero(np.r_[True, ring_feature[1:] != ring_feature[:-1]])
+    feature_starts = offsets[first_ring]
+    features = ring_feature[first_ring]
+    bboxes = summary['bboxes']
+    bboxes[features, 0] = np.minimum.reduceat(x, feature_starts)
+    bboxes[features, 1] = np.minimum.reduceat(y, feature_starts)
+    bboxes[features, 2] = np.maximum.reduceat(x, feature_starts)
+    bboxes[features, 3] = np.maximum.reduceat(y, feature_starts)
+    bboxes[~valid] = np.nan
+
+    centroids = summary['centroids']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        centroids[:, 0] = feature_mx / feature_area
+        centroids[:, 1] = feature_my / feature_area
+    # Features whose holes cancel their area fall back to the center of their bounding box
+    degenerate = valid & ~np.isfinite(centroids).all(axis=1)
+    centroids[degenerate, 0] = (bboxes[degenerate, 0] + bboxes[degenerate, 2]) / 2
+    centroids[degenerate, 1] = (bboxes[degenerate, 1] + bboxes[degenerate, 3]) / 2
+    centroids[~valid] = np.nan
+
+    # Area in square meters on a sinusoidal (equal-area) projection centered on the AOI
+    combined = np.array([
+        np.nanmin(bboxes[:, 0]), np.nanmin(bboxes[:, 1]),
+        np.nanmax(bboxes[:, 2]), np.nanmax(bboxes[:, 3]),
+    ])
+    central_lon = (combined[0] + combined[2]) / 2
+    lat_rad = np.radians(np.where(in_range, y, 0.0))
+    projected_x = EARTH_RADIUS * np.radians(np.where(in_range, x, 0.0) - central_lon) * np.cos(lat_rad)
+    projected_y = EARTH_RADIUS * lat_rad
+    metric_double_area, _, _ = ring_moments(projected_x, projected_y, offsets)
+    metric_sign = np.sign(metric_double_area) * np.where(ring_hole, -1.0, 1.0)
+    areas = np.bincount(ring_feature, weights=np.where(keep, metric_sign * metric_double_area / 2, 0.0), minlength=feature_count)
+    summary['areas'] = np.clip(areas, 0.0, None)
+
+    summary['vertices'] = int(np.count_nonzero(valid[vertex_feature]))
+    summary['bbox'] = combined
+    summary['total_area'] = float(summary['areas'].sum())
+    return summary
+
+
+# Map center ([lat, lon] as Folium expects) and zoom level that fit a [min_lon, min_lat, max_lon, max_lat] bbox
+def map_view(bbox, width=MAP_WIDTH, height=MAP_HEIGHT):
+    min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox)
+    center = [(min_lat + max_lat) / 2, (min_lon + max_lon) / 2]
+
+    # A Web Mercator world is 256 * 2**zoom pixels wide for 360 degrees of longitude
+    lon_span = max(max_lon - min_lon, 1e-9)
+    lat_span = max(
+        math.degrees(math.log(math.tan(math.pi / 4 + math.radians(min(max_lat, 85)) / 2)))
+        - math.degrees(math.log(math.tan(math.pi / 4 + math.radians(max(min_lat, -85)) / 2))),
+        1e-9,
+    )
+    zoom_lon = math.log2(360 * width / (256 * lon_span))
+    zoom_lat = math.log2(360 * height / (256 * lat_span))
+    zoom = int(math.floor(min(zoom_lon, zoom_lat)))
+    return center, max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+
+
+# Meters per degree of latitude, used to express the simplification tolerance in meters
+METERS_PER_DEGREE = 111320.0
+
+
+# Douglas-Peucker on an open line of projected points, distances to each chord are computed in one vectorized step
+def douglas_peucker_mask(points, tolerance):
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[start + 1:end]
+        chord = points[end] - points[start]
+        offsets = segment - points[start]
+        chord_length = np.hypot(chord[0], chord[1])
+        if chord_length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(chord[0] * offsets[:, 1] - chord[1] * offsets[:, 0]) / chord_length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+# Simplifies one closed ring, tolerance in meters; rings that would collapse are returned unchanged
+def simplify_ring(ring, tolerance):
+    ring = np.asarray(ring, dtype=float)
+    if tolerance <= 0 or len(ring) <= 4 or ring.ndim != 2:
+        return ring
+    # Local equirectangular projection so the tolerance is isotropic
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(float(np.mean(ring[:, 1]))))
+    points = np.column_stack([ring[:, 0] * scale_x, ring[:, 1] * METERS_PER_DEGREE])
+
+    # A closed ring has no chord, split it at the vertex farthest from the first one
+    far = int(np.argmax(np.hypot(*(points[:-1] - points[0]).T)))
+    if far == 0:
+        return ring
+    keep = np.zeros(len(ring), dtype=bool)
+    keep[:far + 1] |= douglas_peucker_mask(points[:far + 1], tolerance)
+    keep[far:] |= douglas_peucker_mask(points[far:], tolerance)
+
+    if np.count_nonzero(keep) < 4:
+        return ring
+    return ring[keep]
+
+
+# Simplifies every ring of a Polygon/MultiPolygon, returns the new geometry and its vertex counts
+def simplify_geometry(geometry, tolerance):
+    polygons = polygon_rings(geometry)
+    simplified = []
+    vertices_before = 0
+    vertices_after = 0
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            new_ring = simplify_ring(ring, tolerance)
+            vertices_before += len(ring)
+            vertices_after += len(new_ring)
+            rings.append(np.asarray(new_ring).tolist())
+        simplified.append(rings)
+
+    coordinates = simplified[0] if geometry['type'] == 'Polygon' else simplified
+    return {'type': geometry['type'], 'coordinates': coordinates}, vertices_before, vertices_after
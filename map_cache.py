@@ -0,0 +1,43 @@
+import time
+
+from result_cache import ResultCache, cache_directory, result_key
+
+# Earth Engine map tokens expire after a few hours, keep entries well inside that window
+DEFAULT_TTL = 60 * 60
+# Upper bound on the number of map IDs kept in memory
+DEFAULT_MAX_SIZE = 256
+
+
+# Process-wide cache of Earth Engine map IDs and tile URL templates, with single-flight resolution
+# and optional persistence from result_cache.ResultCache
+class MapIdCache(ResultCache):
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE, clock=time.time, directory=None):
+        super().__init__(ttl=ttl, max_entries=max_size, directory=directory, clock=clock)
+        self.max_size = max_size
+
+    # Stable key: the serialized image expression plus the visualization parameters
+    def key(self, ee_image, vis_params):
+        return result_key('map_id', expression=ee_image.serialize(), vis_params=vis_params or {})
+
+    def store(self, key, map_id_dict, persist=True, size=None):
+        entry = {
+            'key': key,
+            'mapid': map_id_dict.get('mapid'),
+            'url_format': map_id_dict['tile_fetcher'].url_format,
+            'created': self._clock(),
+        }
+        return super().store(key, entry, persist, size)
+
+    # Return (entry, hit) for a key, calling fetch() for a fresh map ID dict on a miss.
+    # Concurrent misses of the same key share one getMapId call.
+    def resolve(self, key, fetch):
+        return super().resolve(key, fetch, persist=True)
+
+    # Return the cached map ID for an image, only calling getMapId on a miss
+    def get_map_id(self, ee_image, vis_params):
+        entry, _ = self.resolve(self.key(ee_image, vis_params), lambda: ee_image.getMapId(vis_params))
+        return entry
+
+
+# Shared instance used by the app, it lives as long as the Streamlit server process
+map_id_cache = MapIdCache(directory=cache_directory('map_ids'))
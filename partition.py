@@ -0,0 +1,216 @@
+import logging
+import math
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import ee
+import numpy as np
+
+from classification import class_area_statistics, merge_class_tables, transition_statistics, merge_transition_tables
+from geometry import polygon_rings, summarize_geometries
+from pipeline import call_with_retry
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Splits a large AOI into grid cells processed concurrently; cells that are too slow, or that hit an
+# Earth Engine memory/timeout limit, are split into quarters so the grid adapts to the observed timings.
+
+# AOI area above which the app reduces statistics cell by cell
+PARTITION_AREA_THRESHOLD = 5000 * 1e6
+# Wanted duration of one cell request in seconds
+TARGET_CELL_SECONDS = 20.0
+# Cells expected to take longer than this factor x target are split before being sent
+SPLIT_FACTOR = 1.5
+MIN_CELL_DEGREES = 0.01
+PARTITION_WORKERS = 4
+PARTITION_RETRIES = 3
+
+# Messages of errors that a smaller cell avoids, these are split instead of retried
+LIMIT_ERRORS = ('memory limit', 'timed out', 'too many pixels', 'too many concurrent aggregations', 'maxpixels')
+
+
+def is_limit_error(error):
+    message = str(error).lower()
+    return any(fragment in message for fragment in LIMIT_ERRORS)
+
+
+# Sutherland-Hodgman clipping of one ring against a [min_lon, min_lat, max_lon, max_lat] box,
+# each of the four edges is handled for all vertices at once
+def clip_ring(ring, box):
+    points = np.asarray(ring, dtype=float)[:, :2]
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    min_lon, min_lat, max_lon, max_lat = box
+
+    for axis, bound, keep_greater in ((0, min_lon, True), (0, max_lon, False), (1, min_lat, True), (1, max_lat, False)):
+        if not len(points):
+            return None
+        previous = np.roll(points, 1, axis=0)
+        inside = points[:, axis] >= bound if keep_greater else points[:, axis] <= bound
+        previous_inside = np.roll(inside, 1)
+        crossing = inside != previous_inside
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = (bound - previous[:, axis]) / (points[:, axis] - previous[:, axis])
+            intersections = previous + t[:, None] * (points - previous)
+        # Each vertex emits the edge intersection (when crossing) followed by itself (when inside)
+        candidates = np.stack([intersections, points], axis=1)
+        emitted = np.stack([crossing, inside], axis=1)
+        points = candidates[emitted]
+
+    if len(np.unique(points, axis=0)) < 3:
+        return None
+    return np.vstack([points, points[:1]])
+
+
+# GeoJSON Polygon/MultiPolygon geometries clipped to a box, as a list of polygons (lists of rings)
+def clip_geometries(geometries, box):
+    polygons = []
+    for geometry in geometries:
+        for polygon in polygon_rings(geometry):
+            outer = clip_ring(polygon[0], box)
+            if outer is None:
+                continue
+            holes = [clip_ring(hole, box) for hole in polygon[1:]]
+            polygons.append([outer.tolist()] + [hole.tolist() for hole in holes if hole is not None])
+    return polygons
+
+
+# Regular grid of boxes over a bbox, edges snapped to the pixel grid when a pixel size is given
+def grid_cells(bbox, cell_size, pixel_size=None):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    if pixel_size:
+        cell_size = max(pixel_size, round(cell_size / pixel_size) * pixel_size)
+    columns = max(1, math.ceil((max_lon - min_lon) / cell_size - 1e-9))
+    rows = max(1, math.ceil((max_lat - min_lat) / cell_size - 1e-9))
+    return [
+        [
+            min_lon + column * cell_size,
+            max(max_lat - (row + 1) * cell_size, min_lat),
+            min(min_lon + (column + 1) * cell_size, max_lon),
+            max_lat - row * cell_size,
+        ]
+        for row in range(rows)
+        for column in range(columns)
+    ]
+
+
+# Quarters of a box, split on the pixel grid anchored at origin (top-left of the whole bbox)
+def split_cell(box, pixel_size=None, origin=None):
+    min_lon, min_lat, max_lon, max_lat = box
+    mid_lon = (min_lon + max_lon) / 2
+    mid_lat = (min_lat + max_lat) / 2
+    if pixel_size and origin:
+        mid_lon = origin[0] + round((mid_lon - origin[0]) / pixel_size) * pixel_size
+        mid_lat = origin[1] - round((origin[1] - mid_lat) / pixel_size) * pixel_size
+    quarters = [
+        [min_lon, mid_lat, mid_lon, max_lat], [mid_lon, mid_lat, max_lon, max_lat],
+        [min_lon, min_lat, mid_lon, mid_lat], [mid_lon, min_lat, max_lon, mid_lat],
+    ]
+    return [quarter for quarter in quarters if quarter[2] > quarter[0] and quarter[3] > quarter[1]]
+
+
+# Run process_cell(cell_aoi, box) on every non-empty cell of the AOI and merge the results.
+# Returns (merge(list of (box, value)), per-cell reports). slots is an optional semaphore shared with the caller,
+# bounding the concurrent Earth Engine requests of every cell worker.
+def process_partitioned(geometries, bbox, process_cell, merge, cell_size=None, target_seconds=TARGET_CELL_SECONDS,
+                        workers=PARTITION_WORKERS, retries=PARTITION_RETRIES, pixel_size=None, min_cell_size=MIN_CELL_DEGREES,
+                        slots=None):
+    if cell_size is None:
+        # Start with about two cells per worker, slow cells are split as timings come in
+        span = max(bbox[2] - bbox[0], bbox[3] - bbox[1])
+        cell_size = span / max(1, math.ceil(math.sqrt(2 * workers)))
+    origin = (bbox[0], bbox[3])
+    queue = deque(grid_cells(bbox, cell_size, pixel_size))
+
+    # Observed seconds per square meter of clipped AOI, as an exponential moving average
+    seconds_per_m2 = None
+    results = []
+    reports = []
+
+    def run_cell(cell_aoi, box):
+        started = time.monotonic()
+        value = call_with_retry(lambda: process_cell(cell_aoi, box), retries, slots=slots,
+                                should_retry=lambda error: not is_limit_error(error))
+        return value, time.monotonic() - started
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while queue or running:
+            while queue and len(running) < workers:
+                box = queue.popleft()
+                polygons = clip_geometries(geometries, box)
+                if not polygons:
+                    continue
+                area = summarize_geometries([{'type': 'MultiPolygon', 'coordinates': polygons}])['total_area']
+                splittable = box[2] - box[0] > 2 * min_cell_size
+                if seconds_per_m2 is not None and splittable and area * seconds_per_m2 > target_seconds * SPLIT_FACTOR:
+                    queue.extendleft(split_cell(box, pixel_size, origin))
+                    continue
+                future = executor.submit(tracing.bind(run_cell), ee.Geometry.MultiPolygon(polygons), box)
+                running[future] = (box, area, splittable)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                box, area, splittable = running.pop(future)
+                try:
+                    value, seconds = future.result()
+                except (ee.EEException, OSError) as error:
+                    if is_limit_error(error) and splittable:
+                        logger.info("cell %s hit a limit, splitting: %s", box, error)
+                        queue.extend(split_cell(box, pixel_size, origin))
+                        continue
+                    raise
+                rate = seconds / area if area else 0.0
+                seconds_per_m2 = rate if seconds_per_m2 is None else 0.7 * seconds_per_m2 + 0.3 * rate
+                results.append((box, value))
+                reports.append({'box': box, 'area': area, 'seconds': seconds})
+
+    return merge(results), reports
+
+
+# Per-class statistics of a large AOI, reduced cell by cell and merged into one table
+def partitioned_class_area_statistics(classified_image, geometries, bbox, **options):
+    return process_partitioned(
+        geometries,
+        bbox,
+        lambda cell_aoi, box: class_area_statistics(classified_image, cell_aoi),
+        lambda results: merge_class_tables([table for _, table in results]),
+        **options,
+    )
+
+
+# Class transition statistics of a large AOI, reduced cell by cell and merged into one table
+def partitioned_transition_statistics(delta_ndvi, transitions, geometries, bbox, **options):
+    return process_partitioned(
+        geometries,
+        bbox,
+        lambda cell_aoi, box: transition_statistics(delta_ndvi, transitions, cell_aoi),
+        lambda results: merge_transition_tables([table for _, table in results]),
+        **options,
+    )
+
+
+# Pixels of an image over one box on a pixel grid in EPSG:4326, as a (rows, cols) array
+def fetch_cell_pixels(image, box, pixel_size, band=None):
+    min_lon, min_lat, max_lon, max_lat = box
+    width = int(round((max_lon - min_lon) / pixel_size))
+    height = int(round((max_lat - min_lat) / pixel_size))
+    image = ee.Image(image)
+    if band is not None:
+        image = image.select([band])
+    pixels = ee.data.computePixels({
+        'expression': image,
+        'fileFormat': 'NUMPY_NDARRAY',
+        'grid': {
+            'dimensions': {'width': width, 'height': height},
+            'affineTransform': {
+                'scaleX': pixel_size, 'shearX': 0, 'translateX': min_lon,
+                'shearY': 0, 'scaleY': -pixel_size, 'translateY': max_lat,
+            },
+            'crsCode': 'EPSG:4326',
+        },
+    })
+    # Structured array with one field per band
+    return pixels[pixels.dtype.names[0]] if pixels.dtype.names else pixels
@@ -0,0 +1,213 @@
+from datetime import timedelta
+import hashlib
+import json
+import logging
+import random
+import time
+
+import ee
+
+from classification import classify_ndvi, transition_image
+from geometry import summarize_geometries, simplify_geometry
+from geojson_stream import iter_geometries
+from spatial_index import merge_geometries
+
+logger = logging.getLogger(__name__)
+
+# Earth Engine processing shared by the Streamlit app and the batch CLI, no Streamlit imports here
+
+# Default AOI when no geometry was uploaded
+DEFAULT_AOI_POINT = [27.98, 36.13]
+# Number of days gathered before each selected date
+DEFAULT_TIME_RANGE = 7
+# Sentinel-2 bands the app uses: B2/B3/B4 for the true color layer, B4/B8 for NDVI
+COMPOSITE_BANDS = ['B2', 'B3', 'B4', 'B8']
+# Scene classification (SCL) values removed by the per-pixel cloud mask:
+# no data, saturated/defective, cloud shadows, cloud medium and high probability, thin cirrus
+SCL_MASKED_CLASSES = [0, 1, 3, 8, 9, 10]
+
+
+# Defining a function to create and filter a GEE image collection for results
+def satCollection(cloudRate, initialDate, updatedDate, aoi):
+    collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloudRate)) \
+        .filterDate(initialDate, updatedDate) \
+        .filterBounds(aoi)
+
+    # Defining a function to clip the collection to the area of interest
+    def clipCollection(image):
+        return image.clip(aoi).divide(10000)
+    # clipping the collection
+    collection = collection.map(clipCollection)
+    return collection
+
+
+# Per-pixel cloud masking from the scene classification band
+def sclCloudMask(image):
+    clear = image.select('SCL').remap(SCL_MASKED_CLASSES, [0] * len(SCL_MASKED_CLASSES), 1)
+    return image.updateMask(clear)
+
+
+# Optimized counterpart of satCollection: the same filters, but only the bands the app uses are kept and
+# no per-image clip/scale is mapped over the collection (sat_composite applies them once to the median)
+def filtered_collection(cloud_rate, start_date, end_date, aoi, scl_mask=False):
+    collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_rate)) \
+        .filterDate(start_date, end_date) \
+        .filterBounds(aoi)
+    if scl_mask:
+        collection = collection.map(sclCloudMask)
+    return collection.select(COMPOSITE_BANDS)
+
+
+# Median first, then scale to reflectance and clip to the AOI a single time
+def sat_composite(collection, aoi):
+    return collection.median().divide(10000).clip(aoi)
+
+
+# Serialized expression size (characters) of the legacy composite and of the optimized one
+def composite_expression_report(cloud_rate, start_date, end_date, aoi, scl_mask=False):
+    legacy = satCollection(cloud_rate, start_date, end_date, aoi).median()
+    optimized = sat_composite(filtered_collection(cloud_rate, start_date, end_date, aoi, scl_mask), aoi)
+    return {'before': len(legacy.serialize()), 'after': len(optimized.serialize())}
+
+
+# NDVI
+def getNDVI(collection):
+    return collection.normalizedDifference(['B8', 'B4'])
+
+
+# Masking NDVI over the water & show only land
+def satImageMask(sat_image):
+    masked_image = sat_image.updateMask(sat_image.gte(0))
+    return masked_image
+
+
+# Time input processing function
+def date_input_proc(input_date, time_range):
+    end_date = input_date
+    start_date = input_date - timedelta(days=time_range)
+
+    str_start_date = start_date.strftime('%Y-%m-%d')
+    str_end_date = end_date.strftime('%Y-%m-%d')
+    return str_start_date, str_end_date
+
+
+# Median composite, masked NDVI and NDVI classes for one date window
+def ndvi_products(cloud_rate, start_date, end_date, aoi, scl_mask=False):
+    composite = sat_composite(filtered_collection(cloud_rate, start_date, end_date, aoi, scl_mask), aoi)
+    ndvi = satImageMask(getNDVI(composite))
+    return {
+        'composite': composite,
+        'ndvi': ndvi,
+        'classified': classify_ndvi(ndvi),
+    }
+
+
+# The same products as stages of a StageGraph (stages.py): each stage is only rebuilt when its
+# own inputs or an upstream stage changed. The AOI stage must already be resolved in the graph.
+# Building the expressions is local, only the map IDs and statistics derived from them are worth sharing
+# across sessions (result_cache.py).
+def staged_ndvi_products(stages, tag, cloud_rate, start_date, end_date, aoi, scl_mask=False):
+    collection = stages.run(f'collection:{tag}', [cloud_rate, start_date, end_date, scl_mask],
+                            lambda: filtered_collection(cloud_rate, start_date, end_date, aoi, scl_mask), after=('aoi',))
+    composite = stages.run(f'composite:{tag}', None,
+                           lambda: sat_composite(collection.value, aoi), after=(f'collection:{tag}', 'aoi'))
+    ndvi = stages.run(f'ndvi:{tag}', None,
+                      lambda: satImageMask(getNDVI(composite.value)), after=(f'composite:{tag}',))
+    classified = stages.run(f'classified:{tag}', None,
+                            lambda: classify_ndvi(ndvi.value), after=(f'ndvi:{tag}',))
+    return {
+        'composite': composite.value,
+        'ndvi': ndvi.value,
+        'classified': classified.value,
+    }
+
+
+# Change detection between two dates: NDVI difference (updated - initial) and per-pixel class transition codes
+def change_products(initial_products, updated_products):
+    return {
+        'delta_ndvi': updated_products['ndvi'].subtract(initial_products['ndvi']).rename('delta_ndvi'),
+        'transitions': transition_image(initial_products['classified'], updated_products['classified']),
+    }
+
+
+def staged_change_products(stages, initial_products, updated_products):
+    return stages.run('change', None, lambda: change_products(initial_products, updated_products),
+                      after=('classified:initial', 'classified:updated')).value
+
+
+# Fingerprint of uploaded files that does not read their content
+def files_fingerprint(files):
+    return [
+        [getattr(upload_file, 'file_id', None), getattr(upload_file, 'name', None), getattr(upload_file, 'size', None)]
+        for upload_file in files
+    ]
+
+
+# Run an Earth Engine call, retrying with exponential backoff and jitter.
+# slots is an optional semaphore bounding concurrent requests, should_retry(error) can refuse a retry.
+def call_with_retry(function, retries=4, backoff=2.0, max_backoff=60.0, slots=None, should_retry=None):
+    for attempt in range(retries + 1):
+        try:
+            if slots is None:
+                return function()
+            with slots:
+                return function()
+        except (ee.EEException, OSError) as error:
+            if attempt == retries or (should_retry is not None and not should_retry(error)):
+                raise
+            delay = min(max_backoff, backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning("retrying in %.1fs after: %s", delay, error)
+            time.sleep(delay)
+
+
+# Parse GeoJSON files (binary file objects) into an Earth Engine AOI, optionally simplifying the outlines
+def load_aoi(files, tolerance=0, merge=True):
+    geometries = []
+    # Vertex and payload counters before/after simplification
+    report = {'vertices_before': 0, 'vertices_after': 0, 'bytes_before': 0, 'bytes_after': 0, 'read_errors': []}
+
+    for upload_file in files:
+        # Features are parsed one at a time, the whole file is never loaded as a single JSON document
+        try:
+            for geometry in iter_geometries(upload_file):
+                if tolerance > 0 and geometry.get('type') in ('Polygon', 'MultiPolygon'):
+                    report['bytes_before'] += len(json.dumps(geometry['coordinates'], separators=(',', ':')))
+                    try:
+                        geometry, before, after = simplify_geometry(geometry, tolerance)
+                    except (ValueError, TypeError):
+                        # Malformed rings are reported by the validation below
+                        before = after = 0
+                    report['vertices_before'] += before
+                    report['vertices_after'] += after
+                    report['bytes_after'] += len(json.dumps(geometry['coordinates'], separators=(',', ':')))
+                geometries.append(geometry)
+        except ValueError as error:
+            report['read_errors'].append((getattr(upload_file, 'name', str(upload_file)), str(error)))
+
+    # Centroids, bounds and ring validation are computed locally in one pass, without any getInfo call
+    summary = summarize_geometries(geometries)
+    # The valid GeoJSON geometries, for local processing such as partitioning (partition.py)
+    summary['geometries'] = [geometry for geometry, valid in zip(geometries, summary['valid']) if valid]
+    # Duplicate, nested and overlapping polygons are merged locally (spatial_index.py), so Earth Engine
+    # never receives the same area twice
+    if merge:
+        summary['geometries'], report['merge'] = merge_geometries(summary['geometries'])
+        summary['total_area'] -= report['merge']['redundant_area']
+    # Content hash of the AOI: identical uploads from different sessions share cached results
+    summary['aoi_hash'] = hashlib.sha256(
+        json.dumps(summary['geometries'], separators=(',', ':'), sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+    geometry_aoi_list = []
+    for geometry in summary['geometries']:
+        coordinates = geometry['coordinates']
+        geometry_aoi_list.append(ee.Geometry.Polygon(coordinates) if geometry['type'] == 'Polygon' else ee.Geometry.MultiPolygon(coordinates))
+
+    if geometry_aoi_list:
+        geometry_aoi = ee.Geometry.MultiPolygon(geometry_aoi_list)
+    else:
+        geometry_aoi = ee.Geometry.Point(DEFAULT_AOI_POINT)
+
+    return geometry_aoi, summary, report
@@ -0,0 +1,171 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from classification import CLASS_SCALE, NDVI_CLASS_BREAKS, NODATA_CLASS, class_area_statistics_array, class_pixel_counts, classify_ndvi_array
+# Offline counterpart of the Earth Engine processing in app.py (getNDVI, satImageMask, classify_ndvi)
+# working on memory-mapped band arrays, one fixed-size tile at a time.
+
+# Sentinel-2 L2A digital numbers to reflectance, as satCollection does with divide(10000)
+REFLECTANCE_SCALE = 10000
+
+# Tile edge in pixels: a 1024x1024 float32 tile is 4 MB per band
+TILE_SIZE = 1024
+
+
+# A band on disk that every worker process can open again as a memmap
+class BandSource:
+    def __init__(self, path, dtype=None, shape=None, offset=0, band_index=None):
+        self.path = path
+        self.dtype = dtype
+        self.shape = shape
+        self.offset = offset
+        self.band_index = band_index
+
+    def open(self):
+        if self.dtype is None:
+            # .npy header gives the dtype and shape
+            array = np.load(self.path, mmap_mode='r')
+        else:
+            array = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.offset, shape=self.shape)
+        return array if self.band_index is None else array[self.band_index]
+
+
+# .npz members are stored .npy files: copy them out once so they can be memory-mapped
+def extract_npz_bands(path, names, workdir):
+    sources = {}
+    with zipfile.ZipFile(path) as archive:
+        for name in names:
+            target = os.path.join(workdir, f'{name}.npy')
+            with archive.open(f'{name}.npy') as member, open(target, 'wb') as out:
+                shutil.copyfileobj(member, out, 1024 * 1024)
+            sources[name] = BandSource(target)
+    return sources
+
+
+# Resolve the red (B4) and NIR (B8) bands from .npy files, an .npz archive or a raw band stack
+def open_bands(red=None, nir=None, npz=None, stack=None, dtype=None, shape=None, band_order=('B4', 'B8'), workdir=None):
+    if npz is not None:
+        return extract_npz_bands(npz, ('B4', 'B8'), workdir or tempfile.mkdtemp())
+    if stack is not None:
+        if stack.endswith('.npy'):
+            source = lambda index: BandSource(stack, band_index=index)
+        elif dtype is None or shape is None:
+            raise ValueError("raw band stacks need a dtype and a (bands, rows, cols) shape")
+        else:
+            source = lambda index: BandSource(stack, dtype=dtype, shape=tuple(shape), band_index=index)
+        return {'B4': source(band_order.index('B4')), 'B8': source(band_order.index('B8'))}
+    if red is None or nir is None:
+        raise ValueError("red and nir bands are required")
+    return {'B4': BandSource(red), 'B8': BandSource(nir)}
+
+
+# NDVI as Earth Engine's normalizedDifference(['B8', 'B4']): negative inputs and 0/0 are masked (NaN)
+def get_ndvi(nir, red, scale=REFLECTANCE_SCALE):
+    nir = nir.astype(np.float32) / np.float32(scale)
+    red = red.astype(np.float32) / np.float32(scale)
+    total = nir + red
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ndvi = (nir - red) / total
+    ndvi[(nir < 0) | (red < 0) | (total == 0)] = np.nan
+    return ndvi
+
+
+# Water mask: keep land pixels only, like satImageMask
+def sat_image_mask(ndvi):
+    return np.where(ndvi >= 0, ndvi, np.float32(np.nan))
+
+
+# Tile windows (row_start, row_end, col_start, col_end) covering a raster
+def tile_windows(rows, cols, tile_size=TILE_SIZE):
+    return [
+        (row, min(row + tile_size, rows), col, min(col + tile_size, cols))
+        for row in range(0, rows, tile_size)
+        for col in range(0, cols, tile_size)
+    ]
+
+
+# Worker: read one tile of both bands, write NDVI and class tiles into the output memmaps
+def process_tile(task):
+    bands, outputs, window = task
+    row_start, row_end, col_start, col_end = window
+    red = bands['B4'].open()[row_start:row_end, col_start:col_end]
+    nir = bands['B8'].open()[row_start:row_end, col_start:col_end]
+
+    masked_ndvi = sat_image_mask(get_ndvi(nir, red))
+    classified = classify_ndvi_array(masked_ndvi)
+
+    ndvi_out = np.load(outputs['ndvi'], mmap_mode='r+')
+    class_out = np.load(outputs['classified'], mmap_mode='r+')
+    ndvi_out[row_start:row_end, col_start:col_end] = masked_ndvi
+    class_out[row_start:row_end, col_start:col_end] = classified
+    ndvi_out.flush()
+    class_out.flush()
+    # Per-tile class histogram so the caller gets statistics without re-reading the outputs
+    return class_pixel_counts(classified)
+
+
+# Run NDVI, water mask and classification over a full scene in bounded memory
+def process_scene(bands, output_dir, tile_size=TILE_SIZE, workers=None):
+    rows, cols = bands['B4'].open().shape
+    if bands['B8'].open().shape != (rows, cols):
+        raise ValueError("B4 and B8 must have the same shape")
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = {
+        'ndvi': os.path.join(output_dir, 'ndvi.npy'),
+        'classified': os.path.join(output_dir, 'ndvi_classified.npy'),
+    }
+    np.lib.format.open_memmap(outputs['ndvi'], mode='w+', dtype=np.float32, shape=(rows, cols)).flush()
+    np.lib.format.open_memmap(outputs['classified'], mode='w+', dtype=np.uint8, shape=(rows, cols)).flush()
+
+    tasks = [(bands, outputs, window) for window in tile_windows(rows, cols, tile_size)]
+    class_counts = np.zeros(len(NDVI_CLASS_BREAKS) + 1, dtype=np.int64)
+    if workers == 1:
+        for counts in map(process_tile, tasks):
+            class_counts += counts
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for counts in executor.map(process_tile, tasks):
+                class_counts += counts
+
+    return outputs, class_counts
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline NDVI, water mask and 7-class classification of Sentinel-2 bands")
+    parser.add_argument('--red', help="B4 band as .npy")
+    parser.add_argument('--nir', help="B8 band as .npy")
+    parser.add_argument('--npz', help=".npz archive holding B4 and B8 arrays")
+    parser.add_argument('--stack', help="band stack (.npy or raw binary) shaped (bands, rows, cols)")
+    parser.add_argument('--dtype', help="dtype of a raw band stack, e.g. uint16")
+    parser.add_argument('--shape', type=int, nargs=3, metavar=('BANDS', 'ROWS', 'COLS'), help="shape of a raw band stack")
+    parser.add_argument('--band-order', default='B4,B8', help="comma separated band names of the stack")
+    parser.add_argument('--output', required=True, help="output directory")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--pixel-size', type=float, default=CLASS_SCALE, help="pixel size in meters, for the class areas")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(dir=args.output if os.path.isdir(args.output) else None) as workdir:
+        bands = open_bands(
+            red=args.red, nir=args.nir, npz=args.npz, stack=args.stack,
+            dtype=args.dtype, shape=args.shape, band_order=tuple(args.band_order.split(',')), workdir=workdir,
+        )
+        outputs, class_counts = process_scene(bands, args.output, args.tile_size, args.workers)
+
+    for name, path in outputs.items():
+        print(f"{name}: {path}")
+    print(f"masked (water/no data): {class_counts[NODATA_CLASS]} pixels")
+    for row in class_area_statistics_array(class_counts, args.pixel_size ** 2):
+        print(f"class {row['class']} ({row['label']}): {row['pixels']} pixels, {row['hectares']:,.2f} ha, {row['share']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Process-wide cache of Earth Engine results shared by every session of the Streamlit server: map IDs and
+# statistics keyed by what they depend on (AOI content hash, date window, cloud threshold,
+# vis params...). Concurrent requests for the same key wait for a single computation (single flight), and
+# JSON results can also be persisted to disk so they survive a restart.
+
+DEFAULT_TTL = 6 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_MB = 256
+
+
+# Key of a result: its kind and the inputs it depends on
+def result_key(kind, **parts):
+    payload = json.dumps([kind, parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+# Approximate memory footprint of a value, the size of its JSON form. Lazy ee objects are not cached: their
+# readable form is the whole expression, slow to build and unrelated to their size.
+def estimate_size(value):
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+# A computation in progress, the requests that arrive meanwhile wait on it
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class ResultCache:
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+                 directory=None, clock=time.time):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._clock = clock
+        # key -> (value, created, size), least recently used first
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    key = staticmethod(result_key)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.json')
+
+    def _expired(self, created):
+        return self._clock() - created >= self.ttl
+
+    # Value from memory, called with the lock held
+    def _lookup_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry[1]):
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _lookup_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as result_file:
+                record = json.load(result_file)
+        except (OSError, ValueError):
+            return None
+        if self._expired(record['created']):
+            return None
+        return record['value'], record['created']
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    # Insert an entry and evict the least recently used ones beyond the bounds, called with the lock held
+    def _insert(self, key, value, created, size):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, created, size)
+        self.bytes += size
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._lookup_memory(key)
+        if entry is not None:
+            return entry[0]
+        record = self._lookup_disk(key)
+        if record is None:
+            return None
+        value, created = record
+        with self._lock:
+            self._insert(key, value, created, estimate_size(value))
+            self.disk_hits += 1
+        return value
+
+    # Keep a value in memory, and on disk when persist is set (the value must then be JSON serializable)
+    def store(self, key, value, persist=False, size=None):
+        created = self._clock()
+        with self._lock:
+            self._insert(key, value, created, estimate_size(value) if size is None else size)
+        if persist and self.directory:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so a reader never sees a partial result
+            temporary_path = f'{path}.{threading.get_ident()}.tmp'
+            try:
+                with open(temporary_path, 'w') as result_file:
+                    json.dump({'created': created, 'value': value}, result_file)
+                os.replace(temporary_path, path)
+            except (OSError, TypeError, ValueError) as error:
+                logger.warning("result %s not persisted: %s", key, error)
+                try:
+                    os.remove(temporary_path)
+                except OSError:
+                    pass
+        return value
+
+    # Return (value, hit) for a key. On a miss compute() runs once: concurrent callers of the same key
+    # wait for that call and share its result (or its error).
+    def resolve(self, key, compute, persist=False):
+        value = self.lookup(key)
+        if value is not None:
+            with self._lock:
+                self.hits += 1
+            return value, True
+
+        with self._lock:
+            # Another caller may have stored the value since the lookup above
+            entry = self._lookup_memory(key)
+            if entry is not None:
+                self.hits += 1
+                return entry[0], True
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            # The Earth Engine round trip happens outside the lock so other keys are not blocked
+            flight.value = self.store(key, compute(), persist)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.value, False
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_entries,
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._flights),
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+
+# Disk directory of a cache when NDVI_RESULT_CACHE_DIR is set, None keeps it in memory only
+def cache_directory(name):
+    root = os.environ.get('NDVI_RESULT_CACHE_DIR')
+    return os.path.join(root, name) if root else None
+
+
+# Shared instance for statistics, it lives as long as the Streamlit server process
+shared_results = ResultCache(
+    max_bytes=int(os.environ.get('NDVI_RESULT_CACHE_MB', DEFAULT_MAX_MB)) * 1024 * 1024,
+    directory=cache_directory('results'),
+)
@@ -0,0 +1,490 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from geometry import polygon_rings, summarize_geometries
+
+# Duplicate, nested and overlapping polygons of an upload (e.g. several overlapping exports of the same area)
+# are merged locally before the AOI is sent to Earth Engine. A grid index over the polygon bounding boxes
+# finds the candidate pairs; exact duplicates are found by hashing the normalized rings.
+
+# Coordinates are compared at this precision (degrees, about 0.1 mm)
+EPSILON = 1e-9
+COORDINATE_DECIMALS = 9
+# Boxes spanning more grid cells than this are kept in a separate list checked against every query
+MAX_CELLS_PER_BOX = 256
+# Upper bound on the size of the pairwise edge/point matrices built at once
+MAX_PAIRS_PER_BLOCK = 2 ** 22
+# Consecutive edges of a ring compared together with the edges near their bounding box
+EDGES_PER_RUN = 64
+# Groups of overlapping polygons with more pairs of intersecting bounding boxes (the ring pairs compared by the
+# union) or more vertices than this are sent as they are instead of being unioned
+MAX_UNION_PAIRS = 5000
+MAX_UNION_VERTICES = 20000
+
+
+# Uniform grid over bounding boxes [min_lon, min_lat, max_lon, max_lat], cell size from the median box size
+class GridIndex:
+    def __init__(self, bboxes, cell_size=None):
+        self.bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        if cell_size is None:
+            spans = np.maximum(self.bboxes[:, 2] - self.bboxes[:, 0], self.bboxes[:, 3] - self.bboxes[:, 1])
+            cell_size = float(np.median(spans)) if len(spans) else 1.0
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self.cells = defaultdict(list)
+        self.large = []
+        for index, box in enumerate(self.bboxes):
+            columns, rows = self._cell_ranges(box)
+            if len(columns) * len(rows) > MAX_CELLS_PER_BOX:
+                self.large.append(index)
+                continue
+            for column in columns:
+                for row in rows:
+                    self.cells[column, row].append(index)
+
+    def _cell_ranges(self, box):
+        return (
+            range(math.floor(box[0] / self.cell_size), math.floor(box[2] / self.cell_size) + 1),
+            range(math.floor(box[1] / self.cell_size), math.floor(box[3] / self.cell_size) + 1),
+        )
+
+    # Indexes of the boxes intersecting box (touching counts)
+    def query(self, box):
+        columns, rows = self._cell_ranges(box)
+        if len(columns) * len(rows) > MAX_CELLS_PER_BOX:
+            candidates = range(len(self.bboxes))
+        else:
+            candidates = set(self.large)
+            for column in columns:
+                for row in rows:
+                    candidates.update(self.cells.get((column, row), ()))
+        candidates = np.fromiter(candidates, dtype=np.int64)
+        boxes = self.bboxes[candidates]
+        hits = (boxes[:, 0] <= box[2]) & (boxes[:, 2] >= box[0]) & (boxes[:, 1] <= box[3]) & (boxes[:, 3] >= box[1])
+        return np.sort(candidates[hits])
+
+    # Every pair (i, j), i < j, of intersecting boxes
+    def pairs(self):
+        for index, box in enumerate(self.bboxes):
+            for other in self.query(box):
+                if other > index:
+                    yield index, int(other)
+
+
+def signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+
+
+# Open ring (no repeated closing vertex) with the given orientation
+def oriented_ring(ring, counterclockwise=True):
+    ring = np.asarray(ring, dtype=float)[:, :2]
+    if len(ring) > 1 and np.array_equal(ring[0], ring[-1]):
+        ring = ring[:-1]
+    if (signed_area(ring) > 0) != counterclockwise:
+        ring = ring[::-1]
+    return ring
+
+
+# Bytes identifying a ring whatever its starting vertex and orientation
+def ring_key(ring):
+    ring = np.round(ring, COORDINATE_DECIMALS) + 0.0
+    start = np.lexsort((ring[:, 1], ring[:, 0]))[0]
+    return np.roll(ring, -start, axis=0).tobytes()
+
+
+def polygon_key(polygon):
+    return b'|'.join([ring_key(polygon[0])] + sorted(ring_key(hole) for hole in polygon[1:]))
+
+
+def polygon_bbox(polygon):
+    outer = polygon[0]
+    return [outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max()]
+
+
+def ring_edges(ring):
+    return ring, np.roll(ring, -1, axis=0)
+
+
+# Location of points relative to a ring: 1 inside, 0 on the boundary, -1 outside (even-odd rule). The points are
+# taken in horizontal strips, each compared with the edges reaching its latitudes only.
+def locate_in_ring(points, ring):
+    starts, ends = ring_edges(ring)
+    low = np.minimum(starts[:, 1], ends[:, 1]) - EPSILON
+    high = np.maximum(starts[:, 1], ends[:, 1]) + EPSILON
+    result = np.empty(len(points), dtype=np.int8)
+    strips = max(1, min(len(points), len(ring) // EDGES_PER_RUN))
+    for strip in np.array_split(np.argsort(points[:, 1], kind='stable'), strips):
+        if not len(strip):
+            continue
+        edges = (high >= points[strip, 1].min()) & (low <= points[strip, 1].max())
+        result[strip] = locate_against_edges(points[strip], starts[edges], ends[edges])
+    return result
+
+
+def locate_against_edges(points, starts, ends):
+    result = np.empty(len(points), dtype=np.int8)
+    block = max(1, MAX_PAIRS_PER_BLOCK // max(1, len(starts)))
+    for first in range(0, len(points), block):
+        px = points[first:first + block, 0:1]
+        py = points[first:first + block, 1:2]
+        ax, ay, bx, by = starts[:, 0], starts[:, 1], ends[:, 0], ends[:, 1]
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.clip(((px - ax) * dx + (py - ay) * dy) / length2, 0.0, 1.0)
+            t = np.where(length2 > 0, t, 0.0)
+        on_edge = ((ax + t * dx - px) ** 2 + (ay + t * dy - py) ** 2 <= EPSILON * EPSILON).any(axis=1)
+        straddles = (ay > py) != (by > py)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            crossing_x = ax + (py - ay) * dx / dy
+        inside = (straddles & (px < crossing_x)).sum(axis=1) % 2 == 1
+        result[first:first + block] = np.where(on_edge, 0, np.where(inside, 1, -1))
+    return result
+
+
+# Location of points relative to a polygon with holes
+def locate_in_polygon(points, polygon):
+    location = locate_in_ring(points, polygon[0])
+    for hole in polygon[1:]:
+        in_hole = locate_in_ring(points, hole)
+        location = np.where(in_hole == 1, -1, np.where((in_hole == 0) & (location == 1), 0, location))
+    return location
+
+
+# Vertices and edge midpoints, the points used to compare two polygons
+def sample_points(polygon):
+    samples = []
+    for ring in polygon:
+        starts, ends = ring_edges(ring)
+        samples.append(starts)
+        samples.append((starts + ends) / 2)
+    return np.vstack(samples)
+
+
+def ring_bbox(ring):
+    return [ring[:, 0].min(), ring[:, 1].min(), ring[:, 0].max(), ring[:, 1].max()]
+
+
+def box_contains(box, point):
+    return box[0] <= point[0] <= box[2] and box[1] <= point[1] <= box[3]
+
+
+# Mask of the edges whose bounding box intersects box
+def edges_near(starts, ends, box):
+    return (np.minimum(starts[:, 0], ends[:, 0]) <= box[2]) & (np.maximum(starts[:, 0], ends[:, 0]) >= box[0]) \
+        & (np.minimum(starts[:, 1], ends[:, 1]) <= box[3]) & (np.maximum(starts[:, 1], ends[:, 1]) >= box[1])
+
+
+# Whether any edge of ring_a properly crosses an edge of ring_b (interior points of both edges)
+def rings_cross(ring_a, ring_b):
+    a_starts, a_ends = ring_edges(ring_a)
+    b_starts, b_ends = ring_edges(ring_b)
+    # Only the edges inside the other ring's bounding box can cross it, and runs of consecutive edges only the
+    # edges near their own bounding box
+    near = np.nonzero(edges_near(a_starts, a_ends, ring_bbox(ring_b)))[0]
+    for first in range(0, len(near), EDGES_PER_RUN):
+        run = near[first:first + EDGES_PER_RUN]
+        close = edges_near(b_starts, b_ends, ring_bbox(np.vstack([a_starts[run], a_ends[run]])))
+        if not close.any():
+            continue
+        t, u, _ = edge_intersections(a_starts[run], a_ends[run], b_starts[close], b_ends[close])
+        if ((t > EPSILON) & (t < 1 - EPSILON) & (u > EPSILON) & (u < 1 - EPSILON)).any():
+            return True
+    return False
+
+
+# Parameters (t along the a edges, u along the b edges) of the intersections of every a edge with every b edge,
+# NaN for parallel edges
+def edge_intersections(a_starts, a_ends, b_starts, b_ends):
+    r = (a_ends - a_starts)[:, None, :]
+    s = (b_ends - b_starts)[None, :, :]
+    qp = b_starts[None, :, :] - a_starts[:, None, :]
+    denominator = r[..., 0] * s[..., 1] - r[..., 1] * s[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (qp[..., 0] * s[..., 1] - qp[..., 1] * s[..., 0]) / denominator
+        u = (qp[..., 0] * r[..., 1] - qp[..., 1] * r[..., 0]) / denominator
+    parallel = np.abs(denominator) <= EPSILON * EPSILON
+    t[parallel] = np.nan
+    u[parallel] = np.nan
+    return t, u, r[:, 0, :]
+
+
+def polygons_cross(polygon_a, polygon_b):
+    return any(rings_cross(ring_a, ring_b) for ring_a in polygon_a for ring_b in polygon_b)
+
+
+# Relationship of two polygons: 'inside' (a within b), 'contains' (b within a), 'overlap' or None (disjoint/touching)
+def relate(polygon_a, polygon_b):
+    crossing = polygons_cross(polygon_a, polygon_b)
+    a_in_b = locate_in_polygon(sample_points(polygon_a), polygon_b)
+    b_in_a = locate_in_polygon(sample_points(polygon_b), polygon_a)
+    if not crossing:
+        if (a_in_b >= 0).all() and (a_in_b == 1).any():
+            return 'inside'
+        if (b_in_a >= 0).all() and (b_in_a == 1).any():
+            return 'contains'
+    if crossing or (a_in_b == 1).any() or (b_in_a == 1).any():
+        return 'overlap'
+    return None
+
+
+# Points where the edges of other cross or touch the edges (starts, ends), as (edge indexes, parameters along
+# the edges). Runs of consecutive edges are compared with the edges of other near their bounding box only.
+def edge_splits(starts, ends, other):
+    other_starts, other_ends = ring_edges(other)
+    near = np.nonzero(edges_near(starts, ends, ring_bbox(other)))[0]
+    direction = ends - starts
+    length2 = (direction ** 2).sum(axis=1)
+    edges, parameters = [], []
+    for first in range(0, len(near), EDGES_PER_RUN):
+        run = near[first:first + EDGES_PER_RUN]
+        run_points = np.vstack([starts[run], ends[run]])
+        close = edges_near(other_starts, other_ends, ring_bbox(run_points))
+        if not close.any():
+            continue
+        close_starts, close_ends = other_starts[close], other_ends[close]
+        t, u, _ = edge_intersections(starts[run], ends[run], close_starts, close_ends)
+        rows, columns = np.nonzero((t > EPSILON) & (t < 1 - EPSILON) & (u >= -EPSILON) & (u <= 1 + EPSILON))
+        edges.append(run[rows])
+        parameters.append(t[rows, columns])
+        # Vertices of the other ring lying on an edge (T-junctions and collinear overlaps)
+        offset = close_starts[None, :, :] - starts[run][:, None, :]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            along = (offset * direction[run][:, None, :]).sum(axis=2) / length2[run][:, None]
+        distance2 = ((along[..., None] * direction[run][:, None, :] - offset) ** 2).sum(axis=2)
+        rows, columns = np.nonzero((along > EPSILON) & (along < 1 - EPSILON) & (distance2 <= EPSILON * EPSILON))
+        edges.append(run[rows])
+        parameters.append(along[rows, columns])
+    return edges, parameters
+
+
+# Boundary of the union of hole-free counterclockwise rings: every edge is split where other rings cross or
+# touch it, the pieces inside another ring (or shared with one) are dropped and the rest are chained into rings.
+# Each ring is only compared with the rings whose bounding boxes intersect its own (grid index).
+# Returns a list of polygons (outer ring then holes), or None when the pieces do not chain into closed rings.
+def union_rings(rings):
+    bboxes = [ring_bbox(ring) for ring in rings]
+    grid = GridIndex(bboxes)
+    kept = []
+    for index, ring in enumerate(rings):
+        starts, ends = ring_edges(ring)
+        count = len(ring)
+        neighbours = [int(other_index) for other_index in grid.query(bboxes[index]) if other_index != index]
+        split_edges = [np.arange(count), np.arange(count)]
+        split_parameters = [np.zeros(count), np.ones(count)]
+        for other_index in neighbours:
+            edges, parameters = edge_splits(starts, ends, rings[other_index])
+            split_edges.extend(edges)
+            split_parameters.extend(parameters)
+
+        # Consecutive distinct parameters along the same edge bound a piece
+        edges = np.concatenate(split_edges)
+        parameters = np.round(np.concatenate(split_parameters), 12)
+        order = np.lexsort((parameters, edges))
+        edges, parameters = edges[order], parameters[order]
+        distinct = np.ones(len(edges), dtype=bool)
+        distinct[1:] = (edges[1:] != edges[:-1]) | (parameters[1:] != parameters[:-1])
+        edges, parameters = edges[distinct], parameters[distinct]
+        points = starts[edges] + parameters[:, None] * (ends[edges] - starts[edges])
+        same_edge = edges[1:] == edges[:-1]
+        piece_starts, piece_ends = points[:-1][same_edge], points[1:][same_edge]
+        long_enough = np.abs(piece_ends - piece_starts).max(axis=1) > EPSILON
+        piece_starts, piece_ends = piece_starts[long_enough], piece_ends[long_enough]
+
+        midpoints = (piece_starts + piece_ends) / 2
+        keep = np.ones(len(midpoints), dtype=bool)
+        for other_index in neighbours:
+            other = rings[other_index]
+            location = locate_in_ring(midpoints, other)
+            keep &= location != 1
+            for piece in np.nonzero(keep & (location == 0))[0]:
+                # Shared boundary: kept once when both rings run the same way, dropped when they are back to back
+                same_direction = edge_direction_at(other, midpoints[piece]) @ (piece_ends[piece] - piece_starts[piece]) > 0
+                keep[piece] = same_direction and index < other_index
+        kept.extend(zip(piece_starts[keep], piece_ends[keep]))
+
+    rings_out = chain_pieces(kept)
+    if rings_out is None:
+        return None
+    outers = [ring for ring in rings_out if signed_area(ring) > 0]
+    holes = [ring for ring in rings_out if signed_area(ring) < 0]
+    polygons = [[outer] for outer in outers]
+    for hole in holes:
+        # A hole belongs to the smallest outer ring around it
+        containing = [
+            index for index, outer in enumerate(outers)
+            if box_contains(ring_bbox(outer), hole[0]) and locate_in_ring(hole[:1], outer)[0] >= 0
+        ]
+        if not containing:
+            return None
+        polygons[min(containing, key=lambda index: signed_area(outers[index]))].append(hole)
+    return polygons
+
+
+# Direction of the edge of ring passing through point
+def edge_direction_at(ring, point):
+    starts, ends = ring_edges(ring)
+    direction = ends - starts
+    length2 = (direction ** 2).sum(axis=1)
+    along = np.clip(((point - starts) * direction).sum(axis=1) / length2, 0.0, 1.0)
+    distance2 = ((starts + along[:, None] * direction - point) ** 2).sum(axis=1)
+    return direction[np.argmin(distance2)]
+
+
+# Chain directed segments into closed rings, taking the rightmost turn where several segments leave a vertex
+def chain_pieces(pieces):
+    def point_key(point):
+        return tuple(np.round(point, COORDINATE_DECIMALS) + 0.0)
+
+    outgoing = defaultdict(list)
+    for index, (start, _) in enumerate(pieces):
+        outgoing[point_key(start)].append(index)
+
+    used = np.zeros(len(pieces), dtype=bool)
+    rings = []
+    for first in range(len(pieces)):
+        if used[first]:
+            continue
+        used[first] = True
+        start_key = point_key(pieces[first][0])
+        ring = [pieces[first][0]]
+        current = first
+        while True:
+            end = pieces[current][1]
+            if point_key(end) == start_key:
+                break
+            candidates = [index for index in outgoing[point_key(end)] if not used[index]]
+            if not candidates:
+                return None
+            incoming = pieces[current][1] - pieces[current][0]
+
+            def turn(index):
+                leaving = pieces[index][1] - pieces[index][0]
+                return math.atan2(incoming[0] * leaving[1] - incoming[1] * leaving[0], incoming @ leaving)
+            current = min(candidates, key=turn)
+            used[current] = True
+            ring.append(pieces[current][0])
+        ring = drop_collinear(np.array(ring))
+        if len(ring) >= 3 and abs(signed_area(ring)) > EPSILON * EPSILON:
+            rings.append(ring)
+    return rings
+
+
+# Vertices in the middle of a straight run (left where two input edges were joined) are not needed
+def drop_collinear(ring):
+    previous = ring - np.roll(ring, 1, axis=0)
+    following = np.roll(ring, -1, axis=0) - ring
+    cross = previous[:, 0] * following[:, 1] - previous[:, 1] * following[:, 0]
+    straight = (np.abs(cross) <= EPSILON * EPSILON) & ((previous * following).sum(axis=1) > 0)
+    return ring[~straight]
+
+
+def polygon_geometry(polygon):
+    return {
+        'type': 'Polygon',
+        'coordinates': [np.vstack([ring, ring[:1]]).tolist() for ring in polygon],
+    }
+
+
+# Merge the valid Polygon/MultiPolygon geometries of an upload: exact duplicates and polygons nested in another one
+# are dropped, overlapping hole-free polygons are replaced by their union (groups above MAX_UNION_PAIRS ring pairs
+# or MAX_UNION_VERTICES vertices are kept as they are and counted in 'overlaps_kept'). Returns (geometries, report);
+# the geometries are returned unchanged when nothing is redundant.
+def merge_geometries(geometries):
+    polygons = []
+    for geometry in geometries:
+        for polygon in polygon_rings(geometry):
+            rings = [oriented_ring(polygon[0])] + [oriented_ring(hole, counterclockwise=False) for hole in polygon[1:]]
+            polygons.append(rings)
+
+    report = {
+        'polygons_before': len(polygons),
+        'polygons_after': len(polygons),
+        'duplicates': 0,
+        'nested': 0,
+        'merged': 0,
+        'overlaps_kept': 0,
+        'vertices_removed': 0,
+        'redundant_area': 0.0,
+    }
+    if len(polygons) < 2:
+        return geometries, report
+
+    alive = np.ones(len(polygons), dtype=bool)
+
+    # Exact duplicates, whatever their starting vertex and orientation
+    seen = {}
+    for index, polygon in enumerate(polygons):
+        key = polygon_key(polygon)
+        if key in seen:
+            alive[index] = False
+            report['duplicates'] += 1
+        else:
+            seen[key] = index
+
+    # Nested and overlapping pairs among the polygons whose bounding boxes intersect
+    index = GridIndex([polygon_bbox(polygon) for polygon in polygons])
+    parent = list(range(len(polygons)))
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    candidate_pairs = list(index.pairs())
+    for first, second in candidate_pairs:
+        if not (alive[first] and alive[second]):
+            continue
+        relation = relate(polygons[first], polygons[second])
+        if relation == 'inside':
+            alive[first] = False
+            report['nested'] += 1
+        elif relation == 'contains':
+            alive[second] = False
+            report['nested'] += 1
+        elif relation == 'overlap':
+            if len(polygons[first]) == 1 and len(polygons[second]) == 1:
+                parent[find(first)] = find(second)
+            else:
+                report['overlaps_kept'] += 1
+
+    groups = defaultdict(list)
+    for item in np.nonzero(alive)[0]:
+        groups[find(int(item))].append(int(item))
+    # Ring pairs the union of each group compares, its cost grows with them rather than with the vertices
+    group_pairs = defaultdict(int)
+    for first, second in candidate_pairs:
+        if alive[first] and alive[second] and find(first) == find(second):
+            group_pairs[find(first)] += 1
+
+    merged_polygons = []
+    for root, members in groups.items():
+        if len(members) == 1:
+            merged_polygons.append(polygons[members[0]])
+            continue
+        rings = [polygons[member][0] for member in members]
+        small_enough = group_pairs[root] <= MAX_UNION_PAIRS and sum(len(ring) for ring in rings) <= MAX_UNION_VERTICES
+        union = union_rings(rings) if small_enough else None
+        if union is None:
+            # Degenerate configuration or too large a group, the polygons are sent as they are
+            merged_polygons.extend(polygons[member] for member in members)
+            report['overlaps_kept'] += len(members) - 1
+            continue
+        merged_polygons.extend(union)
+        report['merged'] += len(members)
+
+    if not (report['duplicates'] or report['nested'] or report['merged']):
+        return geometries, report
+
+    merged = [polygon_geometry(polygon) for polygon in merged_polygons]
+    before = summarize_geometries(geometries)
+    after = summarize_geometries(merged)
+    report.update({
+        'polygons_after': len(merged_polygons),
+        'vertices_removed': before['vertices'] - after['vertices'],
+        'redundant_area': max(0.0, before['total_area'] - after['total_area']),
+    })
+    return merged, report
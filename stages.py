@@ -0,0 +1,84 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Results kept per graph, enough for both dates of a few recent parameter combinations
+DEFAULT_MAX_ENTRIES = 64
+
+StageResult = namedtuple('StageResult', ['key', 'value', 'reused'])
+
+
+# Key of a stage: its name, its own inputs and the keys of the stages it depends on
+def stage_key(name, inputs, upstream_keys):
+    payload = json.dumps([name, inputs, upstream_keys], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+# Memoized pipeline stages: a stage only runs again when its inputs or an upstream stage changed
+class StageGraph:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        # Keys of the stages resolved during the current rerun, by stage name
+        self.keys = {}
+        self.reused = []
+        self.computed = []
+
+    # Called at the top of every rerun
+    def start_rerun(self):
+        with self._lock:
+            self.keys = {}
+            self.reused = []
+            self.computed = []
+
+    def key(self, name):
+        return self.keys[name]
+
+    # Result of a stage already resolved during this rerun
+    def value(self, name):
+        with self._lock:
+            return self._results[self.keys[name]]
+
+    # Compute and remember the key of a stage whose result is cached elsewhere (e.g. map IDs)
+    def register(self, name, inputs, after=()):
+        with self._lock:
+            key = stage_key(name.split(':')[0], inputs, [self.keys[upstream] for upstream in after])
+            self.keys[name] = key
+        return key
+
+    def record(self, name, reused):
+        with self._lock:
+            (self.reused if reused else self.computed).append(name)
+
+    def run(self, name, inputs, compute, after=()):
+        key = self.register(name, inputs, after)
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.reused.append(name)
+                return StageResult(key, self._results[key], True)
+
+        # Computed outside the lock, stages of independent layers can run in parallel
+        with tracing.span(f'stage:{name}'):
+            value = compute()
+        with self._lock:
+            self._results[key] = value
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            self.computed.append(name)
+        return StageResult(key, value, False)
+
+    def log_rerun(self):
+        logger.info(
+            "stages reused: %s | recomputed: %s",
+            ', '.join(self.reused) or '-',
+            ', '.join(self.computed) or '-',
+        )
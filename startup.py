@@ -0,0 +1,65 @@
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Set to a file path to also write the startup report as JSON
+STARTUP_REPORT_ENV = 'NDVI_STARTUP_REPORT'
+
+# Process-wide startup timings: step name -> seconds, in the order the steps happened
+timings = {}
+_lock = threading.Lock()
+_reported = False
+
+
+def record(step, seconds):
+    with _lock:
+        timings.setdefault(step, seconds)
+
+
+@contextmanager
+def measure(step):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(step, time.perf_counter() - started)
+
+
+# Import a module and record how long its first import took (modules already loaded cost nothing)
+def timed_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    with measure(f'import {name}'):
+        return importlib.import_module(name)
+
+
+def report():
+    with _lock:
+        steps = dict(timings)
+    return {'steps': steps, 'total': sum(steps.values())}
+
+
+# Log the breakdown once per process, slowest step first
+def log_report():
+    global _reported
+    with _lock:
+        if _reported:
+            return
+        _reported = True
+    startup_report = report()
+    logger.info("startup took %.2fs", startup_report['total'])
+    for step, seconds in sorted(startup_report['steps'].items(), key=lambda item: -item[1]):
+        logger.info("  %-28s %7.3fs", step, seconds)
+
+    path = os.environ.get(STARTUP_REPORT_ENV)
+    if path:
+        with open(path, 'w') as report_file:
+            json.dump(startup_report, report_file, indent=2)
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from batch import main, read_manifest
+
+
+def write_manifest(tmp_path, manifest):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps(manifest))
+    return str(path)
+
+
+def test_default_ids_come_from_the_relative_aoi_path(tmp_path):
+    path = write_manifest(tmp_path, {'aois': ['north/farm.geojson', 'south/farm.geojson', 'farm.geojson'], 'dates': ['2024-05-01']})
+    jobs = read_manifest(path)
+    assert [job['id'] for job in jobs] == ['north_farm_2024-05-01', 'south_farm_2024-05-01', 'farm_2024-05-01']
+    assert jobs[0]['aoi'] == str(tmp_path / 'north' / 'farm.geojson')
+
+
+def test_csv_manifest_with_defaults(tmp_path):
+    path = tmp_path / 'manifest.csv'
+    path.write_text('aoi,date,id,cloud_rate\nfarm.geojson,2024-05-01,,\nfarm.geojson,2024-06-01,june,20\n')
+    jobs = read_manifest(str(path))
+    assert [(job['id'], job['cloud_rate']) for job in jobs] == [('farm_2024-05-01', 85.0), ('june', 20.0)]
+
+
+def test_repeated_ids_are_refused(tmp_path):
+    path = write_manifest(tmp_path, {'jobs': [
+        {'aoi': 'north/farm.geojson', 'date': '2024-05-01', 'id': 'farm'},
+        {'aoi': 'south/farm.geojson', 'date': '2024-05-01', 'id': 'farm'},
+    ]})
+    with pytest.raises(ValueError, match="'farm'"):
+        read_manifest(path)
+    with pytest.raises(SystemExit):
+        main([path, '--output', str(tmp_path / 'results')])
+    assert not (tmp_path / 'results').exists()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from classification import NDVI_CLASSES, NODATA_CLASS, class_area_statistics_array, class_pixel_counts, classify_ndvi_array
+
+
+def test_breakpoints_match_the_class_table():
+    # Each lower bound belongs to its own class, the value just below it to the previous one
+    for value, lower, _ in NDVI_CLASSES:
+        assert classify_ndvi_array(np.array([lower]))[0] == value
+        below = np.nextafter(lower, -np.inf)
+        assert classify_ndvi_array(np.array([below]))[0] == value - 1
+
+
+def test_classes_of_typical_values():
+    ndvi = np.array([np.nan, -0.5, -0.01, 0.0, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.6, 0.65, 0.7, 0.75, 1.0])
+    expected = [NODATA_CLASS, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7]
+    classified = classify_ndvi_array(ndvi)
+    assert classified.dtype == np.uint8
+    assert classified.tolist() == expected
+
+
+def test_float32_ndvi_is_compared_as_is():
+    # 0.35 is not representable: its float32 value lies just below the 0.35 bound
+    ndvi = np.array([0.35, 0.15], dtype=np.float32)
+    assert classify_ndvi_array(ndvi).tolist() == [3, 2]
+
+
+def test_area_table():
+    classified = classify_ndvi_array(np.array([[np.nan, 0.1, 0.1], [0.2, 0.8, 0.8], [0.8, 0.8, np.nan]]))
+    counts = class_pixel_counts(classified)
+    assert counts.tolist() == [2, 2, 1, 0, 0, 0, 0, 4]
+    rows = class_area_statistics_array(counts, pixel_area=100)
+    assert [row['class'] for row in rows] == [value for value, _, _ in NDVI_CLASSES]
+    assert [row['label'] for row in rows] == [label for _, _, label in NDVI_CLASSES]
+    assert [row['pixels'] for row in rows] == [2, 1, 0, 0, 0, 0, 4]
+    # 10 m pixels: 100 m² each, masked pixels are left out
+    assert [row['hectares'] for row in rows] == pytest.approx([0.02, 0.01, 0, 0, 0, 0, 0.04])
+    assert sum(row['share'] for row in rows) == pytest.approx(1.0)
+    assert rows[-1]['share'] == pytest.approx(4 / 7)
+
+
+def test_empty_area_table():
+    rows = class_area_statistics_array(class_pixel_counts(np.zeros((2, 2), dtype=np.uint8)))
+    assert all(row['pixels'] == 0 and row['share'] == 0.0 for row in rows)
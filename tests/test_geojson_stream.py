@@ -0,0 +1,123 @@
+import codecs
+import io
+import json
+
+import pytest
+
+from geojson_stream import JSONScanner, iter_geometries
+
+
+def feature(index, coordinates, **properties):
+    return {
+        'type': 'Feature',
+        'properties': {'index': index, **properties},
+        'geometry': {'type': 'Polygon', 'coordinates': coordinates},
+    }
+
+
+SQUARE = [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]
+DOCUMENT = {
+    'type': 'FeatureCollection',
+    # Skipped values of every kind before the features, with structure characters inside strings
+    'name': 'a "quoted" name with \\ backslashes, {braces} and [brackets]',
+    'crs': {'type': 'name', 'properties': {'name': 'urn:ogc:def:crs:OGC:1.3:CRS84', 'nested': [[1, 2], {'a': []}]}},
+    'count': 3,
+    'ratio': -1.5e-3,
+    'flags': [True, False, None],
+    'features': [
+        feature(0, SQUARE, name='São Paulo', note='tab\there, newline\nthere, unicode é中\U0001f331'),
+        # Features without a usable geometry are skipped
+        {'type': 'Feature', 'properties': {}, 'geometry': None},
+        'not a feature',
+        feature(1, [[[2.5, 2.5], [3.5, 2.5], [3.5, 3.5], [2.5, 2.5]]], escaped='\\"}]'),
+        feature(2, SQUARE, empty={}, list=[]),
+    ],
+    # Features of a nested object are skipped with it
+    'trailing': {'features': [feature(9, SQUARE)]},
+}
+
+
+def reference_geometries(document):
+    return [
+        item['geometry'] for item in document['features']
+        if isinstance(item, dict) and isinstance(item.get('geometry'), dict) and 'coordinates' in item['geometry']
+    ]
+
+
+def encode(document, **options):
+    return json.dumps(document, **options).encode('utf-8')
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 65))
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+def test_parity_with_json_loads(chunk_size, ensure_ascii):
+    data = encode(DOCUMENT, ensure_ascii=ensure_ascii, indent=1)
+    geometries = list(iter_geometries(io.BytesIO(data), chunk_size))
+    assert geometries == reference_geometries(json.loads(data))
+    assert len(geometries) == 3
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64])
+def test_byte_order_mark(chunk_size):
+    data = codecs.BOM_UTF8 + encode(DOCUMENT, ensure_ascii=False)
+    assert list(iter_geometries(io.BytesIO(data), chunk_size)) == reference_geometries(DOCUMENT)
+
+
+def test_text_stream():
+    assert list(iter_geometries(io.StringIO(json.dumps(DOCUMENT)))) == reference_geometries(DOCUMENT)
+
+
+def test_geometry_collection():
+    document = {'type': 'GeometryCollection', 'geometries': [feature(0, SQUARE)['geometry'], {'type': 'Point'}]}
+    assert list(iter_geometries(io.BytesIO(encode(document)), 5)) == [feature(0, SQUARE)['geometry']]
+
+
+@pytest.mark.parametrize('data', [b'', b'   ', b'[1, 2]', b'"text"'])
+def test_not_an_object(data):
+    assert list(iter_geometries(io.BytesIO(data))) == []
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 64])
+def test_scanner_values_match_json_loads(chunk_size):
+    values = [
+        {'a': [1, {'b': '}'}], 'c': 'x\\"y'}, [], {}, '', 'a\\\\', 'é\U0001f331', 0, -12.5e10, True, False, None,
+        [[1.0, 2.0], [3.0, 4.0]],
+    ]
+    text = ' , '.join(json.dumps(value, ensure_ascii=False) for value in values)
+    scanner = JSONScanner(io.BytesIO(text.encode('utf-8')), chunk_size)
+    for index, value in enumerate(values):
+        if index:
+            scanner.expect(',')
+        assert scanner.read_value() == value
+    assert scanner.peek() == ''
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64])
+def test_skipped_value_is_consumed(chunk_size):
+    scanner = JSONScanner(io.BytesIO(b'{"skip": [1, "]", {"x": "\\\\"}]} "next"'), chunk_size)
+    assert scanner.scan_value(keep=False) is None
+    assert scanner.read_value() == 'next'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 64])
+def test_truncated_files(chunk_size):
+    data = encode(DOCUMENT, ensure_ascii=False)
+    expected = reference_geometries(DOCUMENT)
+    for cut in range(len(data)):
+        # A cut is either reported as a ValueError or yields the features read before it
+        try:
+            geometries = list(iter_geometries(io.BytesIO(data[:cut]), chunk_size))
+        except ValueError:
+            continue
+        assert geometries == expected[:len(geometries)]
+
+
+@pytest.mark.parametrize('truncated', [
+    b'{"features": [{"geometry": {"type": "Polygon", "coordinates": [[[0, 0]',
+    b'{"features": [{"properties": {"name": "unterminated',
+    b'{"features": [{"a": 1}, ',
+    b'{"name": ',
+])
+def test_truncated_inside_a_value_raises(truncated):
+    with pytest.raises(ValueError):
+        list(iter_geometries(io.BytesIO(truncated), 4))
@@ -0,0 +1,142 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+from geometry import EARTH_RADIUS, MAX_ZOOM, MIN_ZOOM, map_view, simplify_geometry, summarize_geometries
+
+
+def square(min_x, min_y, max_x, max_y):
+    return [[min_x, min_y], [max_x, min_y], [max_x, max_y], [min_x, max_y], [min_x, min_y]]
+
+
+# Area in square meters of a lon/lat rectangle on the sphere
+def cell_area(min_x, min_y, max_x, max_y):
+    return EARTH_RADIUS ** 2 * math.radians(max_x - min_x) * (math.sin(math.radians(max_y)) - math.sin(math.radians(min_y)))
+
+
+# Wavy ring around (lon, lat) with many vertices, about 2 km across
+def wavy_ring(lon, lat, vertices=2000):
+    angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    radius = 0.01 * (1 + 0.0005 * np.sin(40 * angles))
+    ring = np.column_stack([lon + radius * np.cos(angles), lat + radius * np.sin(angles)])
+    return np.vstack([ring, ring[:1]]).tolist()
+
+
+def test_polygon_with_hole():
+    hole = square(0.25, 0.25, 0.75, 0.75)
+    summary = summarize_geometries([{'type': 'Polygon', 'coordinates': [square(0, 0, 1, 1), hole]}])
+    assert summary['valid'].tolist() == [True]
+    assert summary['problems'] == []
+    assert summary['centroids'][0] == pytest.approx([0.5, 0.5])
+    assert summary['bboxes'][0].tolist() == [0, 0, 1, 1]
+    expected = cell_area(0, 0, 1, 1) - cell_area(0.25, 0.25, 0.75, 0.75)
+    assert summary['areas'][0] == pytest.approx(expected, rel=1e-3)
+    assert summary['total_area'] == pytest.approx(expected, rel=1e-3)
+    assert summary['vertices'] == 10
+
+    # The hole is subtracted whatever its winding order
+    same_winding = summarize_geometries([{'type': 'Polygon', 'coordinates': [square(0, 0, 1, 1), hole[::-1]]}])
+    assert same_winding['areas'][0] == pytest.approx(summary['areas'][0])
+
+
+def test_multipolygon():
+    geometry = {'type': 'MultiPolygon', 'coordinates': [[square(0, 0, 1, 1)], [square(2, 0, 4, 1)]]}
+    summary = summarize_geometries([geometry])
+    assert summary['valid'].tolist() == [True]
+    # Weighted by area: the second square is twice as large
+    assert summary['centroids'][0] == pytest.approx([(0.5 + 2 * 3) / 3, 0.5], rel=1e-9)
+    assert summary['bboxes'][0].tolist() == [0, 0, 4, 1]
+    assert summary['areas'][0] == pytest.approx(3 * cell_area(0, 0, 1, 1), rel=1e-3)
+
+
+def test_several_features_and_unclosed_ring():
+    geometries = [
+        {'type': 'Polygon', 'coordinates': [square(10, 40, 11, 41)[:-1]]},
+        {'type': 'Polygon', 'coordinates': [square(12, 42, 13, 43)]},
+    ]
+    summary = summarize_geometries(geometries)
+    assert summary['valid'].tolist() == [True, True]
+    assert summary['centroids'] == pytest.approx(np.array([[10.5, 40.5], [12.5, 42.5]]))
+    assert summary['bbox'].tolist() == [10, 40, 13, 43]
+    assert summary['areas'][0] == pytest.approx(cell_area(10, 40, 11, 41), rel=1e-3)
+    assert summary['total_area'] == pytest.approx(summary['areas'].sum())
+
+
+@pytest.mark.parametrize('geometry, problem', [
+    ({'type': 'Polygon', 'coordinates': [square(170, 0, 190, 1)]}, "out of range coordinates or zero area"),
+    ({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [2, 2], [0, 0]]]}, "out of range coordinates or zero area"),
+    ({'type': 'Polygon', 'coordinates': [[[0, 0], [1, 1], [0, 0]]]}, "fewer than 3 distinct positions"),
+    ({'type': 'Point', 'coordinates': [0, 0]}, "unsupported geometry type 'Point'"),
+    ({'type': 'Polygon', 'coordinates': []}, "geometry has no rings"),
+    ({'type': 'Polygon', 'coordinates': [[0, 0]]}, "ring is not a list of positions"),
+])
+def test_invalid_geometries_are_reported_and_skipped(geometry, problem):
+    valid = {'type': 'Polygon', 'coordinates': [square(0, 0, 1, 1)]}
+    summary = summarize_geometries([valid, geometry])
+    assert summary['valid'].tolist() == [True, False]
+    assert [index for index, _ in summary['problems']] == [1]
+    assert problem in summary['problems'][0][1]
+    assert np.isnan(summary['centroids'][1]).all()
+    assert np.isnan(summary['bboxes'][1]).all()
+    assert summary['areas'][1] == 0
+    assert summary['bbox'].tolist() == [0, 0, 1, 1]
+    assert summary['vertices'] == 5
+
+
+def test_no_valid_geometry():
+    summary = summarize_geometries([{'type': 'Point', 'coordinates': [0, 0]}])
+    assert not summary['valid'].any()
+    assert summary['bbox'] is None
+    assert summary['total_area'] == 0.0
+
+
+def test_map_view_fits_the_bbox():
+    bbox = [10.0, 36.0, 10.5, 36.5]
+    center, zoom = map_view(bbox)
+    assert center == pytest.approx([36.25, 10.25])
+    # The latitude span limits the zoom: about 0.62 Mercator degrees in 500 pixels fit at zoom 10, not 11
+    assert zoom == 10
+    # On a 200 pixel wide map the longitude span limits it: 0.5 degrees fit in 200 pixels at zoom 9
+    assert map_view(bbox, width=200)[1] == 9
+    assert map_view([-180, -85, 180, 85])[1] == MIN_ZOOM
+    assert map_view([10.0, 36.0, 10.0, 36.0])[1] == MAX_ZOOM
+
+
+def test_simplify_counts_vertices_and_shrinks_payload():
+    geometry = {'type': 'Polygon', 'coordinates': [wavy_ring(10, 36), wavy_ring(10, 36, 500)[::-1]]}
+    geometry['coordinates'][1] = [[lon, 36 + (lat - 36) / 4] for lon, lat in geometry['coordinates'][1]]
+    simplified, before, after = simplify_geometry(geometry, 5)
+    assert before == 2001 + 501
+    assert after == sum(len(ring) for ring in simplified['coordinates'])
+    assert after < before / 4
+    assert len(json.dumps(simplified['coordinates'])) < len(json.dumps(geometry['coordinates'])) / 4
+    for ring in simplified['coordinates']:
+        assert ring[0] == ring[-1]
+    # A 5 m tolerance barely changes the area of a 2 km wide ring
+    areas = summarize_geometries([geometry, simplified])['areas']
+    assert areas[1] == pytest.approx(areas[0], rel=1e-2)
+
+
+def test_simplify_keeps_rings_that_would_collapse():
+    # A 1 m square with a 100 m tolerance
+    tiny = square(10, 36, 10.00001, 36.00001)
+    geometry = {'type': 'MultiPolygon', 'coordinates': [[tiny], [wavy_ring(11, 36)]]}
+    simplified, before, after = simplify_geometry(geometry, 100)
+    assert simplified['type'] == 'MultiPolygon'
+    assert simplified['coordinates'][0] == [tiny]
+    assert len(simplified['coordinates'][1][0]) >= 4
+    assert after < before
+
+
+def test_simplify_without_tolerance_is_unchanged():
+    geometry = {'type': 'Polygon', 'coordinates': [wavy_ring(10, 36, 100)]}
+    simplified, before, after = simplify_geometry(geometry, 0)
+    assert simplified == geometry
+    assert before == after == 101
+
+
+def test_simplify_unsupported_type():
+    with pytest.raises(ValueError):
+        simplify_geometry({'type': 'LineString', 'coordinates': [[0, 0], [1, 1]]}, 10)
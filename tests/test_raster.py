@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from classification import NODATA_CLASS, class_pixel_counts, classify_ndvi_array
+from raster import get_ndvi, open_bands, process_scene, sat_image_mask, tile_windows
+
+ROWS, COLS = 70, 45
+TILE_SIZE = 16
+
+
+# Sentinel-2 L2A digital numbers, with the special cases: negative reflectance, 0/0 and water (negative NDVI)
+@pytest.fixture
+def bands():
+    rng = np.random.default_rng(42)
+    red = rng.integers(0, 5000, (ROWS, COLS)).astype(np.int16)
+    nir = rng.integers(0, 8000, (ROWS, COLS)).astype(np.int16)
+    red[0, 0], nir[0, 0] = 0, 0
+    red[1, 1] = -5
+    nir[2, 2] = -1
+    red[3, 3], nir[3, 3] = 3000, 500
+    return red, nir
+
+
+# The whole scene in memory: the same steps the tiles go through
+def expected_outputs(red, nir):
+    ndvi = sat_image_mask(get_ndvi(nir, red))
+    return ndvi, classify_ndvi_array(ndvi)
+
+
+def check_outputs(outputs, class_counts, red, nir):
+    ndvi, classified = expected_outputs(red, nir)
+    ndvi_out = np.load(outputs['ndvi'])
+    classified_out = np.load(outputs['classified'])
+    assert ndvi_out.dtype == np.float32
+    # Bit for bit, NaN where masked
+    assert np.array_equal(ndvi_out.view(np.uint32), ndvi.view(np.uint32))
+    assert np.array_equal(classified_out, classified)
+    assert np.array_equal(class_counts, class_pixel_counts(classified))
+
+
+def test_tile_windows_cover_the_raster_once():
+    coverage = np.zeros((ROWS, COLS), dtype=int)
+    for row_start, row_end, col_start, col_end in tile_windows(ROWS, COLS, TILE_SIZE):
+        assert row_end - row_start <= TILE_SIZE and col_end - col_start <= TILE_SIZE
+        coverage[row_start:row_end, col_start:col_end] += 1
+    assert (coverage == 1).all()
+
+
+def test_ndvi_masks_like_earth_engine(bands):
+    red, nir = bands
+    ndvi, classified = expected_outputs(red, nir)
+    # 0/0, negative inputs and water have no NDVI and no class
+    assert np.isnan(ndvi[[0, 1, 2, 3], [0, 1, 2, 3]]).all()
+    assert (classified[[0, 1, 2, 3], [0, 1, 2, 3]] == NODATA_CLASS).all()
+    land = ~np.isnan(ndvi)
+    assert (ndvi[land] >= 0).all() and (ndvi[land] <= 1).all()
+    # The scaling to reflectance cancels out of the normalized difference
+    nir64, red64 = nir[land].astype(float), red[land].astype(float)
+    assert ndvi[land] == pytest.approx((nir64 - red64) / (nir64 + red64), abs=1e-6)
+
+
+def test_tiled_scene_matches_whole_array(bands, tmp_path):
+    red, nir = bands
+    np.save(tmp_path / 'red.npy', red)
+    np.save(tmp_path / 'nir.npy', nir)
+    sources = open_bands(red=str(tmp_path / 'red.npy'), nir=str(tmp_path / 'nir.npy'))
+    outputs, class_counts = process_scene(sources, str(tmp_path / 'out'), tile_size=TILE_SIZE, workers=1)
+    check_outputs(outputs, class_counts, red, nir)
+
+
+def test_npz_bands(bands, tmp_path):
+    red, nir = bands
+    np.savez(tmp_path / 'bands.npz', B4=red, B8=nir)
+    sources = open_bands(npz=str(tmp_path / 'bands.npz'), workdir=str(tmp_path))
+    outputs, class_counts = process_scene(sources, str(tmp_path / 'out'), tile_size=TILE_SIZE, workers=1)
+    check_outputs(outputs, class_counts, red, nir)
+
+
+def test_raw_band_stack(bands, tmp_path):
+    red, nir = bands
+    # Band order of the stack: B8 first
+    np.stack([nir, red]).tofile(tmp_path / 'stack.bin')
+    sources = open_bands(stack=str(tmp_path / 'stack.bin'), dtype='int16', shape=(2, ROWS, COLS), band_order=('B8', 'B4'))
+    outputs, class_counts = process_scene(sources, str(tmp_path / 'out'), tile_size=TILE_SIZE, workers=1)
+    check_outputs(outputs, class_counts, red, nir)
+
+
+def test_raw_band_stack_needs_dtype_and_shape(tmp_path):
+    with pytest.raises(ValueError):
+        open_bands(stack=str(tmp_path / 'stack.bin'))
+
+
+def test_band_shapes_must_match(bands, tmp_path):
+    red, nir = bands
+    np.save(tmp_path / 'red.npy', red)
+    np.save(tmp_path / 'nir.npy', nir[:-1])
+    sources = open_bands(red=str(tmp_path / 'red.npy'), nir=str(tmp_path / 'nir.npy'))
+    with pytest.raises(ValueError):
+        process_scene(sources, str(tmp_path / 'out'), workers=1)
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+
+import pytest
+
+from map_cache import MapIdCache
+from result_cache import ResultCache, result_key
+
+THREADS = 10
+
+
+# Manually advanced clock
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+# Run resolve(key, compute) from THREADS threads at once, returning the results (or errors) of every thread
+def resolve_concurrently(cache, key, compute):
+    outcomes = [None] * THREADS
+
+    def run(index):
+        try:
+            outcomes[index] = cache.resolve(key, compute)
+        except Exception as error:
+            outcomes[index] = error
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+# Earth Engine call stand-in: counts its calls and waits for every other caller to queue up behind it
+class SlowCompute:
+    def __init__(self, cache, value=None, error=None):
+        self.cache = cache
+        self.value = value
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        wait_until(lambda: self.cache.stats()['coalesced'] == THREADS - 1)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+# Image stand-in with the two calls MapIdCache makes
+class FakeImage:
+    def __init__(self, expression):
+        self.expression = expression
+        self.map_id_calls = 0
+
+    def serialize(self):
+        return self.expression
+
+    def getMapId(self, vis_params):
+        self.map_id_calls += 1
+        tile_fetcher = type('TileFetcher', (), {'url_format': f'https://tiles/{self.expression}/{{z}}/{{x}}/{{y}}'})()
+        return {'mapid': f'{self.expression}-{self.map_id_calls}', 'tile_fetcher': tile_fetcher}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_key_depends_on_every_part():
+    key = result_key('stats', aoi='a', start='2024-01-01')
+    assert key == result_key('stats', start='2024-01-01', aoi='a')
+    assert key != result_key('stats', aoi='a', start='2024-01-02')
+    assert key != result_key('map_id', aoi='a', start='2024-01-01')
+
+
+def test_concurrent_requests_share_one_computation(clock):
+    cache = ResultCache(clock=clock)
+    compute = SlowCompute(cache, value={'rows': [1, 2, 3]})
+    outcomes = resolve_concurrently(cache, 'key', compute)
+    assert compute.calls == 1
+    assert all(value == {'rows': [1, 2, 3]} for value, _ in outcomes)
+    # The leader computed it, every other caller waited for it
+    assert sorted(hit for _, hit in outcomes) == [False] + [True] * (THREADS - 1)
+    stats = cache.stats()
+    assert (stats['misses'], stats['coalesced'], stats['in_flight']) == (1, THREADS - 1, 0)
+
+
+def test_error_is_shared_by_waiting_callers(clock):
+    cache = ResultCache(clock=clock)
+    error = RuntimeError("quota exceeded")
+    compute = SlowCompute(cache, error=error)
+    outcomes = resolve_concurrently(cache, 'key', compute)
+    assert compute.calls == 1
+    assert all(outcome is error for outcome in outcomes)
+    # Errors are not cached, the next request computes again
+    assert cache.resolve('key', lambda: 'value') == ('value', False)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResultCache(ttl=60, clock=clock)
+    cache.store('key', 'value')
+    clock.now += 59
+    assert cache.resolve('key', lambda: 'fresh') == ('value', True)
+    clock.now += 1
+    assert cache.resolve('key', lambda: 'fresh') == ('fresh', False)
+    assert cache.stats()['expirations'] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResultCache(max_entries=2, clock=clock)
+    cache.store('a', 1)
+    cache.store('b', 2)
+    assert cache.lookup('a') == 1
+    cache.store('c', 3)
+    assert cache.lookup('b') is None
+    assert (cache.lookup('a'), cache.lookup('c')) == (1, 3)
+    stats = cache.stats()
+    assert (stats['size'], stats['evictions']) == (2, 1)
+
+
+def test_byte_bound_evicts_entries(clock):
+    cache = ResultCache(max_bytes=100, clock=clock)
+    cache.store('a', 'x', size=40)
+    cache.store('b', 'y', size=40)
+    cache.store('c', 'z', size=40)
+    assert cache.lookup('a') is None
+    stats = cache.stats()
+    assert (stats['size'], stats['bytes'], stats['evictions']) == (2, 80, 1)
+    # A single entry larger than the bound is still kept, alone
+    cache.store('d', 'w', size=500)
+    stats = cache.stats()
+    assert (stats['size'], stats['bytes'], stats['evictions']) == (1, 500, 3)
+
+
+def test_persisted_result_survives_restart(tmp_path, clock):
+    directory = str(tmp_path / 'results')
+    cache = ResultCache(ttl=60, directory=directory, clock=clock)
+    assert cache.resolve('key', lambda: {'area': 12.5}, persist=True) == ({'area': 12.5}, False)
+    files = [name for _, _, names in os.walk(directory) for name in names]
+    assert files == ['key.json']
+
+    restarted = ResultCache(ttl=60, directory=directory, clock=clock)
+    assert restarted.resolve('key', lambda: {'area': 0.0}, persist=True) == ({'area': 12.5}, True)
+    assert restarted.stats()['disk_hits'] == 1
+
+    # The age of a result read back from disk counts from when it was first computed
+    clock.now += 60
+    expired = ResultCache(ttl=60, directory=directory, clock=clock)
+    assert expired.lookup('key') is None
+
+
+def test_unserializable_result_is_kept_in_memory_only(tmp_path, clock):
+    directory = str(tmp_path / 'results')
+    cache = ResultCache(directory=directory, clock=clock)
+    value = {'image': object()}
+    cache.store('key', value, persist=True)
+    assert cache.lookup('key') is value
+    assert not any(names for _, _, names in os.walk(directory))
+
+
+def test_map_id_cache_calls_get_map_id_once(clock):
+    cache = MapIdCache(clock=clock)
+    image = FakeImage('ndvi')
+    entry = cache.get_map_id(image, {'min': 0, 'max': 1})
+    assert cache.get_map_id(image, {'min': 0, 'max': 1}) == entry
+    assert image.map_id_calls == 1
+    assert entry['url_format'] == 'https://tiles/ndvi/{z}/{x}/{y}'
+    # Other visualization parameters are another map ID
+    cache.get_map_id(image, {'min': -1, 'max': 1})
+    assert image.map_id_calls == 2
+
+
+def test_map_id_cache_ttl(clock):
+    cache = MapIdCache(ttl=3600, clock=clock)
+    image = FakeImage('ndvi')
+    first = cache.get_map_id(image, None)
+    clock.now += 3599
+    assert cache.get_map_id(image, None) == first
+    clock.now += 1
+    refreshed = cache.get_map_id(image, None)
+    assert refreshed['mapid'] == 'ndvi-2'
+    assert refreshed['created'] == clock.now
+    assert cache.stats()['expirations'] == 1
+
+
+def test_map_id_cache_lru(clock):
+    cache = MapIdCache(max_size=2, clock=clock)
+    images = [FakeImage(name) for name in ('ndvi', 'classes', 'water')]
+    cache.get_map_id(images[0], None)
+    cache.get_map_id(images[1], None)
+    cache.get_map_id(images[0], None)
+    cache.get_map_id(images[2], None)
+    # classes was the least recently used map ID
+    cache.get_map_id(images[1], None)
+    assert [image.map_id_calls for image in images] == [1, 2, 1]
+    assert cache.stats()['size'] == 2
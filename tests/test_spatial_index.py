@@ -0,0 +1,158 @@
+import math
+
+import numpy as np
+import pytest
+
+import spatial_index
+from spatial_index import GridIndex, merge_geometries, oriented_ring, relate
+
+
+def polygon(*rings):
+    return {'type': 'Polygon', 'coordinates': [list(ring) + [ring[0]] for ring in rings]}
+
+
+def box(min_x, min_y, max_x, max_y):
+    return [(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)]
+
+
+def circle(center_x, center_y, radius, vertices):
+    angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    return list(zip(center_x + radius * np.cos(angles), center_y + radius * np.sin(angles)))
+
+
+# Rings of a Polygon geometry as merge_geometries orients them
+def spatial_polygon(geometry):
+    rings = geometry['coordinates']
+    return [oriented_ring(rings[0])] + [oriented_ring(hole, counterclockwise=False) for hole in rings[1:]]
+
+
+# Planar area (square degrees) of Polygon geometries, holes subtracted
+def planar_area(geometries):
+    total = 0.0
+    for geometry in geometries:
+        for index, ring in enumerate(geometry['coordinates']):
+            area = abs(spatial_index.signed_area(np.asarray(ring, dtype=float)[:-1]))
+            total += -area if index else area
+    return total
+
+
+def test_grid_index_pairs():
+    index = GridIndex([[0, 0, 1, 1], [0.5, 0.5, 2, 2], [5, 5, 6, 6], [1, 1, 1.5, 1.5]])
+    assert sorted(index.pairs()) == [(0, 1), (0, 3), (1, 3)]
+
+
+def test_single_polygon_is_returned_unchanged():
+    geometries = [polygon(box(0, 0, 1, 1))]
+    merged, report = merge_geometries(geometries)
+    assert merged is geometries
+    assert report['polygons_after'] == 1
+
+
+def test_duplicates_with_rotated_and_reversed_rings():
+    ring = box(0, 0, 1, 1)
+    geometries = [polygon(ring), polygon(ring[2:] + ring[:2]), polygon(ring[::-1]), polygon((ring[1:] + ring[:1])[::-1])]
+    merged, report = merge_geometries(geometries)
+    assert report['duplicates'] == 3
+    assert report['polygons_after'] == 1
+    assert planar_area(merged) == pytest.approx(1.0)
+    assert report['redundant_area'] > 0
+
+
+def test_nested_polygon_is_dropped():
+    merged, report = merge_geometries([polygon(box(0.2, 0.2, 0.5, 0.5)), polygon(box(0, 0, 1, 1))])
+    assert report['nested'] == 1
+    assert report['merged'] == 0
+    assert len(merged) == 1
+    assert planar_area(merged) == pytest.approx(1.0)
+
+
+def test_polygon_inside_a_hole_is_kept():
+    outer = polygon(box(0, 0, 3, 3), box(1, 1, 2, 2)[::-1])
+    island = polygon(box(1.2, 1.2, 1.8, 1.8))
+    assert relate(spatial_polygon(island), spatial_polygon(outer)) is None
+    merged, report = merge_geometries([outer, island])
+    assert merged == [outer, island]
+    assert report['polygons_after'] == 2
+
+
+def test_overlapping_squares_are_unioned():
+    merged, report = merge_geometries([polygon(box(0, 0, 2, 2)), polygon(box(1, 1, 3, 3))])
+    assert report['merged'] == 2
+    assert report['polygons_after'] == 1
+    assert len(merged[0]['coordinates']) == 1
+    # 8 corners of the union outline, closed
+    assert len(merged[0]['coordinates'][0]) == 9
+    assert planar_area(merged) == pytest.approx(7.0)
+
+
+def test_collinear_shared_edges_are_unioned():
+    # The rectangle shares part of the square's bottom edge and has a vertex on it (T-junction)
+    merged, report = merge_geometries([polygon(box(0, 0, 2, 2)), polygon(box(1, 0, 3, 1))])
+    assert report['merged'] == 2
+    assert len(merged) == 1
+    assert planar_area(merged) == pytest.approx(5.0)
+    assert len(merged[0]['coordinates'][0]) == 7
+
+
+def test_polygons_touching_along_an_edge_are_kept():
+    geometries = [polygon(box(0, 0, 1, 1)), polygon(box(1, 0, 2, 1))]
+    merged, report = merge_geometries(geometries)
+    assert merged is geometries
+    assert report['merged'] == 0
+
+
+def test_union_leaving_a_hole():
+    frame = [box(0, 0, 3, 1), box(0, 2, 3, 3), box(0, 0, 1, 3), box(2, 0, 3, 3)]
+    merged, report = merge_geometries([polygon(ring) for ring in frame])
+    assert report['merged'] == 4
+    assert len(merged) == 1
+    outer, *holes = merged[0]['coordinates']
+    assert len(holes) == 1
+    assert abs(spatial_index.signed_area(np.asarray(holes[0])[:-1])) == pytest.approx(1.0)
+    assert planar_area(merged) == pytest.approx(8.0)
+
+
+def test_overlap_and_duplicate_together():
+    geometries = [polygon(box(0, 0, 2, 2)), polygon(box(1, 1, 3, 3)), polygon(box(0, 0, 2, 2)[::-1])]
+    merged, report = merge_geometries(geometries)
+    assert report['duplicates'] == 1
+    assert report['merged'] == 2
+    assert planar_area(merged) == pytest.approx(7.0)
+
+
+def test_large_overlapping_circles():
+    merged, report = merge_geometries([polygon(circle(0, 0, 1, 5000)), polygon(circle(1, 0, 1, 5000))])
+    assert report['merged'] == 2
+    assert len(merged) == 1
+    # Two unit circles one radius apart
+    lens = 2 * math.acos(0.5) - 0.5 * math.sqrt(3)
+    assert planar_area(merged) == pytest.approx(2 * math.pi - lens, rel=1e-4)
+
+
+def test_union_above_vertex_budget_keeps_polygons(monkeypatch):
+    monkeypatch.setattr(spatial_index, 'MAX_UNION_VERTICES', 100)
+    geometries = [polygon(circle(0, 0, 1, 64)), polygon(circle(1, 0, 1, 64))]
+    merged, report = merge_geometries(geometries)
+    assert merged is geometries
+    assert report['merged'] == 0
+    assert report['overlaps_kept'] == 1
+
+
+def test_grid_of_overlapping_parcels():
+    # 20 x 20 parcels, each overlapping its neighbours by a digitizing sliver
+    geometries = [polygon(box(column, row, column + 1.01, row + 1.01)) for column in range(20) for row in range(20)]
+    merged, report = merge_geometries(geometries)
+    assert report['merged'] == 400
+    assert report['overlaps_kept'] == 0
+    assert len(merged) == 1
+    assert len(merged[0]['coordinates']) == 1
+    assert planar_area(merged) == pytest.approx(20.01 ** 2)
+
+
+def test_union_above_pair_budget_keeps_polygons(monkeypatch):
+    monkeypatch.setattr(spatial_index, 'MAX_UNION_PAIRS', 2)
+    geometries = [polygon(box(index, 0, index + 1.5, 1)) for index in range(4)]
+    merged, report = merge_geometries(geometries)
+    assert merged is geometries
+    assert report['merged'] == 0
+    assert report['overlaps_kept'] == 3
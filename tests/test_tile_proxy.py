@@ -0,0 +1,105 @@
+import threading
+import urllib.request
+
+import pytest
+
+import tile_proxy
+from map_cache import DEFAULT_TTL as MAP_ID_TTL
+from tile_proxy import TileCache, TileProxy, count_tiles, layer_key, prewarm, tiles_for_bbox
+
+LAYER_KEY = '0123456789abcdef'
+BBOX = [10.0, 36.0, 10.5, 36.5]
+
+
+# Upstream stand-in recording the requested URLs, failing the ones listed in failing
+class StubFetch:
+    def __init__(self, failing=()):
+        self.urls = []
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+
+    def __call__(self, url):
+        with self.lock:
+            self.urls.append(url)
+        if url in self.failing:
+            return 500, b'error', 'text/plain'
+        return 200, f'png {url}'.encode(), 'image/png'
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    proxy = TileProxy(TileCache(str(tmp_path), max_bytes=1024 * 1024), fetch=StubFetch())
+    proxy.register(LAYER_KEY, 'https://upstream/{z}/{x}/{y}')
+    return proxy
+
+
+def test_count_tiles_matches_tile_list():
+    zooms = range(2, 12)
+    assert count_tiles(BBOX, zooms) == sum(len(tiles_for_bbox(BBOX, zoom)) for zoom in zooms)
+    assert count_tiles(BBOX, [0]) == 1
+    # The whole world at zoom 3
+    assert count_tiles([-180, -85, 180, 85], [3]) == 64
+
+
+def test_tile_is_fetched_once_then_served_from_cache(proxy):
+    status, body, _, cache_status = proxy.tile(LAYER_KEY, 5, 17, 12)
+    assert (status, cache_status) == (200, 'MISS')
+    status, cached_body, _, cache_status = proxy.tile(LAYER_KEY, 5, 17, 12)
+    assert (status, cache_status, cached_body) == (200, 'HIT', body)
+    assert proxy.fetch.urls == ['https://upstream/5/17/12']
+
+
+def test_unknown_layer(proxy):
+    status, _, _, _ = proxy.tile('fedcba9876543210', 1, 0, 0)
+    assert status == 404
+    assert proxy.fetch.urls == []
+
+
+def test_prewarm_fetches_missing_tiles_only(proxy):
+    zooms = range(8, 11)
+    result = prewarm(proxy, LAYER_KEY, BBOX, zooms)
+    total = count_tiles(BBOX, zooms)
+    assert result == {'tiles': total, 'cached': 0, 'fetched': total, 'failed': 0}
+    assert len(proxy.fetch.urls) == total
+
+    result = prewarm(proxy, LAYER_KEY, BBOX, zooms)
+    assert result == {'tiles': total, 'cached': total, 'fetched': 0, 'failed': 0}
+    assert len(proxy.fetch.urls) == total
+
+
+def test_prewarm_counts_failed_tiles(proxy):
+    proxy.fetch.failing.add('https://upstream/8/135/100')
+    result = prewarm(proxy, LAYER_KEY, BBOX, [8])
+    assert result['failed'] == 1
+    assert not proxy.cache.contains(LAYER_KEY, 8, 135, 100)
+
+
+def test_prewarm_above_limit_fetches_nothing(proxy):
+    with pytest.raises(ValueError, match='tiles to pre-warm'):
+        prewarm(proxy, LAYER_KEY, BBOX, range(10, 19))
+    with pytest.raises(ValueError):
+        prewarm(proxy, LAYER_KEY, BBOX, range(8, 11), max_tiles=count_tiles(BBOX, range(8, 11)) - 1)
+    assert proxy.fetch.urls == []
+    assert count_tiles(BBOX, range(10, 19)) > tile_proxy.MAX_PREWARM_TILES
+
+
+def test_layer_key_follows_the_map_id():
+    map_id = {'key': 'a' * 64, 'mapid': 'projects/earthengine/maps/1', 'url_format': 'https://upstream/{z}/{x}/{y}'}
+    key = layer_key(map_id)
+    assert tile_proxy.TILE_PATH_RE.match(f'/tiles/{key}/1/0/0')
+    assert layer_key(dict(map_id)) == key
+    # A renewed map ID of the same product is another layer, its tiles are fetched again
+    assert layer_key({**map_id, 'mapid': 'projects/earthengine/maps/2'}) != key
+    assert layer_key({**map_id, 'key': 'b' * 64}) != key
+
+
+def test_tiles_are_cached_by_browsers_for_the_map_id_lifetime(tmp_path):
+    proxy = TileProxy(TileCache(str(tmp_path)), port=0, fetch=StubFetch())
+    proxy.register(LAYER_KEY, 'https://upstream/{z}/{x}/{y}')
+    proxy.start()
+    try:
+        with urllib.request.urlopen(proxy.url_template(LAYER_KEY).format(z=3, x=4, y=2)) as response:
+            assert response.read() == b'png https://upstream/3/4/2'
+            assert response.headers['Cache-Control'] == f'public, max-age={MAP_ID_TTL}'
+    finally:
+        proxy.stop()
@@ -0,0 +1,346 @@
+import hashlib
+import logging
+import math
+import os
+import re
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from map_cache import DEFAULT_TTL as MAP_ID_TTL
+
+logger = logging.getLogger(__name__)
+
+# Local tile proxy in front of the Earth Engine tile servers with an on-disk, size-capped LRU cache.
+# Enabled in the app with NDVI_TILE_PROXY=1, see proxy_from_environment() for the other settings.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ndvi-viewer', 'tiles')
+DEFAULT_CACHE_MB = 512
+DEFAULT_PORT = 8765
+# Layers are proxied under a key derived from their Earth Engine map ID (see layer_key()), which map_cache renews
+# after MAP_ID_TTL: a date window ending recently then gets the scenes ingested meanwhile. Browsers keep tiles
+# for as long as the map ID they came from.
+CACHE_MAX_AGE = MAP_ID_TTL
+UPSTREAM_TIMEOUT = 30
+PREWARM_WORKERS = 8
+# Most tiles one prewarm call fetches for a layer; a province at zoom 18 is about 500k tiles
+MAX_PREWARM_TILES = 20000
+
+TILE_PATH_RE = re.compile(r'^/tiles/([0-9a-f]{8,64})/(\d+)/(\d+)/(\d+)(?:\.png)?$')
+
+
+# Disk cache of tiles keyed by layer key and z/x/y, least recently used tiles are removed past max_bytes
+class TileCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    # Rebuild the LRU order from the files already on disk, oldest access first
+    def _load_index(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for file_name in files:
+                if not file_name.endswith('.png'):
+                    continue
+                path = os.path.join(root, file_name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._index[path] = size
+            self.size += size
+        self._evict()
+
+    def path(self, layer_key, z, x, y):
+        return os.path.join(self.directory, layer_key, str(z), str(x), f'{y}.png')
+
+    def get(self, layer_key, z, x, y):
+        path = self.path(layer_key, z, x, y)
+        with self._lock:
+            if path not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(path)
+            self.hits += 1
+        try:
+            with open(path, 'rb') as tile_file:
+                data = tile_file.read()
+            # The mtime keeps the LRU order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._index.pop(path, 0)
+            return None
+        return data
+
+    def contains(self, layer_key, z, x, y):
+        with self._lock:
+            return self.path(layer_key, z, x, y) in self._index
+
+    def put(self, layer_key, z, x, y, data):
+        path = self.path(layer_key, z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a reader never sees a partial tile
+        temporary_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as tile_file:
+            tile_file.write(data)
+        os.replace(temporary_path, path)
+        with self._lock:
+            self.size += len(data) - self._index.pop(path, 0)
+            self._index[path] = len(data)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._index:
+            path, size = self._index.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tiles': len(self._index),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+# Default upstream fetch, returns (status, body, content type)
+def fetch_url(url, timeout=UPSTREAM_TIMEOUT):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read(), response.headers.get('Content-Type', 'image/png')
+    except urllib.error.HTTPError as error:
+        return error.code, error.read(), error.headers.get('Content-Type', 'text/plain')
+
+
+# Proxy key of a layer: its map ID cache key (product inputs and vis params) and the Earth Engine map ID itself,
+# so the tiles of a renewed map ID are fetched again instead of being served from the cache
+def layer_key(map_id):
+    return hashlib.sha256(f"{map_id['key']}:{map_id['mapid']}".encode('utf-8')).hexdigest()[:32]
+
+
+# Serves /tiles/<layer key>/<z>/<x>/<y> from the cache, fetching misses from the registered upstream URL
+class TileProxy:
+    def __init__(self, cache, host='127.0.0.1', port=DEFAULT_PORT, public_url=None, fetch=fetch_url):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.fetch = fetch
+        self.layers = {}
+        self._lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    # Remember the upstream {z}/{x}/{y} template of a layer, e.g. an Earth Engine tile_fetcher.url_format
+    def register(self, layer_key, url_format):
+        with self._lock:
+            self.layers[layer_key] = url_format
+
+    def url_template(self, layer_key):
+        base = self.public_url or f'http://{self.host}:{self.port}'
+        return f"{base.rstrip('/')}/tiles/{layer_key}/{{z}}/{{x}}/{{y}}"
+
+    # Returns (status, body, content type, cache status)
+    def tile(self, layer_key, z, x, y):
+        data = self.cache.get(layer_key, z, x, y)
+        if data is not None:
+            return 200, data, 'image/png', 'HIT'
+
+        with self._lock:
+            url_format = self.layers.get(layer_key)
+        if url_format is None:
+            return 404, b'unknown layer', 'text/plain', 'MISS'
+
+        status, body, content_type = self.fetch(url_format.format(z=z, x=x, y=y))
+        if status == 200:
+            self.cache.put(layer_key, z, x, y, body)
+        return status, body, content_type, 'MISS'
+
+    def start(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                match = TILE_PATH_RE.match(self.path.split('?')[0])
+                if match is None:
+                    self.send_error(404)
+                    return
+                layer_key, z, x, y = match.group(1), *(int(value) for value in match.groups()[1:])
+                etag = '"{}"'.format(hashlib.sha1(f'{layer_key}/{z}/{x}/{y}'.encode()).hexdigest())
+                if self.headers.get('If-None-Match') == etag and proxy.cache.contains(layer_key, z, x, y):
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+
+                try:
+                    status, body, content_type, cache_status = proxy.tile(layer_key, z, x, y)
+                except OSError as error:
+                    logger.warning("upstream tile %s/%s/%s/%s failed: %s", layer_key, z, x, y, error)
+                    self.send_error(502)
+                    return
+
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Access-Control-Allow-Origin', '*')
+                self.send_header('X-Cache', cache_status)
+                if status == 200:
+                    self.send_header('Cache-Control', f'public, max-age={CACHE_MAX_AGE}')
+                    self.send_header('ETag', etag)
+                else:
+                    self.send_header('Cache-Control', 'no-store')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format, *args)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        # Port 0 picks a free port
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='tile-proxy', daemon=True)
+        self.thread.start()
+        logger.info("tile proxy listening on %s:%s, cache in %s", self.host, self.port, self.cache.directory)
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+# Web Mercator tile columns and rows covering a [min_lon, min_lat, max_lon, max_lat] bbox, as two ranges
+def tile_ranges(bbox, zoom):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    count = 2 ** zoom
+
+    def tile_x(lon):
+        return min(count - 1, max(0, int((lon + 180) / 360 * count)))
+
+    def tile_y(lat):
+        lat = math.radians(max(-85.0511, min(85.0511, lat)))
+        return min(count - 1, max(0, int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * count)))
+
+    return range(tile_x(min_lon), tile_x(max_lon) + 1), range(tile_y(max_lat), tile_y(min_lat) + 1)
+
+
+# Web Mercator tiles (z, x, y) covering a bbox
+def tiles_for_bbox(bbox, zoom):
+    columns, rows = tile_ranges(bbox, zoom)
+    return [(zoom, x, y) for x in columns for y in rows]
+
+
+# Number of tiles covering a bbox over a range of zoom levels, without listing them
+def count_tiles(bbox, zooms):
+    return sum(len(columns) * len(rows) for columns, rows in (tile_ranges(bbox, zoom) for zoom in zooms))
+
+
+# Fetch every tile of a layer covering the bbox for a range of zoom levels into the cache.
+# More than max_tiles tiles raise a ValueError before anything is fetched.
+def prewarm(proxy, layer_key, bbox, zooms, workers=PREWARM_WORKERS, max_tiles=MAX_PREWARM_TILES):
+    total = count_tiles(bbox, zooms)
+    if total > max_tiles:
+        raise ValueError(f"{total:,} tiles to pre-warm, above the limit of {max_tiles:,}: use fewer or lower zoom levels")
+    tiles = [tile for zoom in zooms for tile in tiles_for_bbox(bbox, zoom)]
+    missing = [tile for tile in tiles if not proxy.cache.contains(layer_key, *tile)]
+
+    def warm(tile):
+        status, _, _, _ = proxy.tile(layer_key, *tile)
+        return status == 200
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        fetched = sum(executor.map(warm, missing))
+    return {'tiles': len(tiles), 'cached': len(tiles) - len(missing), 'fetched': fetched, 'failed': len(missing) - fetched}
+
+
+# Process-wide proxy configured from the environment, None when the proxy is disabled
+_proxy = None
+_proxy_lock = threading.Lock()
+
+
+def proxy_from_environment():
+    global _proxy
+    if os.environ.get('NDVI_TILE_PROXY', '').lower() not in ('1', 'true', 'yes'):
+        return None
+    with _proxy_lock:
+        if _proxy is None:
+            cache = TileCache(
+                os.environ.get('NDVI_TILE_CACHE_DIR', DEFAULT_CACHE_DIR),
+                int(os.environ.get('NDVI_TILE_CACHE_MB', DEFAULT_CACHE_MB)) * 1024 * 1024,
+            )
+            _proxy = TileProxy(
+                cache,
+                host=os.environ.get('NDVI_TILE_PROXY_HOST', '127.0.0.1'),
+                port=int(os.environ.get('NDVI_TILE_PROXY_PORT', DEFAULT_PORT)),
+                # Address the browsers use when the proxy sits behind a reverse proxy
+                public_url=os.environ.get('NDVI_TILE_PROXY_PUBLIC_URL'),
+            ).start()
+    return _proxy
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Tile proxy with a disk cache, and pre-warming of a layer over a bbox")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_MB)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help="run the proxy in the foreground")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=DEFAULT_PORT)
+    serve.add_argument('--layer', nargs=2, action='append', default=[], metavar=('KEY', 'URL_FORMAT'),
+                       help="register a layer key and its upstream {z}/{x}/{y} URL template")
+
+    warm = subparsers.add_parser('prewarm', help="fetch all tiles of a layer covering a bbox")
+    warm.add_argument('--layer-key', required=True)
+    warm.add_argument('--url-format', required=True, help="upstream {z}/{x}/{y} URL template")
+    warm.add_argument('--bbox', type=float, nargs=4, required=True, metavar=('MIN_LON', 'MIN_LAT', 'MAX_LON', 'MAX_LAT'))
+    warm.add_argument('--zooms', type=int, nargs=2, default=(8, 14), metavar=('MIN', 'MAX'))
+    warm.add_argument('--workers', type=int, default=PREWARM_WORKERS)
+    warm.add_argument('--max-tiles', type=int, default=MAX_PREWARM_TILES, help="refuse to fetch more tiles than this")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    cache = TileCache(args.cache_dir, args.cache_mb * 1024 * 1024)
+    if args.command == 'serve':
+        proxy = TileProxy(cache, args.host, args.port)
+        for layer_key, url_format in args.layer:
+            proxy.register(layer_key, url_format)
+        proxy.start()
+        proxy.thread.join()
+    else:
+        proxy = TileProxy(cache)
+        proxy.register(args.layer_key, args.url_format)
+        try:
+            result = prewarm(proxy, args.layer_key, args.bbox, range(args.zooms[0], args.zooms[1] + 1), args.workers,
+                             args.max_tiles)
+        except ValueError as error:
+            parser.error(str(error))
+        print(json.dumps({**result, 'cache': cache.stats()}))
+
+
+if __name__ == '__main__':
+    main()
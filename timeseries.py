@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+import ee
+
+# Percentiles reported for every window besides the mean and median
+SERIES_PERCENTILES = (10, 25, 75, 90)
+# Reduction scale in meters (Sentinel-2 B4/B8 resolution)
+SERIES_SCALE = 10
+SERIES_COLUMNS = ['start', 'end', 'images', 'pixels', 'mean', 'median'] + [f'p{p}' for p in SERIES_PERCENTILES]
+
+
+# Consecutive [start, end) windows of window_days covering the span, dates as 'YYYY-MM-DD' strings
+def time_windows(start_date, end_date, window_days):
+    if window_days < 1:
+        raise ValueError("window size must be at least one day")
+    windows = []
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + timedelta(days=window_days), end_date)
+        windows.append((window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        window_start = window_end
+    return windows
+
+
+# NDVI statistics of every window in a single getInfo call
+def ndvi_time_series(aoi, start_date, end_date, window_days, cloud_rate, scale=SERIES_SCALE):
+    windows = time_windows(start_date, end_date, window_days)
+    if not windows:
+        return []
+
+    # The collection is filtered once for the whole span, windows only narrow it down server-side
+    collection = ee.ImageCollection('COPERNICUS/S2_SR_HARMONIZED') \
+        .filter(ee.Filter.lt("CLOUDY_PIXEL_PERCENTAGE", cloud_rate)) \
+        .filterDate(windows[0][0], windows[-1][1]) \
+        .filterBounds(aoi) \
+        .select(['B4', 'B8'])
+
+    reducer = ee.Reducer.mean() \
+        .combine(reducer2=ee.Reducer.median(), sharedInputs=True) \
+        .combine(reducer2=ee.Reducer.percentile(list(SERIES_PERCENTILES)), sharedInputs=True) \
+        .combine(reducer2=ee.Reducer.count(), sharedInputs=True)
+
+    def window_statistics(window):
+        window = ee.List(window)
+        window_collection = collection.filterDate(window.get(0), window.get(1))
+        image_count = window_collection.size()
+        properties = ee.Dictionary({'start': window.get(0), 'end': window.get(1), 'images': image_count})
+
+        # Median composite, NDVI and water mask, the same as the map layers
+        ndvi = window_collection.median().normalizedDifference(['B8', 'B4']).rename('ndvi')
+        ndvi = ndvi.updateMask(ndvi.gte(0))
+        statistics = ndvi.reduceRegion(reducer=reducer, geometry=aoi, scale=scale, maxPixels=1e13, tileScale=4)
+
+        # Windows without any image have no bands to reduce
+        return ee.Feature(None, ee.Algorithms.If(
+            image_count.gt(0),
+            properties.combine(statistics),
+            properties,
+        ))
+
+    features = ee.FeatureCollection(ee.List([list(window) for window in windows]).map(window_statistics))
+    return series_rows(features.getInfo())
+
+
+# Flatten the FeatureCollection returned by getInfo into table rows
+def series_rows(feature_collection):
+    rows = []
+    for feature in feature_collection.get('features', []):
+        properties = feature.get('properties', {})
+        row = {
+            'start': properties.get('start'),
+            'end': properties.get('end'),
+            'images': properties.get('images', 0),
+            'pixels': properties.get('ndvi_count'),
+            'mean': properties.get('ndvi_mean'),
+            'median': properties.get('ndvi_median'),
+        }
+        for percentile in SERIES_PERCENTILES:
+            row[f'p{percentile}'] = properties.get(f'ndvi_p{percentile}')
+        rows.append(row)
+    return rows
@@ -0,0 +1,270 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Lightweight tracing of the app's hot path: spans around the stages of a rerun (GeoJSON parsing, collection
+# building, getMapId, folium HTML...) and counters around every Earth Engine round trip. Each rerun has its
+# own Trace; process-wide totals are kept for the Prometheus metrics file.
+
+# Earth Engine client functions that make a server round trip
+EE_CALLS = ('computeValue', 'getMapId', 'computePixels', 'computeImages', 'computeFeatures', 'getDownloadId', 'getThumbId')
+
+_current = contextvars.ContextVar('ndvi_trace', default=None)
+
+
+# Spans and Earth Engine calls of one rerun
+class Trace:
+    def __init__(self, name='rerun', measure_payload=False):
+        self.name = name
+        # Request payloads are measured by serializing the expression again, only done when asked for
+        self.measure_payload = measure_payload
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.ee_calls = {}
+        self._lock = threading.Lock()
+
+    def add_span(self, name, started, seconds, error=None):
+        with self._lock:
+            self.spans.append({
+                'name': name,
+                'start': round(started - self._started, 6),
+                'seconds': round(seconds, 6),
+                'thread': threading.current_thread().name,
+                'error': error,
+            })
+
+    def add_ee_call(self, call, seconds, request_bytes, response_bytes, error=None):
+        with self._lock:
+            counters = self.ee_calls.setdefault(call, {'count': 0, 'seconds': 0.0, 'request_bytes': 0, 'response_bytes': 0, 'errors': 0})
+            counters['count'] += 1
+            counters['seconds'] += seconds
+            counters['request_bytes'] += request_bytes
+            counters['response_bytes'] += response_bytes
+            counters['errors'] += error is not None
+
+    # Spans grouped by name: count and total seconds, in order of first appearance
+    def span_totals(self):
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                total = totals.setdefault(span['name'], {'count': 0, 'seconds': 0.0})
+                total['count'] += 1
+                total['seconds'] += span['seconds']
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'name': self.name,
+                'time': self.started_at,
+                'seconds': self.seconds,
+                'spans': list(self.spans),
+                'ee_calls': {call: dict(counters) for call, counters in self.ee_calls.items()},
+            }
+
+
+# Process-wide totals exported as Prometheus metrics
+_totals_lock = threading.Lock()
+totals = {
+    'reruns': 0,
+    'rerun_seconds': 0.0,
+    'last_rerun_seconds': 0.0,
+    'spans': {},
+    'ee_calls': {},
+}
+
+
+def current():
+    return _current.get()
+
+
+def start_trace(name='rerun', measure_payload=False):
+    trace = Trace(name, measure_payload)
+    _current.set(trace)
+    return trace
+
+
+@contextmanager
+def span(name):
+    trace = _current.get()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as exception:
+        error = type(exception).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        if trace is not None:
+            trace.add_span(name, started, seconds, error)
+        with _totals_lock:
+            total = totals['spans'].setdefault(name, {'count': 0, 'seconds': 0.0})
+            total['count'] += 1
+            total['seconds'] += seconds
+
+
+# Run function in worker threads with the trace of the calling thread (thread pools do not copy the context)
+def bind(function):
+    trace = _current.get()
+
+    @functools.wraps(function)
+    def bound(*args, **kwargs):
+        token = _current.set(trace)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+def _request_bytes(args, kwargs):
+    request = args[0] if args else next(iter(kwargs.values()), None)
+    if isinstance(request, dict):
+        request = request.get('image', request.get('expression', request))
+    if hasattr(request, 'serialize'):
+        return len(request.serialize())
+    try:
+        return len(json.dumps(request, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _response_bytes(response):
+    if hasattr(response, 'nbytes'):
+        return int(response.nbytes)
+    if isinstance(response, (bytes, str)):
+        return len(response)
+    try:
+        return len(json.dumps(response, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _traced_call(call, function):
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        trace = _current.get()
+        started = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = function(*args, **kwargs)
+            return response
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            measure = trace is not None and trace.measure_payload
+            request_bytes = _request_bytes(args, kwargs) if measure else 0
+            response_bytes = _response_bytes(response) if measure and response is not None else 0
+            if trace is not None:
+                trace.add_ee_call(call, seconds, request_bytes, response_bytes, error)
+            with _totals_lock:
+                counters = totals['ee_calls'].setdefault(call, {'count': 0, 'seconds': 0.0, 'request_bytes': 0, 'response_bytes': 0, 'errors': 0})
+                counters['count'] += 1
+                counters['seconds'] += seconds
+                counters['request_bytes'] += request_bytes
+                counters['response_bytes'] += response_bytes
+                counters['errors'] += error is not None
+    traced._ndvi_traced = True
+    return traced
+
+
+# Wrap the round-trip functions of ee.data once per process; getInfo and getMapId go through them
+def instrument_ee(ee_module):
+    data = getattr(ee_module, 'data', None)
+    for call in EE_CALLS:
+        function = getattr(data, call, None)
+        if function is not None and not getattr(function, '_ndvi_traced', False):
+            setattr(data, call, _traced_call(call, function))
+
+
+# File outputs, enabled by environment variables
+def trace_log_path():
+    return os.environ.get('NDVI_TRACE_LOG')
+
+
+def metrics_path():
+    return os.environ.get('NDVI_METRICS_FILE')
+
+
+def outputs_enabled():
+    return bool(trace_log_path() or metrics_path())
+
+
+def write_trace_log(path, trace):
+    with open(path, 'a') as log_file:
+        log_file.write(json.dumps(trace.to_dict(), default=str) + '\n')
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process totals in the Prometheus text exposition format
+def prometheus_metrics():
+    with _totals_lock:
+        lines = [
+            '# HELP ndvi_reruns_total Streamlit reruns traced.',
+            '# TYPE ndvi_reruns_total counter',
+            f"ndvi_reruns_total {totals['reruns']}",
+            '# HELP ndvi_rerun_seconds_total Time spent in traced reruns.',
+            '# TYPE ndvi_rerun_seconds_total counter',
+            f"ndvi_rerun_seconds_total {totals['rerun_seconds']:.6f}",
+            '# HELP ndvi_last_rerun_seconds Duration of the last traced rerun.',
+            '# TYPE ndvi_last_rerun_seconds gauge',
+            f"ndvi_last_rerun_seconds {totals['last_rerun_seconds']:.6f}",
+            '# HELP ndvi_span_seconds_total Time spent in each traced stage.',
+            '# TYPE ndvi_span_seconds_total counter',
+        ]
+        lines += [f'ndvi_span_seconds_total{{span="{_label(name)}"}} {total["seconds"]:.6f}' for name, total in totals['spans'].items()]
+        lines += ['# HELP ndvi_span_calls_total Executions of each traced stage.', '# TYPE ndvi_span_calls_total counter']
+        lines += [f'ndvi_span_calls_total{{span="{_label(name)}"}} {total["count"]}' for name, total in totals['spans'].items()]
+        for metric, field, help_text in (
+            ('ndvi_ee_calls_total', 'count', 'Earth Engine round trips.'),
+            ('ndvi_ee_call_seconds_total', 'seconds', 'Time spent waiting on Earth Engine.'),
+            ('ndvi_ee_request_bytes_total', 'request_bytes', 'Serialized request payload sent to Earth Engine (when measured).'),
+            ('ndvi_ee_response_bytes_total', 'response_bytes', 'Response payload received from Earth Engine (when measured).'),
+            ('ndvi_ee_errors_total', 'errors', 'Earth Engine calls that raised.'),
+        ):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for call, counters in totals['ee_calls'].items():
+                value = counters[field]
+                lines.append(f'{metric}{{call="{_label(call)}"}} {value:.6f}' if isinstance(value, float) else f'{metric}{{call="{_label(call)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path):
+    # Write then rename so the scraper never reads a partial file
+    temporary_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temporary_path, 'w') as metrics_file:
+        metrics_file.write(prometheus_metrics())
+    os.replace(temporary_path, path)
+
+
+# End a rerun's trace: update the process totals and write the JSON-lines log and the metrics file if enabled
+def finish_trace(trace):
+    trace.seconds = time.perf_counter() - trace._started
+    with _totals_lock:
+        totals['reruns'] += 1
+        totals['rerun_seconds'] += trace.seconds
+        totals['last_rerun_seconds'] = trace.seconds
+    try:
+        if trace_log_path():
+            write_trace_log(trace_log_path(), trace)
+        if metrics_path():
+            write_metrics(metrics_path())
+    except OSError as error:
+        logger.warning("trace outputs not written: %s", error)
+    return trace